@@ -1,17 +1,30 @@
 import os
-import logging
+import json
 import requests
 from dotenv import load_dotenv
 
-from flask import Flask, abort, current_app, request, make_response, jsonify
+from flask import Flask, Response, abort, current_app, request, make_response, jsonify, stream_with_context
 from sqlalchemy.exc import SQLAlchemyError
 from werkzeug.exceptions import HTTPException
 from db.queries import *
-from db.connection import get_db_session
-from helpers.collaborator_helper import handle_collaborator_upsert
+from db.connection import engine, get_db_session
+from helpers.collaborator_helper import handle_collaborator_upsert, handle_collaborators_batch
 from utils.tls import get_p12_data, delete_temp_files
-from helpers.note_helper import handle_note_upsert, insert_new_note
+from common.logging_pipeline import logging_stats, setup_logging, stop_logging
+from utils.metrics import instrument_app, registry
+from db.instrumentation import pool_stats
+from helpers.user_helper import handle_pub_keys_lookup
+from helpers.note_helper import handle_note_upsert, handle_notes_batch_backup, insert_new_note
 from utils.tls import get_p12_data
+from db.retention import RETENTION_INTERVAL, RetentionWorker
+from utils.http_cache import (IMMUTABLE_CACHE_CONTROL, REVALIDATE_CACHE_CONTROL, is_not_modified,
+                              listing_etag, make_etag, not_modified, note_version_etag, set_cache_headers)
+from utils.passwords import password_verifier
+from utils.user_cache import USER_CACHE_TTL, get_user_identity, user_cache
+from utils.events import EVENT_STREAM_MIMETYPE, event_hub, generate_events, parse_stream_seconds
+from utils.codec import encode_binary_fields, make_body_response, parse_body, response_mimetype
+from utils.pagination import (NDJSON_MIMETYPE, encode_cursor, is_paged_request, parse_changes_args, parse_page_args,
+                              parse_fields_arg, parse_role_arg, parse_version_range_args, wants_ndjson)
 from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
 
 load_dotenv()
@@ -25,6 +38,16 @@ app.config['JSON_SORT_KEYS'] = False
 app.config['JWT_SECRET_KEY'] = os.getenv("JWT_SECRET_KEY")
 jwt = JWTManager(app)
 
+instrument_app(app)
+registry.add_stats_source("user_cache", user_cache.stats)
+registry.add_stats_source("password", password_verifier.stats)
+registry.add_stats_source("logging", logging_stats)
+registry.add_stats_source("events", event_hub.stats)
+registry.add_stats_source("db_pool", lambda: pool_stats(engine))
+
+# Public keys are not secret, but can change, so clients revalidate after the user cache TTL
+PUB_KEY_CACHE_CONTROL = f"public, max-age={USER_CACHE_TTL}"
+
 @app.route('/login', methods=['POST'])
 def login():
     app.logger.info(f"Received login req from client: {request.remote_addr}")
@@ -35,16 +58,33 @@ def login():
             user = get_user_by_username(session, data['username'])
             app.logger.info(f"Logging in user {data['username']}")
 
-            if not user or not user.password_hash == data['password']:
+            if not user:
                 app.logger.error("Invalid credentials")
                 return jsonify({'message': 'Invalid credentials'}), 406
 
+            user_id, username, stored_hash = user.id, user.username, user.password_hash
+            # Give the connection back to the pool while the password is being hashed
+            session.rollback()
+
+            matches, new_hash = password_verifier.verify(stored_hash, data['password'], app.logger)
+            if not matches:
+                app.logger.error("Invalid credentials")
+                return jsonify({'message': 'Invalid credentials'}), 406
+
+            if new_hash is not None:
+                app.logger.info("Upgrading stored password hash")
+                update_password_hash(session, user_id, stored_hash, new_hash)
+                session.commit()
+
             # Create JWT token
             app.logger.info("User authenticated")
-            token = create_access_token(identity=user.username)
+            token = create_access_token(identity=username)
             
-            app.logger.info(f"Token generated: {token}")
+            app.logger.info("Token generated")
             return jsonify({'token': token}), 200
+    except HTTPException as e:
+        app.logger.error(f"HTTP error: {str(e)}")
+        return make_response({"error": e.description}, e.code)
     except Exception as e:
         app.logger.error(f"login: {str(e)}")
         return make_response("Internal Server Error", 500)
@@ -55,29 +95,147 @@ def get_user_notes(username):
     
     try:
         with next(get_db_session()) as session:
-            user = get_user_by_username(session, username)
+            user = get_user_identity(session, username)
             if not user:
                 abort(404, description="User not found")
+
+            summary = parse_fields_arg(request.args)
+            streamed = wants_ndjson(request)
+            mimetype = NDJSON_MIMETYPE if streamed else response_mimetype(request)
+            etag = listing_etag(fetch_listing_revision(session, user.id), request.query_string, mimetype)
+            if is_not_modified(request, etag):
+                app.logger.info(f"Notes for user {username} not modified")
+                return not_modified(etag, REVALIDATE_CACHE_CONTROL)
+
+            if streamed:
+                role = parse_role_arg(request.args)
+                app.logger.info(f"Streaming notes for user {username}")
+                response = Response(stream_with_context(generate_notes_ndjson(user.id, role, summary)), mimetype=NDJSON_MIMETYPE)
+                response.vary.add('Accept')
+                return set_cache_headers(response, etag, REVALIDATE_CACHE_CONTROL)
+
+            if is_paged_request(request.args):
+                after_note_id, limit, role = parse_page_args(request.args)
+                notes, last_note_id = fetch_notes_page_for_user(session, user.id, after_note_id, limit, role, summary)
+                app.logger.info(f"Fetched page of {len(notes)} notes for user {username}")
+                response = make_body_response(request, {
+                    "notes": notes,
+                    "next_cursor": encode_cursor(last_note_id) if last_note_id is not None else None
+                })
+                return set_cache_headers(response, etag, REVALIDATE_CACHE_CONTROL)
                 
-            user_notes = fetch_notes_for_user(session, user.id)
-            app.logger.info(f"Notes fetched for user {username}: {user_notes}")
-            app.logger.info(f"Notes fetched successfully")
-            return jsonify(user_notes), 200
+            user_notes = fetch_notes_for_user(session, user.id, parse_role_arg(request.args), summary)
+            app.logger.info(f"Notes fetched for user {username}: {sum(len(notes) for notes in user_notes.values())} notes")
+            return set_cache_headers(make_body_response(request, user_notes), etag, REVALIDATE_CACHE_CONTROL)
+    except HTTPException as e:
+        app.logger.error(f"HTTP error: {str(e)}")
+        return make_response({"error": e.description}, e.code)
     except Exception as e:
         app.logger.error(f"get_user_notes: Error fetching notes for user {username}: {e}")
         return make_response("Internal Server Error", 500)
 
+def generate_notes_ndjson(user_id: int, role: str, summary: bool = False):
+    """Stream one JSON document per note. Owns its db session since it outlives the view."""
+    with next(get_db_session()) as session:
+        for note in stream_notes_for_user(session, user_id, role, summary=summary):
+            yield json.dumps(encode_binary_fields(note)) + "\n"
+
+@app.route('/users/<username>/changes', methods=['GET'])
+def get_user_changes(username):
+    app.logger.info(f"Received user changes req from client: {request.remote_addr}")
+    try:
+        since, limit = parse_changes_args(request.args)
+
+        with next(get_db_session()) as session:
+            user = get_user_identity(session, username)
+            if not user:
+                abort(404, description="User not found")
+
+            changes = fetch_changes_for_user(session, user.id, since, limit + 1)
+
+        has_more = len(changes) > limit
+        changes = changes[:limit]
+        app.logger.info(f"Fetched {len(changes)} changes after {since} for user {username}")
+        return make_body_response(request, {
+            "changes": changes,
+            "next_since": changes[-1]["seq"] if changes else since,
+            "has_more": has_more
+        })
+    except HTTPException as e:
+        app.logger.error(f"HTTP error: {str(e)}")
+        return make_response({"error": e.description}, e.code)
+    except Exception as e:
+        app.logger.error(f"get_user_changes: Error fetching changes for user {username}: {e}")
+        return make_response("Internal Server Error", 500)
+
+@app.route('/users/<username>/events', methods=['GET'])
+def get_user_events(username):
+    app.logger.info(f"Received user events req from client: {request.remote_addr}")
+    try:
+        stream_seconds = parse_stream_seconds(request.args)
+
+        with next(get_db_session()) as session:
+            user = get_user_identity(session, username)
+            if not user:
+                abort(404, description="User not found")
+
+            titles = fetch_note_titles_for_user(session, user.id)
+
+        subscription = event_hub.subscribe(user.id, titles)
+        app.logger.info(f"Streaming events of {len(titles)} notes for user {username}")
+        response = Response(stream_with_context(generate_events(subscription, resolve_note_titles, stream_seconds)),
+                            mimetype=EVENT_STREAM_MIMETYPE)
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'
+        # The generator only cleans up once started, a client can leave before that
+        response.call_on_close(lambda: event_hub.unsubscribe(subscription))
+        return response
+    except HTTPException as e:
+        app.logger.error(f"HTTP error: {str(e)}")
+        return make_response({"error": e.description}, e.code)
+    except Exception as e:
+        app.logger.error(f"get_user_events: Error streaming events for user {username}: {e}")
+        return make_response("Internal Server Error", 500)
+
+def resolve_note_titles(note_ids: list) -> dict:
+    """Titles of notes shared with a subscriber after it connected. Owns its db session like the stream."""
+    with next(get_db_session()) as session:
+        return fetch_note_titles(session, note_ids)
+
 @app.route('/users/<username>/pub_key', methods=['GET'])
 def get_user_pub_key(username):
     app.logger.info(f"Received user public key req from client: {request.remote_addr}")
     try:
         with next(get_db_session()) as session:
-            user = get_user_by_username(session, username)
+            user = get_user_identity(session, username)
             if not user:
                 abort(404, description="User not found")
                 
-            app.logger.info(f"User found: {user}")
-            return make_response({"pub_key": user.public_key}, 200)
+        app.logger.info(f"User found: {username}")
+        etag = make_etag("pub-key", user.username, user.public_key)
+        if is_not_modified(request, etag):
+            return not_modified(etag, PUB_KEY_CACHE_CONTROL)
+
+        return set_cache_headers(make_response({"pub_key": user.public_key}, 200), etag, PUB_KEY_CACHE_CONTROL)
+    except HTTPException as e:
+        app.logger.error(f"HTTP error: {str(e)}")
+        return make_response({"error": e.description}, e.code)
+    except Exception as e:
+        app.logger.error(f"Internal server error: {str(e)}")
+        return make_response({"error": str(e)}, 500)
+
+@app.route('/users/pub_keys', methods=['POST'])
+def get_users_pub_keys():
+    app.logger.info(f"Received batch public key req from client: {request.remote_addr}")
+    try:
+        request_data = parse_body(request)
+        with next(get_db_session()) as session:
+            result = handle_pub_keys_lookup(session, request_data, app.logger)
+
+        return make_body_response(request, result)
+    except HTTPException as e:
+        app.logger.error(f"HTTP error: {str(e)}")
+        return make_response({"error": e.description}, e.code)
     except Exception as e:
         app.logger.error(f"Internal server error: {str(e)}")
         return make_response({"error": str(e)}, 500)
@@ -86,32 +244,94 @@ def get_user_pub_key(username):
 def get_user_note_version(username, note_title, version):
     app.logger.info(f"Received user note version retrieve req from client: {username}@{request.remote_addr}")
     try:
+        if not version.isdigit():
+            abort(400, description="Invalid version")
+
         with next(get_db_session()) as session:
-            user = get_user_by_username(session, username)
+            user = get_user_identity(session, username)
             if not user:
                 abort(404, description="User not found")
+
+            etag = note_version_etag(note_title, version, response_mimetype(request))
+            if request.if_none_match and is_not_modified(request, etag):
+                # Only answer 304 to collaborators, checked without reading the ciphertext
+                if not fetch_note_version_ref(session, user.id, note_title, version):
+                    abort(404, description="Note not found")
+
+                app.logger.info(f"Note {note_title} version {version} not modified")
+                return not_modified(etag, IMMUTABLE_CACHE_CONTROL)
                 
             note = fetch_specific_note_version(session, user.id, note_title, version)
             if not note:
                 abort(404, description="Note not found")
                 
             app.logger.info(f"Note fetched successfully")
-            return jsonify(note), 200
+            return set_cache_headers(make_body_response(request, note), etag, IMMUTABLE_CACHE_CONTROL)
+    except HTTPException as e:
+        app.logger.error(f"HTTP error: {str(e)}")
+        return make_response({"error": e.description}, e.code)
     except Exception as e:
         app.logger.error(f"Error fetching note {note_title} for user {username}: {e}")
         return make_response({"error": str(e)}, 500)
     
+@app.route('/users/<username>/notes/<note_title>/history', methods=['GET'])
+def get_user_note_history(username, note_title):
+    app.logger.info(f"Received user note history req from client: {username}@{request.remote_addr}")
+    try:
+        with next(get_db_session()) as session:
+            user = get_user_identity(session, username)
+            if not user:
+                abort(404, description="User not found")
+
+            history = fetch_note_history(session, user.id, note_title)
+            if not history:
+                abort(404, description="Note not found")
+
+        app.logger.info(f"Fetched {len(history['versions'])} versions of note {note_title} for user {username}")
+        return make_body_response(request, history)
+    except HTTPException as e:
+        app.logger.error(f"HTTP error: {str(e)}")
+        return make_response({"error": e.description}, e.code)
+    except Exception as e:
+        app.logger.error(f"Error fetching history of note {note_title} for user {username}: {e}")
+        return make_response({"error": str(e)}, 500)
+
+@app.route('/users/<username>/notes/<note_title>/versions', methods=['GET'])
+def get_user_note_versions(username, note_title):
+    app.logger.info(f"Received user note versions req from client: {username}@{request.remote_addr}")
+    try:
+        first, last = parse_version_range_args(request.args)
+
+        with next(get_db_session()) as session:
+            user = get_user_identity(session, username)
+            if not user:
+                abort(404, description="User not found")
+
+            versions = fetch_note_version_range(session, user.id, note_title, first, last)
+            if not versions:
+                abort(404, description="Note not found")
+
+        app.logger.info(f"Fetched {len(versions['versions'])} versions of note {note_title} for user {username}")
+        return make_body_response(request, versions)
+    except HTTPException as e:
+        app.logger.error(f"HTTP error: {str(e)}")
+        return make_response({"error": e.description}, e.code)
+    except Exception as e:
+        app.logger.error(f"Error fetching versions {request.args.get('from')}-{request.args.get('to')} of note {note_title} for user {username}: {e}")
+        return make_response({"error": str(e)}, 500)
+
 @app.route('/users/<username>/add_collaborator', methods=['POST'])
 def add_collaborator(username):
     app.logger.info(f"Received add collaborator req from client: {username}@{request.remote_addr}")
     try:
-        if request.json is None:
+        request_data = parse_body(request)
+        if request_data is None:
             app.logger.error("Invalid input: No JSON data received")
             abort(400, description="Invalid input: No JSON data received")
          
         with next(get_db_session()) as dbsession:
             try:
-                handle_collaborator_upsert(dbsession, username, request.json, app.logger)
+                handle_collaborator_upsert(dbsession, username, request_data, app.logger)
                 dbsession.commit()
             except SQLAlchemyError:
                 app.logger.error("An error occurred, rolling back changes.")
@@ -129,12 +349,43 @@ def add_collaborator(username):
         return make_response("Internal server error", 500) 
     
 
+@app.route('/users/<username>/add_collaborators', methods=['POST'])
+def add_collaborators(username):
+    app.logger.info(f"Received batch add collaborators req from client: {username}@{request.remote_addr}")
+    try:
+        request_data = parse_body(request)
+        if not isinstance(request_data, dict) or not isinstance(request_data.get('note'), dict) \
+                or not isinstance(request_data.get('collaborators'), list):
+            app.logger.error("Invalid input: expected a note and a list of collaborators")
+            abort(400, description="Invalid input: expected a note and a list of collaborators")
+
+        with next(get_db_session()) as dbsession:
+            try:
+                results = handle_collaborators_batch(dbsession, username, request_data, app.logger)
+                dbsession.commit()
+            except SQLAlchemyError:
+                app.logger.error("An error occurred, rolling back changes.")
+                dbsession.rollback()
+                raise
+
+        added = any(result["status"] == "added" for result in results)
+        return make_response({"results": results}, 201 if added else 200)
+
+    except HTTPException as e:
+        app.logger.error(f"HTTP error: {str(e)}")
+        return make_response({"error": e.description}, e.code)
+
+    except Exception as e:
+        app.logger.error(f"Internal server error: {str(e)}")
+        return make_response("Internal server error", 500)
+
+
 @app.route('/users/<username>/backup_note', methods=['POST'])
 def backup_note(username):
     app.logger.info(f"Received note backup req from client: {username}@{request.remote_addr}")
     try:
 
-        note_data = request.json
+        note_data = parse_body(request)
 
         if not note_data:
             app.logger.error("Invalid input: No JSON data received")
@@ -159,12 +410,42 @@ def backup_note(username):
         app.logger.error(f"backup_note: Internal server error: {str(e)}")
         return make_response("Internal Server Error", 500)
 
+@app.route('/users/<username>/backup_notes', methods=['POST'])
+def backup_notes(username):
+    app.logger.info(f"Received batch note backup req from client: {username}@{request.remote_addr}")
+    try:
+        request_data = parse_body(request)
+
+        if not isinstance(request_data, dict) or not isinstance(request_data.get('notes'), list):
+            app.logger.error("Invalid input: expected a list of notes")
+            abort(400, description="Invalid input: expected a list of notes")
+
+        with next(get_db_session()) as dbsession:
+            try:
+                results = handle_notes_batch_backup(dbsession, request_data['notes'], username, app.logger)
+                dbsession.commit()
+            except SQLAlchemyError:
+                app.logger.error("An error occurred, rolling back changes.")
+                dbsession.rollback()
+                raise
+
+        saved = any(result["status"] == "saved" for result in results)
+        return make_response({"results": results}, 201 if saved else 200)
+
+    except HTTPException as e:
+        app.logger.error(f"HTTP error: {str(e)}")
+        return make_response({"error": e.description}, e.code)
+
+    except Exception as e:
+        app.logger.error(f"backup_notes: Internal server error: {str(e)}")
+        return make_response("Internal Server Error", 500)
+
 @app.route('/users/<username>/create_note', methods=['POST'])
 def create_note(username):
     try:
         app.logger.info(f"Received create note req from client: {username}@{request.remote_addr}")
 
-        note_data = request.json
+        note_data = parse_body(request)
 
         if not note_data:
             app.logger.error("Invalid input: No JSON data received")
@@ -189,12 +470,7 @@ def create_note(username):
         return make_response("Internal server error", 500)
 
 if __name__ == "__main__":
-    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(message)s",
-        handlers=[
-            logging.FileHandler("backend.log"),
-            logging.StreamHandler()
-        ]
-    )
+    setup_logging("backend.log")
     app.logger.info("Starting backend server")
     
     app.logger.info("Loading server certificates for tls")
@@ -206,8 +482,13 @@ if __name__ == "__main__":
     app.logger.info("Certificates loaded successfully")
 
     temp_files = [be_cert, be_key, fe_cert] 
+
+    if RETENTION_INTERVAL > 0:
+        app.logger.info(f"Starting retention worker, running every {RETENTION_INTERVAL} seconds")
+        RetentionWorker(RETENTION_INTERVAL, app.logger).start()
     
     try:
         app.run(host=BE_HOST, port=BE_PORT, ssl_context=ssl_context)
     finally:
         delete_temp_files(temp_files)  # Cleanup certificates
+        stop_logging()
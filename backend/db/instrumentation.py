@@ -0,0 +1,71 @@
+"""
+Database timings for /metrics.
+
+Every statement is timed through engine events and labelled with the
+db/queries.py function that issued it. Statements issued elsewhere (ORM
+flushes from the helpers, retention, maintenance) get the module and function
+of the closest caller in this code base. Pool checkout wait is timed from the
+moment a session starts a transaction until it holds a connection.
+"""
+import os
+import sys
+import time
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from utils.metrics import registry
+
+BACKEND_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+QUERIES_FILE = os.path.join(BACKEND_ROOT, "db", "queries.py")
+
+query_duration = registry.histogram(
+    "db_query_duration_seconds", "Time spent executing a statement, by issuing function", ("query",))
+pool_checkout_duration = registry.histogram(
+    "db_pool_checkout_seconds", "Time a session waited for a pooled connection")
+
+def query_label() -> str:
+    """The db/queries.py function on the stack, else the closest caller in the backend source tree."""
+    fallback = None
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename == QUERIES_FILE:
+            return frame.f_code.co_name
+        if fallback is None and filename.startswith(BACKEND_ROOT) and filename != __file__:
+            module = os.path.splitext(os.path.basename(filename))[0]
+            fallback = f"{module}.{frame.f_code.co_name}"
+        frame = frame.f_back
+    return fallback or "other"
+
+@event.listens_for(Engine, "before_cursor_execute")
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+@event.listens_for(Engine, "after_cursor_execute")
+def record_query(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_started"].pop()
+    query_duration.observe(time.perf_counter() - started, query=query_label())
+
+@event.listens_for(Engine, "handle_error")
+def discard_query_timer(exception_context):
+    connection = exception_context.connection
+    if connection is not None and connection.info.get("query_started"):
+        connection.info["query_started"].pop()
+
+@event.listens_for(Session, "after_transaction_create")
+def start_checkout_timer(session, transaction):
+    if transaction.parent is None:
+        session.info["checkout_started"] = time.perf_counter()
+
+@event.listens_for(Session, "after_begin")
+def record_checkout(session, transaction, connection):
+    started = session.info.pop("checkout_started", None)
+    if started is not None:
+        pool_checkout_duration.observe(time.perf_counter() - started)
+
+def pool_stats(engine) -> dict:
+    pool = engine.pool
+    stats = {"checked_out": pool.checkedout()} if hasattr(pool, "checkedout") else {}
+    if hasattr(pool, "size"):
+        stats["size"] = pool.size()
+    return stats
@@ -0,0 +1,101 @@
+"""
+Offline maintenance tasks for the notist database.
+
+    cd backend && python -m db.maintenance check-pointers [--fix]
+    cd backend && python -m db.maintenance dedup-report
+    cd backend && python -m db.maintenance retention
+"""
+import argparse
+import logging
+from sqlalchemy import func, or_
+from sqlalchemy.orm import aliased
+from sqlalchemy.orm.session import Session
+from db.connection import get_db_session
+from db.queries import fetch_dedup_report, refresh_latest_version_pointers
+from db.retention import run_retention_job
+from models.note import Note
+from models.note_version import NoteVersion
+
+def find_stale_latest_version_pointers(session: Session) -> list:
+    """Return every note whose latest_version_id does not point at its highest version."""
+    latest = (
+        session.query(
+            NoteVersion.note_id.label("note_id"),
+            func.max(NoteVersion.version).label("latest_version")
+        )
+        .group_by(NoteVersion.note_id)
+        .subquery()
+    )
+    pointed = aliased(NoteVersion)
+
+    results = (
+        session.query(Note.id, Note.latest_version_id, pointed.note_id, pointed.version, latest.c.latest_version)
+        .outerjoin(latest, latest.c.note_id == Note.id)
+        .outerjoin(pointed, pointed.id == Note.latest_version_id)
+        .filter(or_(
+            Note.latest_version_id.is_(None) & latest.c.latest_version.isnot(None),
+            pointed.note_id != Note.id,
+            pointed.version != latest.c.latest_version
+        ))
+        .all()
+    )
+
+    return [
+        {
+            "note_id": note_id,
+            "latest_version_id": latest_version_id,
+            "pointed_note_id": pointed_note_id,
+            "pointed_version": pointed_version,
+            "latest_version": latest_version
+        }
+        for note_id, latest_version_id, pointed_note_id, pointed_version, latest_version in results
+    ]
+
+def check_latest_version_pointers(session: Session, fix: bool, logger) -> int:
+    stale = find_stale_latest_version_pointers(session)
+    for entry in stale:
+        logger.error(f"Stale latest version pointer: {entry}")
+
+    if stale and fix:
+        refreshed = refresh_latest_version_pointers(session, [entry["note_id"] for entry in stale])
+        session.commit()
+        logger.info(f"Repaired {refreshed} latest version pointers")
+        return 0
+
+    logger.info(f"{len(stale)} stale latest version pointers found")
+    return 1 if stale else 0
+
+def report_dedup_savings(session: Session, logger) -> int:
+    report = fetch_dedup_report(session)
+    logger.info(
+        f"{report['references']} note versions share {report['blobs']} payloads: "
+        f"{report['stored_bytes']} bytes stored instead of {report['logical_bytes']}, "
+        f"{report['saved_bytes']} bytes saved by dedup"
+    )
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description="notist database maintenance")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    check_pointers = subparsers.add_parser("check-pointers", help="Verify notes.latest_version_id against note_versions")
+    check_pointers.add_argument("--fix", action="store_true", help="Recompute the stale pointers")
+
+    subparsers.add_parser("dedup-report", help="Report the space saved by content-addressed payloads")
+    subparsers.add_parser("retention", help="Move versions past the retention policy to the archive")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(message)s")
+    logger = logging.getLogger("maintenance")
+
+    if args.command == "retention":
+        return 0 if run_retention_job(logger) is not None else 1
+
+    with next(get_db_session()) as session:
+        if args.command == "check-pointers":
+            return check_latest_version_pointers(session, args.fix, logger)
+        if args.command == "dedup-report":
+            return report_dedup_savings(session, logger)
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,62 @@
+"""
+Versioned schema migrations for the notist database.
+
+Each migration module exposes VERSION, NAME and upgrade(connection).
+Applied versions are recorded in the schema_migrations table, so running
+the migrations again only applies the missing ones:
+
+    cd backend && python -m db.migrations
+"""
+import logging
+from sqlalchemy import text
+from db.migrations import (m0001_latest_version_pointer, m0002_binary_ciphertext, m0003_note_blobs,
+                           m0004_version_archive, m0005_lookup_indexes, m0006_change_log,
+                           m0007_archive_size, m0008_archive_blobs, m0009_change_counter)
+
+MIGRATIONS = [
+    m0001_latest_version_pointer,
+    m0002_binary_ciphertext,
+    m0003_note_blobs,
+    m0004_version_archive,
+    m0005_lookup_indexes,
+    m0006_change_log,
+    m0007_archive_size,
+    m0008_archive_blobs,
+    m0009_change_counter,
+]
+
+logger = logging.getLogger(__name__)
+
+def ensure_migrations_table(connection):
+    connection.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        " version INT NOT NULL PRIMARY KEY,"
+        " name VARCHAR(255) NOT NULL,"
+        " applied_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP"
+        ")"
+    ))
+
+def get_applied_versions(connection) -> set:
+    return {row.version for row in connection.execute(text("SELECT version FROM schema_migrations"))}
+
+def migrate(engine, target: int = None) -> list:
+    """Apply every pending migration up to target (all if None). Returns the applied versions."""
+    applied = []
+    with engine.begin() as connection:
+        ensure_migrations_table(connection)
+        done = get_applied_versions(connection)
+
+    for migration in sorted(MIGRATIONS, key=lambda m: m.VERSION):
+        if migration.VERSION in done or (target is not None and migration.VERSION > target):
+            continue
+
+        logger.info(f"Applying migration {migration.VERSION}: {migration.NAME}")
+        with engine.begin() as connection:
+            migration.upgrade(connection)
+            connection.execute(
+                text("INSERT INTO schema_migrations (version, name) VALUES (:version, :name)"),
+                {"version": migration.VERSION, "name": migration.NAME}
+            )
+        applied.append(migration.VERSION)
+
+    return applied
@@ -0,0 +1,13 @@
+import argparse
+import logging
+from db.connection import engine
+from db.migrations import migrate
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply pending schema migrations")
+    parser.add_argument("--target", type=int, default=None, help="Stop after this migration version")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(message)s")
+    applied = migrate(engine, args.target)
+    logging.info(f"Applied migrations: {applied if applied else 'none, schema is up to date'}")
@@ -0,0 +1,20 @@
+from sqlalchemy import text
+
+VERSION = 1
+NAME = "notes.latest_version_id pointer"
+
+def upgrade(connection):
+    connection.execute(text("ALTER TABLE notes ADD COLUMN latest_version_id INT NULL"))
+    connection.execute(text(
+        "ALTER TABLE notes ADD CONSTRAINT fk_notes_latest_version "
+        "FOREIGN KEY (latest_version_id) REFERENCES note_versions (id)"
+    ))
+
+    # Backfill the pointer from the existing history
+    connection.execute(text(
+        "UPDATE notes SET latest_version_id = ("
+        " SELECT nv.id FROM note_versions nv"
+        " WHERE nv.note_id = notes.id"
+        " ORDER BY nv.version DESC, nv.id DESC LIMIT 1"
+        ")"
+    ))
@@ -0,0 +1,28 @@
+from sqlalchemy import text
+
+VERSION = 2
+NAME = "store ciphertext columns as binary"
+
+# (table, column, binary type); existing values are base64 text
+BINARY_COLUMNS = [
+    ("note_versions", "encrypted_note", "MEDIUMBLOB"),
+    ("note_versions", "iv", "BLOB"),
+    ("note_versions", "note_tag", "BLOB"),
+    ("collaborators", "note_key", "BLOB"),
+]
+
+def upgrade(connection):
+    # MySQL DDL is not transactional, so refuse up front if any value would not decode
+    for table, column, _ in BINARY_COLUMNS:
+        invalid = connection.execute(text(
+            f"SELECT COUNT(*) FROM {table} WHERE FROM_BASE64({column}) IS NULL"
+        )).scalar()
+        if invalid:
+            raise RuntimeError(f"{invalid} rows of {table}.{column} are not valid base64, aborting")
+
+    for table, column, binary_type in BINARY_COLUMNS:
+        connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {column}_bin {binary_type} NULL"))
+        connection.execute(text(f"UPDATE {table} SET {column}_bin = FROM_BASE64({column})"))
+        connection.execute(text(f"ALTER TABLE {table} DROP COLUMN {column}"))
+        connection.execute(text(f"ALTER TABLE {table} RENAME COLUMN {column}_bin TO {column}"))
+        connection.execute(text(f"ALTER TABLE {table} MODIFY {column} {binary_type} NOT NULL"))
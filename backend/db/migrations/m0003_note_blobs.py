@@ -0,0 +1,57 @@
+from sqlalchemy import text
+from models.note_blob import content_hash
+
+VERSION = 3
+NAME = "content-addressed note_blobs"
+
+BATCH_SIZE = 500
+
+def upgrade(connection):
+    connection.execute(text(
+        "CREATE TABLE note_blobs ("
+        " hash VARCHAR(64) NOT NULL PRIMARY KEY,"
+        " iv BLOB NOT NULL,"
+        " encrypted_note MEDIUMBLOB NOT NULL,"
+        " note_tag BLOB NOT NULL,"
+        " size INT NOT NULL,"
+        " ref_count INT NOT NULL DEFAULT 1"
+        ")"
+    ))
+    connection.execute(text("ALTER TABLE note_versions ADD COLUMN blob_hash VARCHAR(64) NULL"))
+
+    # The hash has to match the application's, so it is computed here rather than in SQL
+    last_id = 0
+    while True:
+        rows = connection.execute(text(
+            "SELECT id, iv, encrypted_note, note_tag FROM note_versions"
+            " WHERE id > :last_id ORDER BY id LIMIT :batch_size"
+        ), {"last_id": last_id, "batch_size": BATCH_SIZE}).all()
+        if not rows:
+            break
+
+        blobs, links = [], []
+        for row in rows:
+            blob_hash = content_hash(row.iv, row.encrypted_note, row.note_tag)
+            blobs.append({
+                "hash": blob_hash,
+                "iv": row.iv,
+                "encrypted_note": row.encrypted_note,
+                "note_tag": row.note_tag,
+                "size": len(row.iv) + len(row.encrypted_note) + len(row.note_tag)
+            })
+            links.append({"id": row.id, "blob_hash": blob_hash})
+
+        connection.execute(text(
+            "INSERT INTO note_blobs (hash, iv, encrypted_note, note_tag, size, ref_count)"
+            " VALUES (:hash, :iv, :encrypted_note, :note_tag, :size, 1)"
+            " ON DUPLICATE KEY UPDATE ref_count = ref_count + 1"
+        ), blobs)
+        connection.execute(text("UPDATE note_versions SET blob_hash = :blob_hash WHERE id = :id"), links)
+        last_id = rows[-1].id
+
+    connection.execute(text("ALTER TABLE note_versions MODIFY blob_hash VARCHAR(64) NOT NULL"))
+    connection.execute(text(
+        "ALTER TABLE note_versions ADD CONSTRAINT fk_note_versions_blob "
+        "FOREIGN KEY (blob_hash) REFERENCES note_blobs (hash)"
+    ))
+    connection.execute(text("ALTER TABLE note_versions DROP COLUMN iv, DROP COLUMN encrypted_note, DROP COLUMN note_tag"))
@@ -0,0 +1,23 @@
+from sqlalchemy import text
+
+VERSION = 4
+NAME = "note_versions.created_at and note_versions_archive"
+
+def upgrade(connection):
+    # Existing versions get the migration time, so none of them expire before keep_days
+    connection.execute(text(
+        "ALTER TABLE note_versions ADD COLUMN created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP"
+    ))
+    connection.execute(text(
+        "CREATE TABLE note_versions_archive ("
+        " id INT NOT NULL PRIMARY KEY,"
+        " note_id INT NOT NULL,"
+        " version INT NOT NULL,"
+        " iv BLOB NOT NULL,"
+        " encrypted_note MEDIUMBLOB NOT NULL,"
+        " note_tag BLOB NOT NULL,"
+        " created_at DATETIME NOT NULL,"
+        " archived_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,"
+        " UNIQUE KEY uq_note_versions_archive_note_version (note_id, version)"
+        ")"
+    ))
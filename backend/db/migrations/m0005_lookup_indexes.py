@@ -0,0 +1,38 @@
+from sqlalchemy import text
+from models.note import title_hash
+
+VERSION = 5
+NAME = "indexes and constraints for the hot lookups"
+
+BATCH_SIZE = 500
+
+def upgrade(connection):
+    # Fails on duplicate usernames or duplicate (note_id, version) pairs, which have to be resolved by hand first
+    connection.execute(text("CREATE UNIQUE INDEX uq_users_username ON users (username)"))
+
+    connection.execute(text("ALTER TABLE notes ADD COLUMN note_title_hash VARCHAR(64) NULL"))
+
+    # Same hash as the application computes on insert, so it is computed here rather than with SHA2()
+    last_id = 0
+    while True:
+        rows = connection.execute(text(
+            "SELECT id, note_title FROM notes WHERE id > :last_id ORDER BY id LIMIT :batch_size"
+        ), {"last_id": last_id, "batch_size": BATCH_SIZE}).all()
+        if not rows:
+            break
+
+        connection.execute(
+            text("UPDATE notes SET note_title_hash = :note_title_hash WHERE id = :id"),
+            [{"id": row.id, "note_title_hash": title_hash(row.note_title)} for row in rows]
+        )
+        last_id = rows[-1].id
+
+    connection.execute(text("ALTER TABLE notes MODIFY note_title_hash VARCHAR(64) NOT NULL"))
+    connection.execute(text("CREATE INDEX ix_notes_note_title_hash ON notes (note_title_hash)"))
+
+    connection.execute(text(
+        "ALTER TABLE note_versions ADD CONSTRAINT uq_note_versions_note_version UNIQUE (note_id, version)"
+    ))
+    connection.execute(text(
+        "CREATE INDEX ix_collaborators_user_role_note ON collaborators (user_id, role, note_id)"
+    ))
@@ -0,0 +1,26 @@
+from sqlalchemy import text
+
+VERSION = 6
+NAME = "change_log for incremental sync"
+
+def upgrade(connection):
+    connection.execute(text(
+        "CREATE TABLE change_log ("
+        " seq INT NOT NULL AUTO_INCREMENT PRIMARY KEY,"
+        " note_id INT NOT NULL,"
+        " kind VARCHAR(32) NOT NULL,"
+        " version INT NULL,"
+        " collaborator_id INT NULL,"
+        " role VARCHAR(50) NULL,"
+        " created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,"
+        " KEY ix_change_log_note_seq (note_id, seq)"
+        ")"
+    ))
+
+    # One note_created entry per existing note at its latest version, so syncing from seq 0 returns every note
+    connection.execute(text(
+        "INSERT INTO change_log (note_id, kind, version)"
+        " SELECT notes.id, 'note_created', note_versions.version"
+        " FROM notes JOIN note_versions ON note_versions.id = notes.latest_version_id"
+        " ORDER BY notes.id"
+    ))
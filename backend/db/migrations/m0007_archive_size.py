@@ -0,0 +1,12 @@
+from sqlalchemy import text
+
+VERSION = 7
+NAME = "note_versions_archive.size"
+
+def upgrade(connection):
+    # Same measure as note_blobs.size, so version history can list sizes without reading the payload
+    connection.execute(text("ALTER TABLE note_versions_archive ADD COLUMN size INT NULL"))
+    connection.execute(text(
+        "UPDATE note_versions_archive SET size = LENGTH(iv) + LENGTH(encrypted_note) + LENGTH(note_tag)"
+    ))
+    connection.execute(text("ALTER TABLE note_versions_archive MODIFY size INT NOT NULL"))
@@ -0,0 +1,18 @@
+from sqlalchemy import text
+
+VERSION = 9
+NAME = "change_log seqs handed out at commit from change_counter"
+
+def upgrade(connection):
+    connection.execute(text(
+        "CREATE TABLE change_counter ("
+        " id INT NOT NULL PRIMARY KEY,"
+        " last_seq INT NOT NULL DEFAULT 0"
+        ")"
+    ))
+    connection.execute(text(
+        "INSERT INTO change_counter (id, last_seq) SELECT 1, COALESCE(MAX(seq), 0) FROM change_log"
+    ))
+
+    # seq now comes from change_counter, an AUTO_INCREMENT value is taken at insert and not at commit
+    connection.execute(text("ALTER TABLE change_log MODIFY seq INT NOT NULL"))
@@ -1,15 +1,53 @@
+import hashlib
+from collections import Counter
 from models.user import User
-from models.note import Note
+from models.note import Note, title_hash
 from models.note_version import NoteVersion
 from models.collaborator import Collaborator
+from models.note_blob import NoteBlob, content_hash
+from models.note_version_archive import NoteVersionArchive
+from models.note_blob_archive import NoteBlobArchive
+from models.change_log import ChangeLog, COLLABORATOR_ADDED, NOTE_CREATED
+from models.change_counter import CHANGE_COUNTER_ID, ChangeCounter
+from sqlalchemy.orm import aliased
 from sqlalchemy.orm.session import Session
-from sqlalchemy import desc, func
+from sqlalchemy import Integer, String, and_, bindparam, delete, desc, event, exists, func, insert, literal, null, or_, select, tuple_, \
+    union_all, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+
+def note_title_filter(note_title: str):
+    """Match a note by title through the indexed title hash; the title itself only rules out collisions."""
+    return and_(Note.note_title_hash == title_hash(note_title), Note.note_title == note_title)
 
 def get_user_by_username(session: Session, username: str) -> User:
     return session.query(User).filter(
         User.username == username
     ).first()
 
+def fetch_user_identity(session: Session, username: str):
+    """Only the (id, username, public_key) columns, never the password hash."""
+    return session.query(User.id, User.username, User.public_key).filter(
+        User.username == username
+    ).first()
+
+def fetch_user_identities(session: Session, usernames: list) -> list:
+    """fetch_user_identity for many usernames, in a single IN query."""
+    if not usernames:
+        return []
+
+    return session.query(User.id, User.username, User.public_key).filter(
+        User.username.in_(usernames)
+    ).all()
+
+def update_password_hash(session: Session, user_id: int, old_hash: str, new_hash: str) -> bool:
+    """Replace the user's password hash, unless it changed since old_hash was read."""
+    updated = session.query(User).filter(
+        User.id == user_id,
+        User.password_hash == old_hash
+    ).update({User.password_hash: new_hash}, synchronize_session=False)
+    return updated == 1
+
 def get_user_id_by_username(session: Session, username: str):
     user = get_user_by_username(session, username)
     
@@ -19,7 +57,7 @@ def get_user_id_by_username(session: Session, username: str):
     return user.id
 
 def fetch_note_id_by_title(session: Session, note_title: str):
-    note = session.query(Note).filter(Note.note_title == note_title).first()
+    note = session.query(Note).filter(note_title_filter(note_title)).first()
     
     if note is None:
         return None 
@@ -27,29 +65,198 @@ def fetch_note_id_by_title(session: Session, note_title: str):
     return note.id
     
 def fetch_latest_note_version_by_note_title(session: Session, note_title: str) -> NoteVersion:
-    return session.query(NoteVersion).join(Note).filter(
-        Note.note_title == note_title
-    ).order_by(desc(NoteVersion.version)).first() 
+    return session.query(NoteVersion).join(
+        Note, Note.latest_version_id == NoteVersion.id
+    ).filter(
+        note_title_filter(note_title)
+    ).first()
+
+def set_latest_note_version(session: Session, note_id: int, note_version: NoteVersion) -> bool:
+    """Move the note's latest version pointer forward to note_version.
+    The pointer is never moved back to an older version."""
+    return move_latest_version_pointer(session, note_id, note_version.id, note_version.version)
+
+def move_latest_version_pointer(session: Session, note_id: int, version_id: int, version: int) -> bool:
+    current_version = (
+        select(NoteVersion.version)
+        .where(NoteVersion.id == Note.latest_version_id)
+        .scalar_subquery()
+    )
+    updated = session.query(Note).filter(
+        Note.id == note_id,
+        or_(Note.latest_version_id.is_(None), current_version < version)
+    ).update({Note.latest_version_id: version_id}, synchronize_session=False)
+    return updated == 1
+
+def insert_note_version_if_latest(session: Session, note_id: int, version: int, blob_hash: str, expected_latest: int):
+    """
+    Compare-and-set insert of a new note version, in a single INSERT ... SELECT that
+    only adds the row while no version newer than expected_latest exists. Returns
+    the new version id, or None when a concurrent writer got there first: a newer
+    version showed up, or the unique (note_id, version) constraint turned the row away.
+    """
+    newer_version = select(NoteVersion.id).where(NoteVersion.note_id == note_id)
+    if expected_latest is not None:
+        newer_version = newer_version.where(NoteVersion.version > expected_latest)
+
+    row = select(
+        literal(note_id, Integer), literal(version, Integer), literal(blob_hash, String)
+    ).where(~exists(newer_version))
+
+    try:
+        result = session.execute(
+            insert(NoteVersion).from_select(["note_id", "version", "blob_hash"], row)
+        )
+    except IntegrityError:
+        return None
+
+    return result.lastrowid if result.rowcount == 1 else None
+
+def insert_note_versions_if_latest(session: Session, candidates: list) -> set:
+    """
+    insert_note_version_if_latest for many notes in one INSERT ... SELECT: each
+    (note_id, version, blob_hash, expected_latest) candidate is only added while no
+    version of its note newer than expected_latest exists. Returns the ids of the notes
+    whose version went in, read back from note_versions; expected_latest was read in
+    this transaction, so a concurrent writer's row for the same version is not visible.
+    If the unique (note_id, version) constraint turns the statement away, the
+    candidates are retried one by one so only the conflicting notes are left out.
+    """
+    if not candidates:
+        return set()
+
+    rows = union_all(*[
+        select(
+            literal(candidate["note_id"], Integer).label("note_id"),
+            literal(candidate["version"], Integer).label("version"),
+            literal(candidate["blob_hash"], String).label("blob_hash"),
+            literal(candidate["expected_latest"] or 0, Integer).label("expected_latest")
+        )
+        for candidate in candidates
+    ]).subquery("candidates")
+    newer_version = select(NoteVersion.id).where(
+        NoteVersion.note_id == rows.c.note_id,
+        NoteVersion.version > rows.c.expected_latest
+    )
+
+    try:
+        session.execute(
+            insert(NoteVersion).from_select(
+                ["note_id", "version", "blob_hash"],
+                select(rows.c.note_id, rows.c.version, rows.c.blob_hash).where(~exists(newer_version))
+            )
+        )
+    except IntegrityError:
+        return {
+            candidate["note_id"] for candidate in candidates
+            if insert_note_version_if_latest(session, candidate["note_id"], candidate["version"],
+                                             candidate["blob_hash"], candidate["expected_latest"]) is not None
+        }
+
+    inserted = tuple_(NoteVersion.note_id, NoteVersion.version, NoteVersion.blob_hash).in_(
+        [(candidate["note_id"], candidate["version"], candidate["blob_hash"]) for candidate in candidates]
+    )
+    return set(session.execute(select(NoteVersion.note_id).where(inserted)).scalars())
+
+def refresh_latest_version_pointers(session: Session, note_ids: list = None) -> int:
+    """Recompute the latest version pointer from note_versions (all notes if note_ids is None)."""
+    latest_version_id = (
+        select(NoteVersion.id)
+        .where(NoteVersion.note_id == Note.id)
+        .order_by(desc(NoteVersion.version), desc(NoteVersion.id))
+        .limit(1)
+        .scalar_subquery()
+    )
+    query = session.query(Note)
+    if note_ids is not None:
+        query = query.filter(Note.id.in_(note_ids))
+    return query.update({Note.latest_version_id: latest_version_id}, synchronize_session=False)
+
+def store_note_blobs(session: Session, payloads: list) -> list:
+    """
+    Store (iv, encrypted_note, note_tag) payloads content-addressed, with a single
+    upsert statement. Identical payloads are kept once and their reference count
+    is bumped instead. Returns the blob hash of each payload, in order.
+    """
+    rows = []
+    for payload in payloads:
+        iv, encrypted_note, note_tag = payload['iv'], payload['encrypted_note'], payload['note_tag']
+        rows.append({
+            "hash": content_hash(iv, encrypted_note, note_tag),
+            "iv": iv,
+            "encrypted_note": encrypted_note,
+            "note_tag": note_tag,
+            "size": len(iv) + len(encrypted_note) + len(note_tag),
+            "ref_count": 1
+        })
+
+    if not rows:
+        return []
+
+    blobs = NoteBlob.__table__
+    statement = mysql_insert(blobs).on_duplicate_key_update(ref_count=blobs.c.ref_count + 1)
+    session.execute(statement, rows)
+    return [row["hash"] for row in rows]
+
+def store_note_blob(session: Session, payload: dict) -> str:
+    return store_note_blobs(session, [payload])[0]
+
+def release_note_blobs(session: Session, blob_hashes: list):
+    """Drop one reference per hash taken by store_note_blobs, deleting the blobs nothing references anymore."""
+    if not blob_hashes:
+        return
+
+    released = Counter(blob_hashes)
+    blobs = NoteBlob.__table__
+    session.execute(
+        update(blobs)
+        .where(blobs.c.hash == bindparam("blob_hash"))
+        .values(ref_count=blobs.c.ref_count - bindparam("released")),
+        [{"blob_hash": blob_hash, "released": count} for blob_hash, count in released.items()]
+    )
+    session.execute(delete(blobs).where(blobs.c.hash.in_(list(released)), blobs.c.ref_count <= 0))
+
+def fetch_dedup_report(session: Session) -> dict:
+    """How much space content addressing saves compared to one payload copy per version."""
+    blobs, references, stored_bytes, logical_bytes = session.query(
+        func.count(NoteBlob.hash),
+        func.coalesce(func.sum(NoteBlob.ref_count), 0),
+        func.coalesce(func.sum(NoteBlob.size), 0),
+        func.coalesce(func.sum(NoteBlob.size * NoteBlob.ref_count), 0)
+    ).one()
+
+    return {
+        "blobs": blobs,
+        "references": int(references),
+        "stored_bytes": int(stored_bytes),
+        "logical_bytes": int(logical_bytes),
+        "saved_bytes": int(logical_bytes) - int(stored_bytes)
+    }
 
 def fetch_specific_note_version(session: Session, user_id: int, note_title: str, note_version: int):
     result = (
         session.query(
             Note.note_title,
-            NoteVersion.iv,
-            NoteVersion.encrypted_note,
-            NoteVersion.note_tag,
+            NoteBlob.iv,
+            NoteBlob.encrypted_note,
+            NoteBlob.note_tag,
             Collaborator.note_key
         )
         .join(Collaborator, Collaborator.note_id == Note.id)  # Join with collaborators
         .join(NoteVersion, NoteVersion.note_id == Note.id)  # Join with NoteVersion
+        .join(NoteBlob, NoteBlob.hash == NoteVersion.blob_hash)  # Join with the version payload
         .filter(
-            Note.note_title == note_title,  # Filter by note title
+            note_title_filter(note_title),  # Filter by note title
             NoteVersion.version == note_version,  # Filter by note version
             Collaborator.user_id == user_id  # Filter by user ID (must be owner/editor/viewer)
         )
         .first()  # Fetch the first (and only) result
     )
 
+    if not result:
+        # Versions past the retention policy live in the archive
+        result = fetch_archived_note_version(session, user_id, note_title, note_version)
+
     if not result:
         return None  
 
@@ -61,50 +268,295 @@ def fetch_specific_note_version(session: Session, user_id: int, note_title: str,
         "ciphered_note_key": result.note_key
     }
 
-def fetch_notes_for_user(session: Session, user_id: int):
-    latest_version_subquery = (
+def fetch_archived_note_version(session: Session, user_id: int, note_title: str, note_version: int):
+    return (
         session.query(
-            NoteVersion.note_id.label("note_id"),
-            func.max(NoteVersion.version).label("latest_version")
+            Note.note_title,
+            NoteBlobArchive.iv,
+            NoteBlobArchive.encrypted_note,
+            NoteBlobArchive.note_tag,
+            Collaborator.note_key
+        )
+        .join(Collaborator, Collaborator.note_id == Note.id)
+        .join(NoteVersionArchive, NoteVersionArchive.note_id == Note.id)
+        .join(NoteBlobArchive, NoteBlobArchive.hash == NoteVersionArchive.blob_hash)
+        .filter(
+            note_title_filter(note_title),
+            NoteVersionArchive.version == note_version,
+            Collaborator.user_id == user_id
         )
-        .group_by(NoteVersion.note_id)
-        .subquery()
+        .first()
     )
 
-    results = (
-        session.query(
-            Note.note_title,
-            NoteVersion.iv,
-            NoteVersion.encrypted_note,
-            NoteVersion.note_tag,
-            Collaborator.note_key,
-            Collaborator.role
+def version_metadata_to_dict(row, archived: bool) -> dict:
+    return {
+        "id": row.id,
+        "version": row.version,
+        "size": row.size,
+        "created_at": row.created_at.isoformat(),
+        "archived": archived
+    }
+
+def fetch_note_history(session: Session, user_id: int, note_title: str):
+    """
+    Metadata of every version of a note the user collaborates on, newest
+    first, or None. Sizes come from note_blobs / note_blobs_archive, the
+    ciphertext columns are never read.
+    """
+    hot = (
+        session.query(NoteVersion.id, NoteVersion.note_id, NoteVersion.version, NoteBlob.size, NoteVersion.created_at)
+        .join(Note, Note.id == NoteVersion.note_id)
+        .join(Collaborator, Collaborator.note_id == Note.id)
+        .join(NoteBlob, NoteBlob.hash == NoteVersion.blob_hash)
+        .filter(note_title_filter(note_title), Collaborator.user_id == user_id)
+        .order_by(NoteVersion.version.desc())
+        .all()
+    )
+    # The latest version is never archived, a note without hot versions is one the user cannot see
+    if not hot:
+        return None
+
+    archived = (
+        session.query(NoteVersionArchive.id, NoteVersionArchive.version, NoteBlobArchive.size,
+                      NoteVersionArchive.created_at)
+        .join(NoteBlobArchive, NoteBlobArchive.hash == NoteVersionArchive.blob_hash)
+        .filter(NoteVersionArchive.note_id == hot[0].note_id)
+        .order_by(NoteVersionArchive.version.desc())
+        .all()
+    )
+
+    return {
+        "title": note_title,
+        "latest_version": hot[0].version,
+        "versions": [version_metadata_to_dict(row, False) for row in hot] +
+                    [version_metadata_to_dict(row, True) for row in archived]
+    }
+
+def fetch_note_version_range(session: Session, user_id: int, note_title: str, first: int, last: int):
+    """
+    Versions first..last of a note the user collaborates on, oldest first, in
+    one authorized query. Archived versions are older than every hot one, so
+    the archive is only queried when the hot tier does not reach back to first.
+    None if the user cannot see the note or none of the versions exist.
+    """
+    rows = (
+        session.query(NoteVersion.version, NoteBlob.iv, NoteBlob.encrypted_note, NoteBlob.note_tag, Collaborator.note_key)
+        .join(Note, Note.id == NoteVersion.note_id)
+        .join(Collaborator, Collaborator.note_id == Note.id)
+        .join(NoteBlob, NoteBlob.hash == NoteVersion.blob_hash)
+        .filter(note_title_filter(note_title), Collaborator.user_id == user_id,
+                NoteVersion.version.between(first, last))
+        .order_by(NoteVersion.version)
+        .all()
+    )
+
+    if not rows or rows[0].version > first:
+        oldest_hot = rows[0].version - 1 if rows else last
+        archived = (
+            session.query(NoteVersionArchive.version, NoteBlobArchive.iv, NoteBlobArchive.encrypted_note,
+                          NoteBlobArchive.note_tag, Collaborator.note_key)
+            .join(NoteBlobArchive, NoteBlobArchive.hash == NoteVersionArchive.blob_hash)
+            .join(Note, Note.id == NoteVersionArchive.note_id)
+            .join(Collaborator, Collaborator.note_id == Note.id)
+            .filter(note_title_filter(note_title), Collaborator.user_id == user_id,
+                    NoteVersionArchive.version.between(first, oldest_hot))
+            .order_by(NoteVersionArchive.version)
+            .all()
         )
-        .join(Collaborator, Collaborator.note_id == Note.id)  # Join with collaborators
-        .join(latest_version_subquery, latest_version_subquery.c.note_id == Note.id)  # Join with subquery
-        .join(
-            NoteVersion,
-            (NoteVersion.note_id == latest_version_subquery.c.note_id) &
-            (NoteVersion.version == latest_version_subquery.c.latest_version)  # Match latest version
+        rows = archived + rows
+
+    if not rows:
+        return None
+
+    return {
+        "title": note_title,
+        "ciphered_note_key": rows[0].note_key,
+        "versions": [
+            {"version": row.version, "iv": row.iv, "encrypted_note": row.encrypted_note, "note_tag": row.note_tag}
+            for row in rows
+        ]
+    }
+
+def fetch_note_version_ref(session: Session, user_id: int, note_title: str, note_version: int):
+    """Authorized existence check for a note version, without reading the ciphertext."""
+    ref = (
+        session.query(Note.id, NoteVersion.version)
+        .join(Collaborator, Collaborator.note_id == Note.id)
+        .join(NoteVersion, NoteVersion.note_id == Note.id)
+        .filter(
+            note_title_filter(note_title),
+            NoteVersion.version == note_version,
+            Collaborator.user_id == user_id
         )
-        .filter(Collaborator.user_id == user_id)  # Filter by user ID
+        .first()
+    )
+    if ref is not None:
+        return ref
+
+    return (
+        session.query(Note.id, NoteVersionArchive.version)
+        .join(Collaborator, Collaborator.note_id == Note.id)
+        .join(NoteVersionArchive, NoteVersionArchive.note_id == Note.id)
+        .filter(
+            note_title_filter(note_title),
+            NoteVersionArchive.version == note_version,
+            Collaborator.user_id == user_id
+        )
+        .first()
+    )
+
+def fetch_listing_revision(session: Session, user_id: int) -> str:
+    """Digest of the user's (note, latest version, role) set. Changes whenever the listing would."""
+    results = (
+        session.query(Note.id, Note.latest_version_id, Collaborator.role)
+        .join(Collaborator, Collaborator.note_id == Note.id)
+        .filter(Collaborator.user_id == user_id)
+        .order_by(Note.id)
         .all()
     )
 
+    digest = hashlib.sha1()
+    for note_id, latest_version_id, role in results:
+        digest.update(f"{note_id}:{latest_version_id}:{role};".encode())
+    return digest.hexdigest()
+
+def user_notes_query(session: Session, user_id: int, role: str = None, summary: bool = False):
+    if summary:
+        # Only what a note list shows, the ciphertext and note key are fetched per note when opened
+        columns = (Note.id, Note.note_title, NoteVersion.version, NoteBlob.size, Collaborator.role)
+    else:
+        columns = (Note.id, Note.note_title, NoteBlob.iv, NoteBlob.encrypted_note, NoteBlob.note_tag,
+                   Collaborator.note_key, Collaborator.role)
+
+    query = (
+        session.query(*columns)
+        .join(Collaborator, Collaborator.note_id == Note.id)  # Join with collaborators
+        .join(NoteVersion, NoteVersion.id == Note.latest_version_id)  # Join with latest version
+        .join(NoteBlob, NoteBlob.hash == NoteVersion.blob_hash)  # Join with the version payload
+        .filter(Collaborator.user_id == user_id)  # Filter by user ID
+    )
+
+    if role is not None:
+        query = query.filter(Collaborator.role == role)
+
+    return query
+
+def note_row_to_dict(row) -> dict:
+    return {
+        "title": row.note_title,
+        "iv": row.iv,
+        "encrypted_note": row.encrypted_note,
+        "note_tag": row.note_tag,
+        "ciphered_note_key": row.note_key
+    }
+
+def note_summary_to_dict(row) -> dict:
+    return {
+        "title": row.note_title,
+        "version": row.version,
+        "size": row.size
+    }
+
+def fetch_notes_for_user(session: Session, user_id: int, role: str = None, summary: bool = False):
+    results = user_notes_query(session, user_id, role, summary).all()
+    row_to_dict = note_summary_to_dict if summary else note_row_to_dict
+
     notes = {"owner": [], "editor": [], "viewer": []}
        
-    for note_title, iv, encrypted_note, note_tag, note_key, role in results:
-        note_dict = {
-            "title": note_title,
-            "iv": iv,
-            "encrypted_note": encrypted_note,
-            "note_tag": note_tag,
-            "ciphered_note_key": note_key
-        }
-        notes[role].append(note_dict)
+    for row in results:
+        notes[row.role].append(row_to_dict(row))
         
     return notes
+
+def fetch_notes_page_for_user(session: Session, user_id: int, after_note_id: int, limit: int, role: str = None,
+                              summary: bool = False):
+    """Keyset page of the user's notes ordered by note id, starting after after_note_id.
+    Returns (notes, last_note_id); last_note_id is None when there are no more pages."""
+    query = user_notes_query(session, user_id, role, summary)
+    if after_note_id is not None:
+        query = query.filter(Note.id > after_note_id)
+
+    results = query.order_by(Note.id).limit(limit + 1).all()
+    has_more = len(results) > limit
+    results = results[:limit]
+
+    row_to_dict = note_summary_to_dict if summary else note_row_to_dict
+    notes = [dict(row_to_dict(row), role=row.role) for row in results]
+    return notes, (results[-1].id if has_more else None)
+
+def stream_notes_for_user(session: Session, user_id: int, role: str = None, batch_size: int = 100,
+                          summary: bool = False):
+    """Yield the user's notes one by one from a server-side cursor."""
+    query = user_notes_query(session, user_id, role, summary).order_by(Note.id).yield_per(batch_size)
+    row_to_dict = note_summary_to_dict if summary else note_row_to_dict
+    for row in query:
+        yield dict(row_to_dict(row), role=row.role)
     
+def resolve_note_access(session: Session, username: str, note_title: str, collaborator_name: str = None):
+    """
+    Resolve everything the write paths check, in a single round trip: the ids of the
+    requesting user and of the collaborator, the note id, both users' roles on the
+    note and the note's latest version. Missing entities come back as None.
+    """
+    user_id = select(User.id).where(User.username == username).scalar_subquery()
+    note_id = select(Note.id).where(note_title_filter(note_title)).scalar_subquery()
+
+    def role_of(subject_id):
+        return select(Collaborator.role).where(
+            Collaborator.user_id == subject_id,
+            Collaborator.note_id == note_id
+        ).scalar_subquery()
+
+    def latest(column):
+        return select(column).join(
+            Note, Note.latest_version_id == NoteVersion.id
+        ).where(note_title_filter(note_title)).scalar_subquery()
+
+    if collaborator_name is not None:
+        collaborator_id = select(User.id).where(User.username == collaborator_name).scalar_subquery()
+        collaborator_columns = (collaborator_id.label("collaborator_id"), role_of(collaborator_id).label("collaborator_role"))
+    else:
+        collaborator_columns = (null().label("collaborator_id"), null().label("collaborator_role"))
+
+    return session.query(
+        user_id.label("user_id"),
+        note_id.label("note_id"),
+        role_of(user_id).label("user_role"),
+        *collaborator_columns,
+        latest(NoteVersion.version).label("latest_version"),
+        latest(NoteVersion.id).label("latest_version_id")
+    ).one()
+
+def fetch_users_with_note_roles(session: Session, note_id: int, usernames: list) -> dict:
+    """Map each existing username to (user_id, role on the note or None)."""
+    if not usernames:
+        return {}
+
+    results = (
+        session.query(User.username, User.id, Collaborator.role)
+        .outerjoin(Collaborator, (Collaborator.user_id == User.id) & (Collaborator.note_id == note_id))
+        .filter(User.username.in_(usernames))
+        .all()
+    )
+    return {username: (user_id, role) for username, user_id, role in results}
+
+def fetch_note_write_states(session: Session, user_id: int, note_titles: list) -> dict:
+    """Map each existing note title to (note_id, the user's role or None, latest version)."""
+    if not note_titles:
+        return {}
+
+    results = (
+        session.query(Note.note_title, Note.id, Collaborator.role, NoteVersion.version)
+        .outerjoin(Collaborator, (Collaborator.note_id == Note.id) & (Collaborator.user_id == user_id))
+        .outerjoin(NoteVersion, NoteVersion.id == Note.latest_version_id)
+        .filter(
+            Note.note_title_hash.in_([title_hash(note_title) for note_title in note_titles]),
+            Note.note_title.in_(note_titles)
+        )
+        .all()
+    )
+    return {note_title: (note_id, role, version) for note_title, note_id, role, version in results}
+
 def check_editor_of_note(session: Session, user_id: int, note_id: int) -> bool:
     return session.query(Collaborator).filter(
         Collaborator.user_id == user_id, 
@@ -126,3 +578,100 @@ def check_owner_of_note(session: Session, user_id: int, note_id: int) -> bool:
         Collaborator.role == 'owner'
     ).first() is not None
 
+def change_entry(note_id: int, kind: str, version: int = None, collaborator_id: int = None, role: str = None) -> dict:
+    return {"note_id": note_id, "kind": kind, "version": version, "collaborator_id": collaborator_id, "role": role}
+
+def record_changes(session: Session, entries: list):
+    """Queue change_entry() rows for the change log, written when the caller's transaction commits."""
+    if entries:
+        # Begins the transaction if the caller has not written yet, so rolling it back always forgets them
+        session.connection()
+        session.info.setdefault("pending_changes", []).extend(entries)
+
+@event.listens_for(Session, "before_commit")
+def write_recorded_changes(session: Session):
+    """
+    Give the queued changes their seqs and insert them. The counter row stays
+    locked until the commit finishes, so a transaction committing later always
+    gets higher seqs and a client that saw seq n can never miss a lower one.
+    """
+    entries = session.info.pop("pending_changes", None)
+    if not entries:
+        return
+
+    session.query(ChangeCounter).filter(ChangeCounter.id == CHANGE_COUNTER_ID).update(
+        {ChangeCounter.last_seq: ChangeCounter.last_seq + len(entries)}, synchronize_session=False
+    )
+    last_seq = session.query(ChangeCounter.last_seq).filter(ChangeCounter.id == CHANGE_COUNTER_ID).scalar()
+    first_seq = last_seq - len(entries) + 1
+    session.execute(insert(ChangeLog), [{"seq": first_seq + index, **entry} for index, entry in enumerate(entries)])
+    # Handed to the event hub once the transaction commits, see utils/events.py
+    session.info.setdefault("recorded_changes", []).extend(entries)
+
+@event.listens_for(Session, "after_rollback")
+def forget_pending_changes(session: Session):
+    session.info.pop("pending_changes", None)
+
+def fetch_note_titles_for_user(session: Session, user_id: int) -> dict:
+    """note_id -> title of every note the user collaborates on."""
+    results = session.query(Note.id, Note.note_title).join(
+        Collaborator, Collaborator.note_id == Note.id
+    ).filter(Collaborator.user_id == user_id).all()
+    return {row.id: row.note_title for row in results}
+
+def fetch_note_titles(session: Session, note_ids: list) -> dict:
+    if not note_ids:
+        return {}
+    results = session.query(Note.id, Note.note_title).filter(Note.id.in_(note_ids)).all()
+    return {row.id: row.note_title for row in results}
+
+def fetch_changes_for_user(session: Session, user_id: int, since: int, limit: int) -> list:
+    """
+    Change log entries after seq since on the notes the user collaborates on,
+    oldest first, with the ciphertext of created versions and the user's note
+    key where the user needs it. Versions archived since come back without ciphertext.
+    """
+    collaborator = aliased(User)
+    results = (
+        session.query(
+            ChangeLog.seq,
+            ChangeLog.kind,
+            ChangeLog.version,
+            ChangeLog.collaborator_id,
+            ChangeLog.role.label("permission"),
+            Note.note_title,
+            Collaborator.role,
+            Collaborator.note_key,
+            collaborator.username.label("collaborator"),
+            NoteBlob.iv,
+            NoteBlob.encrypted_note,
+            NoteBlob.note_tag
+        )
+        .join(Collaborator, and_(Collaborator.note_id == ChangeLog.note_id, Collaborator.user_id == user_id))
+        .join(Note, Note.id == ChangeLog.note_id)
+        .outerjoin(collaborator, collaborator.id == ChangeLog.collaborator_id)
+        .outerjoin(NoteVersion, and_(NoteVersion.note_id == ChangeLog.note_id, NoteVersion.version == ChangeLog.version))
+        .outerjoin(NoteBlob, NoteBlob.hash == NoteVersion.blob_hash)
+        .filter(ChangeLog.seq > since)
+        .order_by(ChangeLog.seq)
+        .limit(limit)
+        .all()
+    )
+    return [change_row_to_dict(row, user_id) for row in results]
+
+def change_row_to_dict(row, user_id: int) -> dict:
+    change = {"seq": row.seq, "change": row.kind, "title": row.note_title, "role": row.role}
+
+    if row.kind == COLLABORATOR_ADDED:
+        change["collaborator"] = row.collaborator
+        change["permission"] = row.permission
+    else:
+        change["version"] = row.version
+        change["iv"] = row.iv
+        change["encrypted_note"] = row.encrypted_note
+        change["note_tag"] = row.note_tag
+
+    # The note key only travels when the user first gets access to the note
+    if row.kind == NOTE_CREATED or row.collaborator_id == user_id:
+        change["ciphered_note_key"] = row.note_key
+    return change
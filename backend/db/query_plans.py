@@ -0,0 +1,180 @@
+"""
+Query plan check for db/queries.py.
+
+Runs a case for every function of db/queries.py that sends statements against
+the configured database, EXPLAINs each statement it issues, writes included,
+and fails if any of them scans a whole table (EXPLAIN type ALL) or if a
+function has no case, so new queries cannot skip the check. Writes are rolled
+back. Run it against a database with a representative amount of data, MySQL
+picks full scans for tiny tables anyway:
+
+    cd backend && python -m db.query_plans
+"""
+import inspect
+import logging
+import os
+from sqlalchemy import event
+from sqlalchemy.orm.session import Session
+from db.connection import get_db_session
+from db import queries
+from models.change_log import VERSION_ADDED
+from models.collaborator import Collaborator
+from models.note import Note
+from models.note_version import NoteVersion
+from models.user import User
+
+# Aggregates over the whole table by design
+EXPECTED_FULL_SCANS = {"fetch_dedup_report"}
+
+EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE")
+
+# Build expressions, queries or dicts for the other functions or only queue work in
+# session.info, without sending anything themselves
+NOT_QUERIES = {
+    "note_title_filter", "user_notes_query", "note_row_to_dict", "note_summary_to_dict",
+    "version_metadata_to_dict", "change_entry", "change_row_to_dict", "record_changes", "forget_pending_changes"
+}
+
+QUERY_CASES = [
+    ("get_user_by_username", lambda s, x: queries.get_user_by_username(s, x["username"])),
+    ("get_user_id_by_username", lambda s, x: queries.get_user_id_by_username(s, x["username"])),
+    ("fetch_user_identity", lambda s, x: queries.fetch_user_identity(s, x["username"])),
+    ("fetch_user_identities", lambda s, x: queries.fetch_user_identities(s, [x["username"]])),
+    ("update_password_hash", lambda s, x: queries.update_password_hash(s, x["user_id"], "", "")),
+    ("fetch_note_id_by_title", lambda s, x: queries.fetch_note_id_by_title(s, x["note_title"])),
+    ("fetch_latest_note_version_by_note_title", lambda s, x: queries.fetch_latest_note_version_by_note_title(s, x["note_title"])),
+    ("insert_note_version_if_latest", lambda s, x: queries.insert_note_version_if_latest(s, x["note_id"], x["version"] + 1, x["blob_hash"], x["version"])),
+    ("insert_note_versions_if_latest", lambda s, x: queries.insert_note_versions_if_latest(s, [{"note_id": x["note_id"], "version": x["version"] + 2, "blob_hash": x["blob_hash"], "expected_latest": x["version"]}])),
+    ("set_latest_note_version", lambda s, x: queries.set_latest_note_version(s, x["note_id"], s.get(NoteVersion, x["latest_version_id"]))),
+    ("move_latest_version_pointer", lambda s, x: queries.move_latest_version_pointer(s, x["note_id"], x["latest_version_id"], x["version"])),
+    ("refresh_latest_version_pointers", lambda s, x: queries.refresh_latest_version_pointers(s, [x["note_id"]])),
+    ("store_note_blobs", lambda s, x: queries.store_note_blobs(s, [sample_payload()])),
+    ("store_note_blob", lambda s, x: queries.store_note_blob(s, sample_payload())),
+    ("release_note_blobs", lambda s, x: queries.release_note_blobs(s, [x["blob_hash"]])),
+    ("fetch_dedup_report", lambda s, x: queries.fetch_dedup_report(s)),
+    ("fetch_specific_note_version", lambda s, x: queries.fetch_specific_note_version(s, x["user_id"], x["note_title"], x["version"])),
+    ("fetch_archived_note_version", lambda s, x: queries.fetch_archived_note_version(s, x["user_id"], x["note_title"], x["version"])),
+    ("fetch_note_version_ref", lambda s, x: queries.fetch_note_version_ref(s, x["user_id"], x["note_title"], -1)),
+    ("fetch_note_history", lambda s, x: queries.fetch_note_history(s, x["user_id"], x["note_title"])),
+    ("fetch_note_version_range", lambda s, x: queries.fetch_note_version_range(s, x["user_id"], x["note_title"], 1, x["version"])),
+    ("fetch_listing_revision", lambda s, x: queries.fetch_listing_revision(s, x["user_id"])),
+    ("fetch_notes_for_user", lambda s, x: queries.fetch_notes_for_user(s, x["user_id"], x["role"])),
+    ("fetch_notes_for_user[summary]", lambda s, x: queries.fetch_notes_for_user(s, x["user_id"], summary=True)),
+    ("fetch_notes_page_for_user", lambda s, x: queries.fetch_notes_page_for_user(s, x["user_id"], 0, 50)),
+    ("stream_notes_for_user", lambda s, x: list(queries.stream_notes_for_user(s, x["user_id"]))),
+    ("resolve_note_access", lambda s, x: queries.resolve_note_access(s, x["username"], x["note_title"], x["username"])),
+    ("fetch_users_with_note_roles", lambda s, x: queries.fetch_users_with_note_roles(s, x["note_id"], [x["username"]])),
+    ("fetch_note_write_states", lambda s, x: queries.fetch_note_write_states(s, x["user_id"], [x["note_title"]])),
+    ("check_owner_of_note", lambda s, x: queries.check_owner_of_note(s, x["user_id"], x["note_id"])),
+    ("check_editor_of_note", lambda s, x: queries.check_editor_of_note(s, x["user_id"], x["note_id"])),
+    ("check_viewer_of_note", lambda s, x: queries.check_viewer_of_note(s, x["user_id"], x["note_id"])),
+    ("fetch_note_titles", lambda s, x: queries.fetch_note_titles(s, [x["note_id"]])),
+    ("fetch_note_titles_for_user", lambda s, x: queries.fetch_note_titles_for_user(s, x["user_id"])),
+    ("write_recorded_changes", lambda s, x: record_and_write_changes(s, [queries.change_entry(x["note_id"], VERSION_ADDED, x["version"])])),
+    ("fetch_changes_for_user", lambda s, x: queries.fetch_changes_for_user(s, x["user_id"], 0, 50)),
+]
+
+def record_and_write_changes(session: Session, entries: list):
+    """What committing does with recorded changes, without committing."""
+    queries.record_changes(session, entries)
+    queries.write_recorded_changes(session)
+
+def sample_payload() -> dict:
+    return {"iv": os.urandom(12), "encrypted_note": os.urandom(64), "note_tag": os.urandom(16)}
+
+def uncovered_queries() -> list:
+    """Functions of db/queries.py without a case. A case named "name[variant]" covers name."""
+    covered = {name.split("[")[0] for name, _ in QUERY_CASES}
+    functions = {
+        name for name, function in inspect.getmembers(queries, inspect.isfunction)
+        if function.__module__ == queries.__name__
+    }
+    return sorted(functions - covered - NOT_QUERIES)
+
+def fetch_sample(session: Session) -> dict:
+    """Real values to run the lookups with, so the plans match the ones production gets."""
+    row = (
+        session.query(Collaborator.user_id, Collaborator.note_id, Collaborator.role,
+                      User.username, Note.note_title, Note.latest_version_id, NoteVersion.version, NoteVersion.blob_hash)
+        .join(User, User.id == Collaborator.user_id)
+        .join(Note, Note.id == Collaborator.note_id)
+        .join(NoteVersion, NoteVersion.id == Note.latest_version_id)
+        .first()
+    )
+    if row is None:
+        return {"user_id": 0, "note_id": 0, "role": "owner", "username": "", "note_title": "", "latest_version_id": 0,
+                "version": 1, "blob_hash": ""}
+    return dict(row._mapping)
+
+def capture_statements(session: Session, run) -> list:
+    """Run the query and return the (statement, parameters) pairs it sent."""
+    captured = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if not executemany:
+            captured.append((statement, parameters))
+
+    engine = session.get_bind()
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        run()
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+    return captured
+
+def full_scans(session: Session, statement: str, parameters) -> list:
+    plan = session.connection().exec_driver_sql(f"EXPLAIN {statement}", parameters).mappings().all()
+    # <derivedN> / <subqueryN> rows are materialized temporaries, not tables, and the
+    # INSERT row is the table being written to, which is never scanned
+    return [
+        row for row in plan
+        if row["type"] == "ALL" and not str(row["table"]).startswith("<") and row["select_type"] != "INSERT"
+    ]
+
+def check_query_plans(session: Session, logger) -> int:
+    sample = fetch_sample(session)
+    failures = 0
+
+    for name, run in QUERY_CASES:
+        statements = capture_statements(session, lambda: run(session, sample))
+        for statement, parameters in statements:
+            if not statement.lstrip().upper().startswith(EXPLAINABLE):
+                continue
+
+            scans = full_scans(session, statement, parameters)
+            if not scans:
+                continue
+
+            tables = ", ".join(str(row["table"]) for row in scans)
+            if name in EXPECTED_FULL_SCANS:
+                logger.info(f"{name}: full scan of {tables} (expected)")
+            else:
+                failures += 1
+                logger.error(f"{name}: full scan of {tables} in: {' '.join(statement.split())}")
+
+        logger.info(f"{name}: checked {len(statements)} statements")
+
+    session.rollback()
+    return failures
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(message)s")
+    logger = logging.getLogger("query_plans")
+
+    uncovered = uncovered_queries()
+    for name in uncovered:
+        logger.error(f"{name}: no query plan case, add one to QUERY_CASES")
+
+    with next(get_db_session()) as session:
+        failures = check_query_plans(session, logger)
+
+    if uncovered:
+        return 1
+    if failures:
+        logger.error(f"{failures} statements fall back to a full table scan")
+        return 1
+    logger.info("No query falls back to a full table scan")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
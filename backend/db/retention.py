@@ -0,0 +1,189 @@
+"""
+Version retention for note_versions.
+
+A version is moved to the note_versions_archive cold tier once it is neither
+among the newest RETENTION_KEEP_LAST versions of its note nor younger than
+RETENTION_KEEP_DAYS days. The latest version of a note is never archived.
+Archived payloads are deduplicated in note_blobs_archive the same way
+note_blobs deduplicates hot ones, and hot blobs no longer referenced by any
+hot version are deleted.
+
+Runs in the background when RETENTION_INTERVAL (seconds) is set, or once with:
+
+    cd backend && python -m db.maintenance retention
+"""
+import os
+import threading
+from collections import Counter
+from datetime import timedelta
+from sqlalchemy import bindparam, delete, func, insert, literal, select, text, update
+from sqlalchemy.orm.session import Session
+from db.connection import get_db_session
+from models.note_blob import NoteBlob
+from models.note_blob_archive import NoteBlobArchive
+from models.note_version import NoteVersion
+from models.note_version_archive import NoteVersionArchive
+
+RETENTION_KEEP_LAST = int(os.getenv("RETENTION_KEEP_LAST", 20))
+RETENTION_KEEP_DAYS = int(os.getenv("RETENTION_KEEP_DAYS", 90))
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", 500))
+RETENTION_INTERVAL = int(os.getenv("RETENTION_INTERVAL", 0))  # seconds, 0 disables the background job
+RETENTION_LOCK_NAME = "notist_retention"
+
+def select_expired_versions(session: Session, keep_last: int, keep_days: int, limit: int) -> list:
+    ranked = (
+        select(
+            NoteVersion.id,
+            NoteVersion.blob_hash,
+            NoteVersion.created_at,
+            NoteBlob.size,
+            func.row_number().over(
+                partition_by=NoteVersion.note_id,
+                order_by=NoteVersion.version.desc()
+            ).label("rank")
+        )
+        .join(NoteBlob, NoteBlob.hash == NoteVersion.blob_hash)
+        .subquery()
+    )
+    # Compare against the database clock, the one created_at was written with
+    cutoff = session.query(func.now()).scalar() - timedelta(days=keep_days)
+
+    return (
+        session.query(ranked.c.id, ranked.c.blob_hash, ranked.c.size)
+        .filter(ranked.c.rank > max(keep_last, 1), ranked.c.created_at < cutoff)
+        .order_by(ranked.c.id)
+        .limit(limit)
+        .all()
+    )
+
+def archive_versions(session: Session, expired: list) -> dict:
+    """
+    Move the expired versions to the archive and drop them from the hot tier.
+    Payloads are copied to note_blobs_archive once per blob, versions sharing
+    one only add to its ref_count. Hot blobs are deleted once no hot version
+    references them anymore.
+    """
+    version_ids = [row.id for row in expired]
+    released = Counter(row.blob_hash for row in expired)
+    sizes = {row.blob_hash: row.size for row in expired}
+
+    cold = NoteBlobArchive.__table__
+    # Only one retention job runs at a time, nothing else inserts cold blobs in between
+    already_archived = set(session.execute(select(cold.c.hash).where(cold.c.hash.in_(list(released)))).scalars())
+    new_blobs = [blob_hash for blob_hash in released if blob_hash not in already_archived]
+    if new_blobs:
+        session.execute(
+            insert(cold).from_select(
+                ["hash", "iv", "encrypted_note", "note_tag", "size", "ref_count"],
+                select(NoteBlob.hash, NoteBlob.iv, NoteBlob.encrypted_note, NoteBlob.note_tag, NoteBlob.size, literal(0))
+                .where(NoteBlob.hash.in_(new_blobs))
+            )
+        )
+    session.execute(
+        update(cold)
+        .where(cold.c.hash == bindparam("blob_hash"))
+        .values(ref_count=cold.c.ref_count + bindparam("released")),
+        [{"blob_hash": blob_hash, "released": count} for blob_hash, count in released.items()]
+    )
+
+    session.execute(
+        insert(NoteVersionArchive).from_select(
+            ["id", "note_id", "version", "blob_hash", "created_at"],
+            select(NoteVersion.id, NoteVersion.note_id, NoteVersion.version, NoteVersion.blob_hash, NoteVersion.created_at)
+            .where(NoteVersion.id.in_(version_ids))
+        )
+    )
+    session.execute(delete(NoteVersion).where(NoteVersion.id.in_(version_ids)))
+
+    blobs = NoteBlob.__table__
+    session.execute(
+        update(blobs)
+        .where(blobs.c.hash == bindparam("blob_hash"))
+        .values(ref_count=blobs.c.ref_count - bindparam("released")),
+        [{"blob_hash": blob_hash, "released": count} for blob_hash, count in released.items()]
+    )
+
+    orphaned = blobs.c.hash.in_(list(released)) & (blobs.c.ref_count <= 0)
+    blobs_deleted, hot_bytes = session.execute(
+        select(func.count(), func.coalesce(func.sum(blobs.c.size), 0)).where(orphaned)
+    ).one()
+    session.execute(delete(blobs).where(orphaned))
+
+    return {
+        "rows_archived": len(version_ids),
+        "blobs_archived": len(new_blobs),
+        "archive_bytes_written": sum(sizes[blob_hash] for blob_hash in new_blobs),
+        "blobs_deleted": blobs_deleted,
+        "hot_bytes_reclaimed": int(hot_bytes)
+    }
+
+def run_retention(session: Session, keep_last: int = RETENTION_KEEP_LAST, keep_days: int = RETENTION_KEEP_DAYS,
+                  batch_size: int = RETENTION_BATCH_SIZE) -> dict:
+    """Archive every expired version, one committed batch at a time. Returns what was reclaimed."""
+    stats = {"rows_archived": 0, "blobs_archived": 0, "archive_bytes_written": 0, "blobs_deleted": 0,
+             "hot_bytes_reclaimed": 0}
+
+    while True:
+        expired = select_expired_versions(session, keep_last, keep_days, batch_size)
+        if not expired:
+            return stats
+
+        try:
+            batch = archive_versions(session, expired)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+
+        for key, value in batch.items():
+            stats[key] += value
+
+def run_retention_job(logger) -> dict:
+    """One retention pass, skipped if another process is already running one."""
+    with next(get_db_session()) as session:
+        engine = session.get_bind()
+        with engine.connect() as lock_connection:
+            if not acquire_retention_lock(lock_connection):
+                logger.info("Retention job already running elsewhere, skipping")
+                return None
+
+            try:
+                stats = run_retention(session)
+            finally:
+                release_retention_lock(lock_connection)
+
+    logger.info(
+        f"Retention job archived {stats['rows_archived']} versions "
+        f"({stats['blobs_archived']} new blobs, {stats['archive_bytes_written']} bytes), deleted {stats['blobs_deleted']} blobs "
+        f"and reclaimed {stats['hot_bytes_reclaimed']} hot bytes"
+    )
+    return stats
+
+def acquire_retention_lock(connection) -> bool:
+    if connection.dialect.name != "mysql":
+        return True
+    return connection.execute(text("SELECT GET_LOCK(:name, 0)"), {"name": RETENTION_LOCK_NAME}).scalar() == 1
+
+def release_retention_lock(connection):
+    if connection.dialect.name == "mysql":
+        connection.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": RETENTION_LOCK_NAME})
+
+
+class RetentionWorker(threading.Thread):
+    """Background thread running the retention job every interval seconds."""
+
+    def __init__(self, interval: int, logger):
+        super().__init__(name="retention-worker", daemon=True)
+        self.interval = interval
+        self.logger = logger
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                run_retention_job(self.logger)
+            except Exception as e:
+                self.logger.error(f"Retention job failed: {e}")
+
+    def stop(self):
+        self.stopped.set()
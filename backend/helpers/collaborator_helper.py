@@ -1,15 +1,20 @@
 from flask import abort, request
 from sqlalchemy.exc import SQLAlchemyError
 from db.queries import *
+from models.change_log import COLLABORATOR_ADDED, VERSION_ADDED
+from helpers.permission_helper import get_permission_context
+from sqlalchemy import insert
+
+MAX_BATCH_COLLABORATORS = 100
+COLLABORATOR_ENTRY_STR_FIELDS = ('collaborator', 'permission')
 
 def handle_collaborator_upsert(session: Session, username: str, request_data: dict, logger):
     logger.info(f"Handling collaborator upsert: {username} is trying to add {request_data['collaborator']} as {request_data['permission']}")
 
     user_to_add_id, note_id, note_version = verify_request(session, username, request_data, logger)
     
-    new_note_version = create_new_note_version(session, note_id, request_data['note'])
-    logger.info(f"Received note: {request_data['note']}")
-    logger.info(f"New note version {new_note_version.id} created successfully")
+    new_version_id = create_new_note_version(session, note_id, request_data['note'], note_version)
+    logger.info(f"New note version {new_version_id} created successfully")
 
     # Add collaborator
     add_new_collaborator(
@@ -27,12 +32,14 @@ def verify_request(session: Session, username: str, request_data: dict, logger):
     note_data = request_data['note']
     permission = request_data['permission']
     
-    user_to_add_id = get_user_id_by_username(session, collaborator_name)
+    access = get_permission_context(session, username, note_data['title'], collaborator_name)
+
+    user_to_add_id = access.collaborator_id
     if user_to_add_id is None:
         logger.error("User to add as collaborator was not found")
         abort(404, description="User to add as collaborator was not found")
     
-    user_request_id = get_user_id_by_username(session, username)
+    user_request_id = access.user_id
     if user_request_id is None:
         logger.error("User sending request not found")
         abort(404, description="User sending request not found")
@@ -41,56 +48,148 @@ def verify_request(session: Session, username: str, request_data: dict, logger):
         logger.error("User cannot add himself as collaborator")
         abort(400, description="User cannot add himself as collaborator")
         
-    note_id = fetch_note_id_by_title(session, note_data['title'])
+    note_id = access.note_id
     if note_id is None:
         logger.error("Note to add collaborator not found")
         abort(404, description="Note to add collaborator not found")
      
-    if not check_owner_of_note(session, user_request_id, note_id):
+    if not access.is_owner:
          logger.error("Non owner user trying to add collaborator.")
          abort(400, description="Non owner user trying to add collaborator.")
     
     if permission not in ['editor', 'viewer']:
         logger.error("Invalid permission. Collaborator permission must be 'editor' or 'viewer'")
         abort(400, description="Invalid permission. Collaborator permission must be 'editor' or 'viewer")
-        
-    if permission == 'editor' and check_editor_of_note(session, user_to_add_id, note_id):
-        logger.error("User to add is already an editor")
-        abort(400, description="User to add is already an editor")
+
+    role_error = collaborator_role_error(access.collaborator_role, permission)
+    if role_error is not None:
+        logger.error(role_error)
+        abort(400, description=role_error)
+
+    if access.latest_version >= note_data['version']:
+        logger.error("Trying to add a collaborator to an outdated version") 
+        abort(400, description="Trying to add a collaborator to an outdated version")
+
+    return user_to_add_id, note_id, access.latest_version
+
+
+def collaborator_role_error(current_role: str, permission: str) -> str:
+    """Why a grant is rejected when the user already has a role on the note, None if it is allowed."""
+    if permission == 'editor' and current_role == 'editor':
+        return "User to add is already an editor"
     
-    if permission == 'viewer' and check_viewer_of_note(session, user_to_add_id, note_id):
-        logger.error("User to add is already a viewer")
-        abort(400, description="User to add is already a viewer")
+    if permission == 'viewer' and current_role == 'viewer':
+        return "User to add is already a viewer"
     
     # if editor and trying to be viewer, do not allow for now
-    if permission == 'viewer' and check_editor_of_note(session, user_to_add_id, note_id):
-        logger.error("User to add is already an editor and cannot be a viewer")
-        abort(400, description="User to add is already an editor and cannot be a viewer")
+    if permission == 'viewer' and current_role == 'editor':
+        return "User to add is already an editor and cannot be a viewer"
         
     # if viewer and trying to be editor, do not allow for now
-    if permission == 'editor' and check_viewer_of_note(session, user_to_add_id, note_id):
-        logger.error("User to add is already a viewer and cannot be an editor")
-        abort(400, description="User to add is already a viewer and cannot be an editor")
-    
-    note_version = fetch_latest_note_version_by_note_title(session, note_data['title'])
-    if note_version.version >= note_data['version']:
-        logger.error("Trying to add a collaborator to an outdated version") 
+    if permission == 'editor' and current_role == 'viewer':
+        return "User to add is already a viewer and cannot be an editor"
+
+    if current_role == 'owner':
+        return "User to add is already the owner"
+
+    return None
+
+
+def handle_collaborators_batch(session: Session, username: str, request_data: dict, logger) -> list:
+    """
+    Share one note version with many users. Note level problems abort the whole
+    request; per collaborator problems are reported in the returned results and
+    the valid grants are inserted with a single bulk statement.
+    """
+    note_data = request_data['note']
+    entries = request_data['collaborators']
+    logger.info(f"Handling batch collaborator upsert: {username} is trying to add {len(entries)} collaborators")
+
+    if not 0 < len(entries) <= MAX_BATCH_COLLABORATORS:
+        logger.error("Invalid number of collaborators")
+        abort(400, description=f"Between 1 and {MAX_BATCH_COLLABORATORS} collaborators can be added at once")
+
+    access = get_permission_context(session, username, note_data['title'])
+    if access.user_id is None:
+        logger.error("User sending request not found")
+        abort(404, description="User sending request not found")
+
+    if access.note_id is None:
+        logger.error("Note to add collaborator not found")
+        abort(404, description="Note to add collaborator not found")
+
+    if not access.is_owner:
+        logger.error("Non owner user trying to add collaborator.")
+        abort(400, description="Non owner user trying to add collaborator.")
+
+    if access.latest_version >= note_data['version']:
+        logger.error("Trying to add a collaborator to an outdated version")
         abort(400, description="Trying to add a collaborator to an outdated version")
 
-    return user_to_add_id, note_id, note_version
+    names = [entry.get('collaborator') for entry in entries if isinstance(entry, dict)]
+    candidates = fetch_users_with_note_roles(session, access.note_id, [name for name in names if isinstance(name, str)])
 
+    results, grants, seen = [], [], set()
+    for entry in entries:
+        error = collaborator_entry_error(entry, candidates, access.user_id, seen)
+        name = entry.get('collaborator') if isinstance(entry, dict) else None
 
-def create_new_note_version(session, note_id, note_data):
-    new_note_version = NoteVersion(
-        note_id=note_id,
-        encrypted_note=note_data['encrypted_note'],
-        note_tag=note_data['note_tag'],
-        iv=note_data['iv'],
-        version=note_data['version']
+        if error is not None:
+            logger.error(f"Cannot add collaborator {name}: {error}")
+            results.append({"collaborator": name, "status": "failed", "error": error})
+            continue
+
+        seen.add(name)
+        grants.append({
+            "note_id": access.note_id,
+            "user_id": candidates[name][0],
+            "role": entry['permission'],
+            "note_key": entry['ciphered_note_key']
+        })
+        results.append({"collaborator": name, "status": "added", "permission": entry['permission']})
+
+    if grants:
+        new_version_id = create_new_note_version(session, access.note_id, note_data, access.latest_version)
+        logger.info(f"New note version {new_version_id} created successfully")
+        add_new_collaborators(session, grants)
+        logger.info(f"{len(grants)} collaborators added successfully")
+
+    return results
+
+
+def collaborator_entry_error(entry, candidates: dict, requester_id: int, seen: set) -> str:
+    if not isinstance(entry, dict) or not isinstance(entry.get('ciphered_note_key'), bytes) \
+            or not all(isinstance(entry.get(field), str) for field in COLLABORATOR_ENTRY_STR_FIELDS):
+        return "Invalid entry"
+
+    if entry['permission'] not in ['editor', 'viewer']:
+        return "Invalid permission. Collaborator permission must be 'editor' or 'viewer'"
+
+    if entry['collaborator'] in seen:
+        return "Duplicate collaborator in request"
+
+    if entry['collaborator'] not in candidates:
+        return "User to add as collaborator was not found"
+
+    user_id, current_role = candidates[entry['collaborator']]
+    if user_id == requester_id:
+        return "User cannot add himself as collaborator"
+
+    return collaborator_role_error(current_role, entry['permission'])
+
+
+def create_new_note_version(session, note_id, note_data, expected_latest):
+    """Add the shared version on top of expected_latest, the latest version the checks saw. Returns its id."""
+    version = note_data['version']
+    new_version_id = insert_note_version_if_latest(
+        session, note_id, version, store_note_blob(session, note_data), expected_latest
     )
-    session.add(new_note_version)
-    session.flush()
-    return new_note_version
+    if new_version_id is None:
+        abort(400, description="Trying to add a collaborator to an outdated version")
+
+    move_latest_version_pointer(session, note_id, new_version_id, version)
+    record_changes(session, [change_entry(note_id, VERSION_ADDED, version)])
+    return new_version_id
 
 
 def add_new_collaborator(session, note_id, user_id, permission, ciphered_note_key):
@@ -102,4 +201,13 @@ def add_new_collaborator(session, note_id, user_id, permission, ciphered_note_ke
     )
     session.add(new_collaborator)
     session.flush()
+    record_changes(session, [change_entry(note_id, COLLABORATOR_ADDED, collaborator_id=user_id, role=permission)])
+
 
+def add_new_collaborators(session, grants: list):
+    """Insert many collaborator rows with a single executemany INSERT."""
+    session.execute(insert(Collaborator), grants)
+    record_changes(session, [
+        change_entry(grant["note_id"], COLLABORATOR_ADDED, collaborator_id=grant["user_id"], role=grant["role"])
+        for grant in grants
+    ])
@@ -1,86 +1,186 @@
 from flask import abort
 from sqlalchemy.exc import SQLAlchemyError
 from db.queries import *
+from models.change_log import NOTE_CREATED, VERSION_ADDED
+from helpers.permission_helper import WRITE_ROLES, get_permission_context
+from utils.user_cache import get_user_identity
+
+MAX_BATCH_NOTES = 200
+BATCH_NOTE_BINARY_FIELDS = ('iv', 'encrypted_note', 'note_tag')
 
 def handle_note_upsert(session: Session, note_data: dict, username: str, headers: dict, logger):
-    logger.info(f"Handling note upsert: {note_data}")
-    note_id = fetch_note_id_by_title(session, note_data['title'])
+    logger.info(f"Handling note upsert: {username} is backing up {note_data['title']} version {headers['version']}")
+    access = get_permission_context(session, username, note_data['title'])
+    note_id = access.note_id
 
     if note_id is not None:
-        note = fetch_latest_note_version_by_note_title(session, note_data['title'])
-        logger.info(f"Note found. is: {note.id}")
-        owner = get_user_by_username(session, username)
-        logger.info(f"Owner found: {owner}")
-        is_owner = check_owner_of_note(session, owner.id, note_id)
-        is_editor = check_editor_of_note(session, owner.id, note_id)
-        logger.info(f"Owner: {is_owner}, Editor: {is_editor}")
+        logger.info(f"Note found. Latest version: {access.latest_version}")
+        logger.info(f"User role: {access.user_role}")
         
-        if not (is_owner or is_editor):
+        if not access.can_write:
             logger.error("User has no write permissions")
             abort(403, description="User has no write permissions") 
 
-        if int(headers['version']) < note.version:
+        if int(headers['version']) < access.latest_version:
             logger.error("Trying to update with outdated version")
             abort(405, description="Trying to update with outdated version")
-        elif int(headers['version']) == note.version:
+        elif int(headers['version']) == access.latest_version:
             return note_id
 
-        newid = update_existing_note(session, note_id, note_data, headers, logger)
+        newid = update_existing_note(session, note_id, note_data, headers, access.latest_version, logger)
         return newid
     else:
         abort(402, description="Note does not exist in the database")
 
 
-def update_existing_note(session: Session, note_id: int, note_data: dict, headers: dict, logger):
-    logger.info(f"Adding new version {headers['version']} to note {note_id}")
-    
-    new_note_version = NoteVersion(
-        note_id=note_id,
-        iv=note_data['iv'],
-        encrypted_note=note_data['encrypted_note'],
-        note_tag=note_data['note_tag'],
-        version=int(headers['version'])
+def handle_notes_batch_backup(session: Session, notes: list, username: str, logger) -> list:
+    """
+    Back up many notes at once. Permissions and latest versions are resolved for the
+    whole set with one query, then all new versions are added with one compare-and-set
+    insert, so a note that changed in between is reported as outdated instead of
+    failing the batch. Any other database error fails the whole batch. Returns a status per note:
+    saved, unchanged, outdated, forbidden, not_found or invalid.
+    """
+    logger.info(f"Handling batch backup of {len(notes)} notes for {username}")
+
+    if not 0 < len(notes) <= MAX_BATCH_NOTES:
+        logger.error("Invalid number of notes")
+        abort(400, description=f"Between 1 and {MAX_BATCH_NOTES} notes can be backed up at once")
+
+    user = get_user_identity(session, username)
+    if user is None:
+        logger.error("User sending request not found")
+        abort(404, description="User not found")
+
+    titles = [note['title'] for note in notes if isinstance(note, dict) and isinstance(note.get('title'), str)]
+    states = fetch_note_write_states(session, user.id, titles)
+
+    results, pending, seen = [], [], set()
+    for note in notes:
+        status, version = batch_note_status(note, states, seen)
+        title = note.get('title') if isinstance(note, dict) else None
+        result = {"title": title, "status": status, "version": version}
+        results.append(result)
+
+        if status != "saved":
+            continue
+
+        seen.add(title)
+        note_id, _, latest_version = states[title]
+        pending.append((note_id, latest_version, note, result))
+
+    # Blobs go in first, note_versions references them; the ones whose note turns out outdated are released
+    # In note id order, so two batches sharing notes take their locks in the same order
+    pending.sort(key=lambda entry: entry[0])
+    blob_hashes = store_note_blobs(session, [note for _, _, note, _ in pending])
+    inserted = insert_note_versions_if_latest(session, [
+        {"note_id": note_id, "version": result["version"], "blob_hash": blob_hash, "expected_latest": latest_version}
+        for (note_id, latest_version, _, result), blob_hash in zip(pending, blob_hashes)
+    ])
+
+    saved, released = [], []
+    for (note_id, _, _, result), blob_hash in zip(pending, blob_hashes):
+        if note_id in inserted:
+            saved.append((note_id, result["version"]))
+        else:
+            result["status"] = "outdated"
+            released.append(blob_hash)
+    release_note_blobs(session, released)
+
+    if saved:
+        refresh_latest_version_pointers(session, [note_id for note_id, _ in saved])
+        record_changes(session, [change_entry(note_id, VERSION_ADDED, version) for note_id, version in saved])
+        logger.info(f"{len(saved)} new note versions saved")
+
+    outdated = len(pending) - len(saved)
+    if outdated:
+        logger.info(f"{outdated} notes changed concurrently and were reported as outdated")
+
+    return results
+
+
+def batch_note_status(note, states: dict, seen: set) -> tuple:
+    if not isinstance(note, dict) or not isinstance(note.get('title'), str) \
+            or not all(isinstance(note.get(field), bytes) for field in BATCH_NOTE_BINARY_FIELDS):
+        return "invalid", None
+
+    try:
+        version = int(note.get('version'))
+    except (TypeError, ValueError):
+        return "invalid", None
+
+    if note['title'] in seen:
+        return "invalid", version
+
+    if note['title'] not in states:
+        return "not_found", version
+
+    _, role, latest_version = states[note['title']]
+    if role not in WRITE_ROLES:
+        return "forbidden", version
+
+    if version < latest_version:
+        return "outdated", version
+    if version == latest_version:
+        return "unchanged", version
+
+    return "saved", version
+
+
+def update_existing_note(session: Session, note_id: int, note_data: dict, headers: dict, expected_latest: int, logger):
+    """Add the version on top of expected_latest, the latest version the permission check saw."""
+    version = int(headers['version'])
+    logger.info(f"Adding new version {version} to note {note_id}")
+
+    # A writer that loses the race aborts, rolling its blob back along with the rest of the request
+    new_version_id = insert_note_version_if_latest(
+        session, note_id, version, store_note_blob(session, note_data), expected_latest
     )
+    if new_version_id is None:
+        logger.error("Note was updated concurrently, version is outdated")
+        abort(405, description="Trying to update with outdated version")
+
+    move_latest_version_pointer(session, note_id, new_version_id, version)
+    record_changes(session, [change_entry(note_id, VERSION_ADDED, version)])
     
-    session.add(new_note_version)
-    session.flush()
-    
-    return new_note_version.id
+    return new_version_id
     
 
 def insert_new_note(session: Session, note_data: dict, username: str, logger):
     """Insert a new note into the database."""
     logger.info("Inserting new note")
-    note_id = fetch_note_id_by_title(session, note_data['title'])
+    access = get_permission_context(session, username, note_data['title'])
 
-    if note_id is not None:
+    if access.note_id is not None:
         logger.error(f"Note already exists in the database")
         abort(401, description="Note already exists in the database")
 
-    owner = get_user_by_username(session, username)
+    if access.user_id is None:
+        logger.error("User creating the note not found")
+        abort(404, description="User not found")
     
     new_note = Note(note_title=note_data['title'])
     session.add(new_note)
     session.flush()
     
-    print(f"new_note.id: {new_note.id}")
+    logger.info(f"New note {new_note.id} inserted")
     
     new_note_version = NoteVersion(
         note_id=new_note.id,
-        iv=note_data['iv'],
-        encrypted_note=note_data['encrypted_note'],
-        note_tag=note_data['note_tag'],
+        blob_hash=store_note_blob(session, note_data),
         version=1
     )
     
     session.add(new_note_version)
     session.flush()
+    new_note.latest_version_id = new_note_version.id
 
     new_collaborator = Collaborator(
-        user_id=owner.id,
+        user_id=access.user_id,
         note_id=new_note.id,
         role="owner",
         note_key=note_data['ciphered_note_key']
     )
     session.add(new_collaborator)
+    record_changes(session, [change_entry(new_note.id, NOTE_CREATED, 1)])
     return new_note_version.id
\ No newline at end of file
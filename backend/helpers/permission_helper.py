@@ -0,0 +1,40 @@
+from flask import g
+from db.queries import *
+
+WRITE_ROLES = ('owner', 'editor')
+
+class PermissionContext:
+    """Request-scoped view of who may do what on a note, resolved with one query."""
+
+    def __init__(self, access):
+        self.user_id = access.user_id
+        self.note_id = access.note_id
+        self.user_role = access.user_role
+        self.collaborator_id = access.collaborator_id
+        self.collaborator_role = access.collaborator_role
+        self.latest_version = access.latest_version
+        self.latest_version_id = access.latest_version_id
+
+    @property
+    def is_owner(self) -> bool:
+        return self.user_role == 'owner'
+
+    @property
+    def can_write(self) -> bool:
+        return self.user_role in WRITE_ROLES
+
+    def __repr__(self):
+        return f"<PermissionContext(user_id={self.user_id}, note_id={self.note_id}, user_role={self.user_role}, \
+                collaborator_id={self.collaborator_id}, collaborator_role={self.collaborator_role}, \
+                latest_version={self.latest_version})>"
+
+
+def get_permission_context(session: Session, username: str, note_title: str, collaborator_name: str = None) -> PermissionContext:
+    """Resolve the permission context once per request and reuse it for every later check."""
+    contexts = g.setdefault('permission_contexts', {})
+    key = (username, note_title, collaborator_name)
+
+    if key not in contexts:
+        contexts[key] = PermissionContext(resolve_note_access(session, username, note_title, collaborator_name))
+
+    return contexts[key]
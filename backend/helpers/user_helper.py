@@ -0,0 +1,28 @@
+from flask import abort
+from sqlalchemy.orm.session import Session
+from utils.user_cache import get_user_identities
+
+MAX_BATCH_PUB_KEYS = 500
+
+def handle_pub_keys_lookup(session: Session, request_data, logger) -> dict:
+    """
+    Resolve the public keys of a list of usernames at once.
+    Returns the keys by username, and the usernames that do not exist.
+    """
+    usernames = request_data.get('usernames') if isinstance(request_data, dict) else None
+    if not isinstance(usernames, list) or not all(isinstance(username, str) for username in usernames):
+        logger.error("Invalid input: expected a list of usernames")
+        abort(400, description="Invalid input: expected a list of usernames")
+
+    usernames = list(dict.fromkeys(usernames))  # drop duplicates, keep the order
+    if not 0 < len(usernames) <= MAX_BATCH_PUB_KEYS:
+        logger.error("Invalid number of usernames")
+        abort(400, description=f"Between 1 and {MAX_BATCH_PUB_KEYS} public keys can be fetched at once")
+
+    logger.info(f"Fetching public keys of {len(usernames)} users")
+    identities = get_user_identities(session, usernames)
+
+    return {
+        "pub_keys": {username: identities[username].public_key for username in usernames if username in identities},
+        "not_found": [username for username in usernames if username not in identities]
+    }
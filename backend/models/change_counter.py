@@ -0,0 +1,18 @@
+from sqlalchemy import Column, Integer
+from db.connection import Base
+
+CHANGE_COUNTER_ID = 1
+
+class ChangeCounter(Base):
+    """
+    Single row holding the last change_log seq handed out. Transactions take
+    their seqs from it while committing and keep the row locked until the
+    commit, so seqs are visible in the order they were handed out.
+    """
+    __tablename__ = 'change_counter'
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    last_seq = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<ChangeCounter(id={self.id}, last_seq={self.last_seq})>"
@@ -0,0 +1,32 @@
+from sqlalchemy import Column, DateTime, Index, Integer, String, func
+from db.connection import Base
+
+NOTE_CREATED = 'note_created'
+VERSION_ADDED = 'version_added'
+COLLABORATOR_ADDED = 'collaborator_added'
+
+class ChangeLog(Base):
+    """
+    Append-only log of created notes, note versions and collaborator grants,
+    written in the same transaction as the change itself. seq is handed out
+    from change_counter while the transaction commits, so a seq is never
+    committed after a higher one and clients sync by asking for everything
+    after the last seq they have seen.
+    """
+    __tablename__ = 'change_log'
+    __table_args__ = (
+        # Lets a user's changes be found from their notes instead of scanning every newer seq
+        Index('ix_change_log_note_seq', 'note_id', 'seq'),
+    )
+
+    seq = Column(Integer, primary_key=True, autoincrement=False)  # see ChangeCounter
+    note_id = Column(Integer, nullable=False)
+    kind = Column(String(32), nullable=False)
+    version = Column(Integer, nullable=True)  # note_created and version_added
+    collaborator_id = Column(Integer, nullable=True)  # collaborator_added
+    role = Column(String(50), nullable=True)  # collaborator_added
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+
+    def __repr__(self):
+        return f"<ChangeLog(seq={self.seq}, note_id={self.note_id}, kind={self.kind}, version={self.version}, \
+                collaborator_id={self.collaborator_id}, role={self.role})>"
@@ -1,14 +1,18 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey
+from sqlalchemy import Column, Index, Integer, String, LargeBinary, ForeignKey
 from sqlalchemy.orm import relationship
 from db.connection import Base
 
 class Collaborator(Base):
     __tablename__ = 'collaborators'
+    __table_args__ = (
+        # Covers the per-user listings, which filter on user_id (and role) and join on note_id
+        Index('ix_collaborators_user_role_note', 'user_id', 'role', 'note_id'),
+    )
 
     note_id = Column(Integer, ForeignKey('notes.id'), primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
     role = Column(String(50), nullable=False)
-    note_key = Column(Text, nullable=False)
+    note_key = Column(LargeBinary, nullable=False)
 
     # Relationships
     note = relationship("Note", back_populates="collaborators")
@@ -1,19 +1,38 @@
-from sqlalchemy import Column, Integer, Text, ForeignKey
+import hashlib
+from sqlalchemy import Column, Index, Integer, String, Text, ForeignKey
 from sqlalchemy.orm import relationship
 from db.connection import Base
 from models.note_version import NoteVersion
 
+def title_hash(note_title: str) -> str:
+    """SHA-256 of the title. note_title is a TEXT column, so lookups go through this indexed hash."""
+    return hashlib.sha256(note_title.encode('utf-8')).hexdigest()
+
+def default_title_hash(context) -> str:
+    return title_hash(context.get_current_parameters()['note_title'])
+
 class Note(Base):
     __tablename__ = 'notes'
+    __table_args__ = (
+        Index('ix_notes_note_title_hash', 'note_title_hash'),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     note_title = Column(Text, nullable=False)
+    note_title_hash = Column(String(64), nullable=False, default=default_title_hash)
+
+    # Points at the newest row in note_versions, maintained by every write path
+    latest_version_id = Column(
+        Integer,
+        ForeignKey('note_versions.id', use_alter=True, name='fk_notes_latest_version'),
+        nullable=True
+    )
 
     # Relationship with note versions
-    versions = relationship("NoteVersion", back_populates="note")
+    versions = relationship("NoteVersion", back_populates="note", foreign_keys=[NoteVersion.note_id])
 
     # Relationship with collaborators
     collaborators = relationship("Collaborator", back_populates="note")
 
     def __repr__(self):
-        return f"<Note(id={self.id}, note_title={self.note_title})>"
+        return f"<Note(id={self.id}, note_title={self.note_title}, latest_version_id={self.latest_version_id})>"
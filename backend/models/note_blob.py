@@ -0,0 +1,28 @@
+import hashlib
+from sqlalchemy import Column, Integer, String, LargeBinary
+from sqlalchemy.orm import relationship
+from db.connection import Base
+
+def content_hash(iv: bytes, encrypted_note: bytes, note_tag: bytes) -> str:
+    """SHA-256 over the length-prefixed (iv, encrypted_note, note_tag) payload."""
+    digest = hashlib.sha256()
+    for part in (iv, encrypted_note, note_tag):
+        digest.update(len(part).to_bytes(8, 'big'))
+        digest.update(part)
+    return digest.hexdigest()
+
+class NoteBlob(Base):
+    """Ciphertext payload shared by every note version with identical bytes."""
+    __tablename__ = 'note_blobs'
+
+    hash = Column(String(64), primary_key=True)
+    iv = Column(LargeBinary, nullable=False)
+    encrypted_note = Column(LargeBinary(length=2**24 - 1), nullable=False)  # MEDIUMBLOB on MySQL
+    note_tag = Column(LargeBinary, nullable=False)
+    size = Column(Integer, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=1)
+
+    versions = relationship("NoteVersion", back_populates="blob")
+
+    def __repr__(self):
+        return f"<NoteBlob(hash={self.hash}, size={self.size}, ref_count={self.ref_count})>"
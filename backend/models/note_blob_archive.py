@@ -0,0 +1,19 @@
+from sqlalchemy import Column, Integer, String, LargeBinary
+from db.connection import Base
+
+class NoteBlobArchive(Base):
+    """
+    Cold tier counterpart of note_blobs. Payloads of archived versions are kept
+    once per content hash, however many archived versions share them.
+    """
+    __tablename__ = 'note_blobs_archive'
+
+    hash = Column(String(64), primary_key=True)
+    iv = Column(LargeBinary, nullable=False)
+    encrypted_note = Column(LargeBinary(length=2**24 - 1), nullable=False)  # MEDIUMBLOB on MySQL
+    note_tag = Column(LargeBinary, nullable=False)
+    size = Column(Integer, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=1)
+
+    def __repr__(self):
+        return f"<NoteBlobArchive(hash={self.hash}, size={self.size}, ref_count={self.ref_count})>"
@@ -1,18 +1,22 @@
-from sqlalchemy import Column, Integer, Text, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, UniqueConstraint, func
 from sqlalchemy.orm import relationship, backref
 from db.connection import Base
+from models.note_blob import NoteBlob
 
 class NoteVersion(Base):
     __tablename__ = 'note_versions'
+    __table_args__ = (
+        UniqueConstraint('note_id', 'version', name='uq_note_versions_note_version'),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     note_id = Column(Integer, ForeignKey('notes.id'), nullable=False)
     version = Column(Integer, nullable=False)
-    encrypted_note = Column(Text, nullable=False)
-    iv = Column(Text, nullable=False)
-    note_tag = Column(Text, nullable=False)
+    blob_hash = Column(String(64), ForeignKey('note_blobs.hash'), nullable=False)
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
 
-    note = relationship("Note", back_populates="versions")
+    note = relationship("Note", back_populates="versions", foreign_keys=[note_id])
+    blob = relationship("NoteBlob", back_populates="versions")
 
     def __repr__(self):
-        return f"<NoteVersion(id={self.id}, note_id={self.note_id}, version={self.version}, note_tag={self.note_tag})>"
\ No newline at end of file
+        return f"<NoteVersion(id={self.id}, note_id={self.note_id}, version={self.version}, blob_hash={self.blob_hash})>"
@@ -0,0 +1,22 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, UniqueConstraint, func
+from db.connection import Base
+from models.note_blob_archive import NoteBlobArchive
+
+class NoteVersionArchive(Base):
+    """
+    Cold tier for versions past the retention policy. Payloads move to
+    note_blobs_archive, deduplicated like in the hot tier, so the hot
+    note_versions / note_blobs tables can shrink.
+    """
+    __tablename__ = 'note_versions_archive'
+    __table_args__ = (UniqueConstraint('note_id', 'version', name='uq_note_versions_archive_note_version'),)
+
+    id = Column(Integer, primary_key=True)  # id the version had in note_versions
+    note_id = Column(Integer, nullable=False)
+    version = Column(Integer, nullable=False)
+    blob_hash = Column(String(64), ForeignKey('note_blobs_archive.hash'), nullable=False)
+    created_at = Column(DateTime, nullable=False)
+    archived_at = Column(DateTime, nullable=False, server_default=func.now())
+
+    def __repr__(self):
+        return f"<NoteVersionArchive(id={self.id}, note_id={self.note_id}, version={self.version}, blob_hash={self.blob_hash})>"
@@ -1,9 +1,12 @@
-from sqlalchemy import Column, Integer, String, Text
+from sqlalchemy import Column, Index, Integer, String, Text
 from sqlalchemy.orm import relationship
 from db.connection import Base
 
 class User(Base):
     __tablename__ = 'users'
+    __table_args__ = (
+        Index('uq_users_username', 'username', unique=True),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     username = Column(String(255), nullable=False)
@@ -0,0 +1,124 @@
+"""
+Production serving mode for the backend.
+
+Runs app.py under gunicorn with BE_WORKERS preforked processes of BE_THREADS
+threads each. The app is loaded once in the master before forking and every
+worker starts its own database connection pool. The TLS certificates are
+extracted once, shared by all workers and deleted when the master exits.
+Clients have to present a certificate issued by the frontend's CA unless
+BE_REQUIRE_CLIENT_CERT=false.
+
+SIGTERM drains: workers stop accepting, finish their requests for up to
+BE_GRACEFUL_TIMEOUT seconds, then exit.
+
+    cd backend && python serve.py
+"""
+import os
+import ssl
+import logging
+import multiprocessing
+from gunicorn import sock
+from gunicorn.app.base import BaseApplication
+from utils.tls import get_p12_data, delete_temp_files
+from common.logging_pipeline import setup_logging, stop_logging
+
+BE_WORKERS = int(os.getenv("BE_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+BE_THREADS = int(os.getenv("BE_THREADS", 4))
+BE_TIMEOUT = int(os.getenv("BE_TIMEOUT", 120))  # seconds a worker may stay silent before it is restarted
+BE_GRACEFUL_TIMEOUT = int(os.getenv("BE_GRACEFUL_TIMEOUT", 30))  # seconds
+LOG_FILE = "backend.log"
+BE_KEEPALIVE = int(os.getenv("BE_KEEPALIVE", 75))  # seconds an idle client connection is kept open
+BE_REQUIRE_CLIENT_CERT = os.getenv("BE_REQUIRE_CLIENT_CERT", "true").lower() != "false"
+
+class BackendServer(BaseApplication):
+    def __init__(self, options: dict):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        from app import app
+        return app
+
+shared_ssl_context = None
+
+def ssl_context(config, default_ssl_context_factory):
+    """
+    One server context for every connection of every worker. gunicorn would
+    otherwise build one per connection, with its own session ticket keys,
+    and clients could never resume a TLS session.
+    """
+    global shared_ssl_context
+    if shared_ssl_context is None:
+        shared_ssl_context = default_ssl_context_factory()
+    return shared_ssl_context
+
+def when_ready(server):
+    # Built in the master, so the forked workers share its ticket keys
+    sock.ssl_context(server.cfg)
+
+def post_fork(server, worker):
+    setup_logging(LOG_FILE)  # The log writer thread stayed in the master
+
+    # Connections opened in the master must not be shared with the children
+    from db.connection import engine
+    engine.dispose(close=False)
+
+def post_worker_init(worker):
+    from app import app
+    from db.retention import RETENTION_INTERVAL, RetentionWorker
+
+    if RETENTION_INTERVAL > 0:
+        # One per worker, only the one holding the retention lock does any work
+        RetentionWorker(RETENTION_INTERVAL, app.logger).start()
+
+def worker_exit(server, worker):
+    stop_logging()
+
+def server_options(be_cert: str, be_key: str, fe_cert: str) -> dict:
+    from app import BE_HOST, BE_PORT
+
+    options = {
+        "bind": f"{BE_HOST}:{BE_PORT}",
+        "workers": BE_WORKERS,
+        "threads": BE_THREADS,
+        "worker_class": "gthread",
+        "preload_app": True,
+        "timeout": BE_TIMEOUT,
+        "graceful_timeout": BE_GRACEFUL_TIMEOUT,
+        "keepalive": BE_KEEPALIVE,
+        "certfile": be_cert,
+        "keyfile": be_key,
+        "post_fork": post_fork,
+        "worker_exit": worker_exit,
+        "ssl_context": ssl_context,
+        "when_ready": when_ready,
+        "post_worker_init": post_worker_init
+    }
+    if BE_REQUIRE_CLIENT_CERT:
+        options["ca_certs"] = fe_cert
+        options["cert_reqs"] = ssl.CERT_REQUIRED
+    return options
+
+if __name__ == "__main__":
+    setup_logging(LOG_FILE)
+    logger = logging.getLogger("serve")
+    logger.info("Starting backend server")
+
+    from app import P12_PATH, P12_PWD
+    logger.info("Loading server certificates for tls")
+    be_cert, be_key, fe_cert = get_p12_data(P12_PATH, P12_PWD)
+    logger.info("Certificates loaded successfully")
+
+    master_pid = os.getpid()
+    try:
+        logger.info(f"Serving with {BE_WORKERS} workers of {BE_THREADS} threads")
+        BackendServer(server_options(be_cert, be_key, fe_cert)).run()
+    finally:
+        # Exiting workers unwind through here too, but the certificates are only removed with the master
+        if os.getpid() == master_pid:
+            delete_temp_files([be_cert, be_key, fe_cert])  # Cleanup certificates
+            stop_logging()
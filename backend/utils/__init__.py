@@ -0,0 +1,7 @@
+import os
+import sys
+
+# common/ lives next to the app directories, every entry point imports utils before anything from it
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if REPO_ROOT not in sys.path:
+    sys.path.append(REPO_ROOT)
@@ -0,0 +1,78 @@
+"""
+Request/response bodies for the note endpoints.
+
+Ciphertext is stored as raw bytes. Clients that send or accept
+application/msgpack exchange those bytes as-is; JSON clients keep sending and
+receiving them base64 encoded, as before.
+"""
+import base64
+import binascii
+from flask import Response, abort, jsonify
+
+try:
+    import msgpack
+except ImportError:  # msgpack is optional, JSON is always available
+    msgpack = None
+
+JSON_MIMETYPE = 'application/json'
+MSGPACK_MIMETYPE = 'application/msgpack'
+BINARY_FIELDS = ('iv', 'encrypted_note', 'note_tag', 'ciphered_note_key')
+
+def decode_binary_fields(data):
+    """Turn base64 strings in binary fields into bytes, at any nesting level."""
+    if isinstance(data, list):
+        return [decode_binary_fields(item) for item in data]
+
+    if not isinstance(data, dict):
+        return data
+
+    decoded = {}
+    for key, value in data.items():
+        if key in BINARY_FIELDS and isinstance(value, str):
+            try:
+                decoded[key] = base64.b64decode(value, validate=True)
+            except binascii.Error:
+                abort(400, description=f"Invalid base64 in field {key}")
+        else:
+            decoded[key] = decode_binary_fields(value)
+    return decoded
+
+def encode_binary_fields(data):
+    """Base64 encode every bytes value so the payload can be serialized as JSON."""
+    if isinstance(data, bytes):
+        return base64.b64encode(data).decode()
+    if isinstance(data, list):
+        return [encode_binary_fields(item) for item in data]
+    if isinstance(data, dict):
+        return {key: encode_binary_fields(value) for key, value in data.items()}
+    return data
+
+def parse_body(request):
+    """Parsed request body with binary fields as bytes, None when there is no body."""
+    if request.mimetype == MSGPACK_MIMETYPE:
+        if msgpack is None:
+            abort(415, description="MessagePack bodies are not supported by this server")
+        try:
+            data = msgpack.unpackb(request.get_data(), raw=False)
+        except ValueError:
+            abort(400, description="Invalid MessagePack body")
+    else:
+        data = request.get_json(silent=True)
+
+    return decode_binary_fields(data)
+
+def response_mimetype(request) -> str:
+    if msgpack is not None and request.accept_mimetypes.best_match([JSON_MIMETYPE, MSGPACK_MIMETYPE]) == MSGPACK_MIMETYPE:
+        return MSGPACK_MIMETYPE
+    return JSON_MIMETYPE
+
+def make_body_response(request, payload, status: int = 200):
+    """Serialize payload in the format negotiated through the Accept header."""
+    if response_mimetype(request) == MSGPACK_MIMETYPE:
+        response = Response(msgpack.packb(payload, use_bin_type=True), status, mimetype=MSGPACK_MIMETYPE)
+    else:
+        response = jsonify(encode_binary_fields(payload))
+        response.status_code = status
+
+    response.vary.add('Accept')
+    return response
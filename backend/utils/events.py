@@ -0,0 +1,214 @@
+"""
+In-process pub/sub hub pushing note changes to connected clients.
+
+Write paths record their changes with record_changes(); once the transaction
+commits they are published here and fanned out to the subscribers that
+collaborate on the note. Events are coalesced per note, so a subscriber holds
+at most one pending event per note, and at most EVENTS_BUFFER_NOTES of those:
+a subscriber that falls further behind is dropped and has to resync through
+/changes instead of growing its buffer.
+
+Each open stream pins one of the BE_THREADS threads of its worker, so a worker
+holds at most EVENTS_MAX_SUBSCRIBERS of them, half its threads by default and
+never all of them, and the others stay free for requests. Each stream also ends
+after EVENTS_STREAM_SECONDS, or sooner if the client asks with ?timeout=.
+
+The hub only sees commits made by its own process. With several backend
+workers a subscriber misses changes written elsewhere until it reconnects and
+resyncs, so events are a hint to sync early, /changes stays the source of truth.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from flask import abort
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from models.change_log import COLLABORATOR_ADDED
+
+BE_THREADS = int(os.getenv("BE_THREADS", 4))  # threads per worker, as in serve.py
+EVENTS_BUFFER_NOTES = int(os.getenv("EVENTS_BUFFER_NOTES", 256))
+EVENTS_MAX_SUBSCRIBERS = min(int(os.getenv("EVENTS_MAX_SUBSCRIBERS", BE_THREADS // 2)), BE_THREADS - 1)
+EVENTS_HEARTBEAT = float(os.getenv("EVENTS_HEARTBEAT", 15))  # seconds between keep-alive comments
+EVENTS_STREAM_SECONDS = float(os.getenv("EVENTS_STREAM_SECONDS", 300))
+
+EVENT_STREAM_MIMETYPE = 'text/event-stream'
+NOTE_SHARED = 'note_shared'  # sent to the user a note was just shared with
+
+class Subscription:
+    """One connected client: the notes it watches and its pending events, keyed by note id."""
+
+    def __init__(self, user_id: int, titles: dict, max_notes: int):
+        self.user_id = user_id
+        self.titles = titles  # note_id -> title
+        self.max_notes = max_notes
+        self.dropped = False
+        self._pending = OrderedDict()
+        self._condition = threading.Condition()
+
+    def push(self, note_id: int, kind: str, version: int = None) -> bool:
+        """Queue a change, merged into the note's pending event. False if the subscriber got dropped."""
+        with self._condition:
+            if self.dropped:
+                return False
+
+            pending = self._pending.get(note_id)
+            if pending is None:
+                if len(self._pending) >= self.max_notes:
+                    self.dropped = True
+                    self._pending.clear()
+                    self._condition.notify()
+                    return False
+                pending = self._pending[note_id] = {"changes": [], "version": None}
+
+            if kind not in pending["changes"]:
+                pending["changes"].append(kind)
+            if version is not None:
+                pending["version"] = max(version, pending["version"] or 0)
+            self._condition.notify()
+            return True
+
+    def wait(self, timeout: float) -> list:
+        """Take the pending (note_id, event) pairs, waiting up to timeout for one to arrive."""
+        with self._condition:
+            if not self._pending and not self.dropped:
+                self._condition.wait(timeout)
+            events = list(self._pending.items())
+            self._pending.clear()
+            return events
+
+class EventHub:
+    """Routes committed changes to the subscriptions watching each note."""
+
+    def __init__(self, max_subscribers: int, buffer_notes: int):
+        self.max_subscribers = max_subscribers
+        self.buffer_notes = buffer_notes
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.rejected = 0
+        self._by_note = defaultdict(set)
+        self._by_user = defaultdict(set)
+        self._subscribers = 0
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id: int, titles: dict) -> Subscription:
+        """Watch the notes in titles for user_id. Aborts with 503 past max_subscribers."""
+        subscription = Subscription(user_id, dict(titles), self.buffer_notes)
+        with self._lock:
+            if self._subscribers >= self.max_subscribers:
+                self.rejected += 1
+                abort(503, description="Too many event streams open, try again later")
+
+            self._subscribers += 1
+            self._by_user[user_id].add(subscription)
+            for note_id in subscription.titles:
+                self._by_note[note_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            self._discard(subscription)
+
+    def publish(self, changes: list):
+        """Fan change_entry() dicts out to the subscribers of their notes."""
+        with self._lock:
+            self.published += len(changes)
+            for change in changes:
+                note_id = change["note_id"]
+                if change["kind"] == COLLABORATOR_ADDED:
+                    for subscription in list(self._by_user.get(change["collaborator_id"], ())):
+                        if note_id not in subscription.titles:
+                            subscription.titles[note_id] = None  # resolved by the stream
+                            self._by_note[note_id].add(subscription)
+                            self._deliver(subscription, note_id, NOTE_SHARED)
+
+                for subscription in list(self._by_note.get(note_id, ())):
+                    self._deliver(subscription, note_id, change["kind"], change["version"])
+
+    def _deliver(self, subscription: Subscription, note_id: int, kind: str, version: int = None):
+        if subscription.push(note_id, kind, version):
+            self.delivered += 1
+        else:
+            self.dropped += 1
+            self._discard(subscription)
+
+    def _discard(self, subscription: Subscription):
+        subscribers = self._by_user.get(subscription.user_id)
+        if subscribers is None or subscription not in subscribers:
+            return
+
+        self._subscribers -= 1
+        subscribers.discard(subscription)
+        if not subscribers:
+            del self._by_user[subscription.user_id]
+        for note_id in subscription.titles:
+            watchers = self._by_note.get(note_id)
+            if watchers is not None:
+                watchers.discard(subscription)
+                if not watchers:
+                    del self._by_note[note_id]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "subscribers": self._subscribers,
+                "max_subscribers": self.max_subscribers,
+                "watched_notes": len(self._by_note),
+                "published": self.published,
+                "delivered": self.delivered,
+                "dropped": self.dropped,
+                "rejected": self.rejected
+            }
+
+event_hub = EventHub(EVENTS_MAX_SUBSCRIBERS, EVENTS_BUFFER_NOTES)
+
+def format_event(name: str, data: dict) -> str:
+    return f"event: {name}\ndata: {json.dumps(data)}\n\n"
+
+def parse_stream_seconds(args) -> float:
+    """Parse ?timeout=<seconds> of an events request, capped at EVENTS_STREAM_SECONDS."""
+    try:
+        seconds = float(args.get('timeout', EVENTS_STREAM_SECONDS))
+    except ValueError:
+        abort(400, description="Invalid timeout")
+    if not seconds >= 0:
+        abort(400, description="Invalid timeout")
+
+    return min(seconds, EVENTS_STREAM_SECONDS)
+
+def generate_events(subscription: Subscription, resolve_titles, stream_seconds: float = None):
+    """
+    Server-sent events for subscription until it is dropped or the stream times
+    out. resolve_titles(note_ids) -> {note_id: title} names newly shared notes.
+    """
+    deadline = time.monotonic() + (EVENTS_STREAM_SECONDS if stream_seconds is None else stream_seconds)
+    try:
+        yield ": connected\n\n"
+        while (remaining := deadline - time.monotonic()) > 0:
+            events = subscription.wait(min(EVENTS_HEARTBEAT, remaining))
+            if subscription.dropped:
+                yield format_event("dropped", {"reason": "Too many pending changes, resync with /changes"})
+                return
+            if not events:
+                yield ": heartbeat\n\n"
+                continue
+
+            unknown = [note_id for note_id, _ in events if subscription.titles.get(note_id) is None]
+            if unknown:
+                subscription.titles.update(resolve_titles(unknown))
+            for note_id, pending in events:
+                yield format_event("note", {"title": subscription.titles.get(note_id), **pending})
+    finally:
+        event_hub.unsubscribe(subscription)
+
+@event.listens_for(Session, "after_commit")
+def publish_committed_changes(session):
+    changes = session.info.pop("recorded_changes", None)
+    if changes:
+        event_hub.publish(changes)
+
+@event.listens_for(Session, "after_rollback")
+def forget_recorded_changes(session):
+    session.info.pop("recorded_changes", None)
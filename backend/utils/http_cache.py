@@ -0,0 +1,27 @@
+import hashlib
+from flask import make_response
+
+# Versions are immutable, but responses carry the caller's note key so keep them private
+IMMUTABLE_CACHE_CONTROL = "private, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "private, no-cache"
+
+def make_etag(*parts) -> str:
+    return hashlib.sha1("\x1f".join(str(part) for part in parts).encode()).hexdigest()
+
+def note_version_etag(note_title: str, version, mimetype: str) -> str:
+    # (note_title, version) always maps to the same ciphertext, so no lookup is needed
+    return make_etag("note-version", note_title, int(version), mimetype)
+
+def listing_etag(revision: str, query_string: bytes, mimetype: str) -> str:
+    return make_etag("notes", revision, query_string.decode(), mimetype)
+
+def is_not_modified(request, etag: str) -> bool:
+    return request.if_none_match.contains(etag)
+
+def set_cache_headers(response, etag: str, cache_control: str):
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+def not_modified(etag: str, cache_control: str):
+    return set_cache_headers(make_response("", 304), etag, cache_control)
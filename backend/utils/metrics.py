@@ -0,0 +1,49 @@
+"""
+Request metrics of the backend, served on /metrics. The metric types and the
+scrape token check live in common/metrics.py.
+"""
+import time
+from flask import Response, g, make_response, request
+from common.metrics import PROMETHEUS_MIMETYPE, MetricsRegistry, scrape_allowed
+
+registry = MetricsRegistry("notist_backend")
+
+request_duration = registry.histogram(
+    "http_request_duration_seconds", "Time spent serving a request, by route", ("endpoint", "method"))
+requests_total = registry.counter(
+    "http_requests_total", "Requests served, by route and status code", ("endpoint", "method", "status"))
+requests_in_flight = registry.gauge(
+    "http_requests_in_flight", "Requests being served right now, by route", ("endpoint",))
+
+def route_label() -> str:
+    return request.endpoint or "unmatched"
+
+def instrument_app(app):
+    """Time every request and add the /metrics route."""
+
+    @app.before_request
+    def start_request_timer():
+        g.metrics_started = time.perf_counter()
+        requests_in_flight.inc(endpoint=route_label())
+
+    @app.after_request
+    def record_status(response):
+        g.metrics_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def record_request(exc):
+        started = g.pop("metrics_started", None)
+        if started is None:
+            return
+        endpoint, method = route_label(), request.method
+        requests_in_flight.dec(endpoint=endpoint)
+        request_duration.observe(time.perf_counter() - started, endpoint=endpoint, method=method)
+        requests_total.inc(endpoint=endpoint, method=method, status=g.pop("metrics_status", 500))
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        if not scrape_allowed(request.headers.get('Authorization')):
+            # Same answer with or without a token configured, the route does not exist for clients
+            return make_response({"error": "Not found"}, 404)
+        return Response(registry.render(), mimetype=PROMETHEUS_MIMETYPE)
@@ -0,0 +1,82 @@
+import base64
+import binascii
+from flask import abort
+
+DEFAULT_PAGE_LIMIT = 50
+MAX_PAGE_LIMIT = 500
+MAX_VERSION_RANGE = 100
+NOTE_ROLES = ('owner', 'editor', 'viewer')
+NOTE_FIELDS = ('full', 'summary')
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+def encode_cursor(note_id: int) -> str:
+    return base64.urlsafe_b64encode(str(note_id).encode()).decode()
+
+def decode_cursor(cursor: str) -> int:
+    try:
+        return int(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        abort(400, description="Invalid cursor")
+
+def parse_page_args(args) -> tuple:
+    """Parse ?after=<cursor>&limit=N&role=<role> into (after_note_id, limit, role)."""
+    after = args.get('after')
+    after_note_id = decode_cursor(after) if after else None
+
+    try:
+        limit = int(args.get('limit', DEFAULT_PAGE_LIMIT))
+    except ValueError:
+        abort(400, description="Invalid limit")
+    if not 0 < limit <= MAX_PAGE_LIMIT:
+        abort(400, description=f"Limit must be between 1 and {MAX_PAGE_LIMIT}")
+
+    return after_note_id, limit, parse_role_arg(args)
+
+def parse_changes_args(args) -> tuple:
+    """Parse ?since=<seq>&limit=N of a change log request into (since, limit)."""
+    try:
+        since = int(args.get('since', 0))
+        limit = int(args.get('limit', DEFAULT_PAGE_LIMIT))
+    except ValueError:
+        abort(400, description="Invalid since or limit")
+    if since < 0:
+        abort(400, description="Invalid since")
+    if not 0 < limit <= MAX_PAGE_LIMIT:
+        abort(400, description=f"Limit must be between 1 and {MAX_PAGE_LIMIT}")
+
+    return since, limit
+
+def parse_version_range_args(args) -> tuple:
+    """Parse ?from=<version>&to=<version> of a range fetch into (first, last), both inclusive."""
+    try:
+        first = int(args['from'])
+        last = int(args['to'])
+    except (KeyError, ValueError):
+        abort(400, description="from and to must be version numbers")
+    if not 0 < first <= last:
+        abort(400, description="Invalid version range")
+    if last - first + 1 > MAX_VERSION_RANGE:
+        abort(400, description=f"At most {MAX_VERSION_RANGE} versions can be fetched at once")
+
+    return first, last
+
+def parse_role_arg(args) -> str:
+    role = args.get('role')
+    if role is not None and role not in NOTE_ROLES:
+        abort(400, description=f"Invalid role. Role must be one of {', '.join(NOTE_ROLES)}")
+    return role
+
+def parse_fields_arg(args) -> bool:
+    """True if ?fields=summary asks for the note list without ciphertext."""
+    fields = args.get('fields', 'full')
+    if fields not in NOTE_FIELDS:
+        abort(400, description=f"Invalid fields. Fields must be one of {', '.join(NOTE_FIELDS)}")
+    return fields == 'summary'
+
+def wants_ndjson(request) -> bool:
+    if request.args.get('format') == 'ndjson':
+        return True
+    return request.accept_mimetypes.best_match(['application/json', NDJSON_MIMETYPE]) == NDJSON_MIMETYPE
+
+def is_paged_request(args) -> bool:
+    return 'after' in args or 'limit' in args
@@ -0,0 +1,130 @@
+"""
+Argon2 password hashing, run off the request thread in a bounded pool.
+
+Verifications are handed to a thread pool (argon2 releases the GIL while hashing)
+and at most PASSWORD_QUEUE_LIMIT of them may be pending at once; past that,
+logins are refused with 503 rather than queueing behind each other and holding
+workers that note reads need. Hashes made with outdated cost parameters, and
+legacy plaintext passwords, are rehashed on the next successful login.
+"""
+import hmac
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError, VerifyMismatchError
+from flask import abort
+
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", 3))
+ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST", 64 * 1024))  # KiB
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", 1))
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", os.cpu_count() or 1))
+PASSWORD_QUEUE_LIMIT = int(os.getenv("PASSWORD_QUEUE_LIMIT", 4 * PASSWORD_WORKERS))
+PASSWORD_TIMEOUT = float(os.getenv("PASSWORD_TIMEOUT", 10))  # seconds
+
+ARGON2_PREFIX = "$argon2"
+
+class PasswordVerifier:
+    """Bounded pool of password verifications, with latency and queue counters."""
+
+    def __init__(self, hasher: PasswordHasher, workers: int, queue_limit: int, timeout: float):
+        self.hasher = hasher
+        self.queue_limit = queue_limit
+        self.timeout = timeout
+        self.workers = workers
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.verifications = 0
+        self.failures = 0
+        self.rejected = 0
+        self.rehashes = 0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password")
+        self._lock = threading.Lock()
+
+    def verify(self, stored_hash: str, password: str, logger):
+        """
+        Check password against stored_hash in the pool. Returns (matches, new_hash),
+        new_hash being set when the stored hash has to be replaced.
+        Aborts with 503 when too many verifications are already pending.
+        """
+        with self._lock:
+            if self.in_flight >= self.queue_limit:
+                self.rejected += 1
+                logger.error(f"Password verification queue full ({self.in_flight} pending)")
+                abort(503, description="Too many login attempts in progress, try again later")
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+        started = time.perf_counter()
+        try:
+            future = self._executor.submit(self._check, stored_hash, password)
+        except BaseException:
+            self._release()
+            raise
+        # A job counts against queue_limit until it is done or cancelled, not until its caller gave up on it
+        future.add_done_callback(self._release)
+
+        try:
+            matches, new_hash = future.result(self.timeout)
+        except FutureTimeoutError:
+            future.cancel()  # only works while it is still queued, a running hash finishes and releases then
+            logger.error(f"Password verification timed out after {self.timeout} seconds")
+            abort(503, description="Login timed out, try again later")
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.verifications += 1
+                self.latency_sum += elapsed
+                self.latency_max = max(self.latency_max, elapsed)
+
+        with self._lock:
+            if not matches:
+                self.failures += 1
+            if new_hash is not None:
+                self.rehashes += 1
+        return matches, new_hash
+
+    def _release(self, future=None):
+        with self._lock:
+            self.in_flight -= 1
+
+    def _check(self, stored_hash: str, password: str):
+        if not stored_hash.startswith(ARGON2_PREFIX):
+            # Stored before hashing was introduced
+            if not hmac.compare_digest(stored_hash.encode(), password.encode()):
+                return False, None
+            return True, self.hasher.hash(password)
+
+        try:
+            self.hasher.verify(stored_hash, password)
+        except (VerifyMismatchError, VerificationError, InvalidHashError):
+            return False, None
+
+        if self.hasher.check_needs_rehash(stored_hash):
+            return True, self.hasher.hash(password)
+        return True, None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queue_limit": self.queue_limit,
+                "in_flight": self.in_flight,
+                "max_in_flight": self.max_in_flight,
+                "verifications": self.verifications,
+                "failures": self.failures,
+                "rejected": self.rejected,
+                "rehashes": self.rehashes,
+                "latency_seconds_sum": self.latency_sum,
+                "latency_seconds_max": self.latency_max
+            }
+
+password_verifier = PasswordVerifier(
+    PasswordHasher(time_cost=ARGON2_TIME_COST, memory_cost=ARGON2_MEMORY_COST, parallelism=ARGON2_PARALLELISM),
+    PASSWORD_WORKERS,
+    PASSWORD_QUEUE_LIMIT,
+    PASSWORD_TIMEOUT
+)
@@ -1,9 +1,12 @@
 import tempfile
 import os
+import logging
 from cryptography.hazmat.primitives import serialization
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives.serialization import pkcs12
 
+logger = logging.getLogger(__name__)
+
 def get_p12_data(p12_path: str, p12_pwd: str) -> tuple[str, str, str]:
     private_key, certificate, other_certs = pkcs12.load_key_and_certificates(
         open(p12_path, 'rb').read(), 
@@ -34,8 +37,8 @@ def delete_temp_files(temp_files: list):
     for temp_file in temp_files:
         try:
             os.unlink(temp_file)
-            print(f"Deleted temp file: {temp_file}")
+            logger.info(f"Deleted temp file: {temp_file}")
         except FileNotFoundError:
-            print(f"Temp file not found (already deleted): {temp_file}")
+            logger.info(f"Temp file not found (already deleted): {temp_file}")
         except Exception as e:
-            print(f"Error deleting temp file {temp_file}: {e}")
\ No newline at end of file
+            logger.error(f"Error deleting temp file {temp_file}: {e}")
\ No newline at end of file
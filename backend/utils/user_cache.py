@@ -0,0 +1,155 @@
+"""
+In-process cache of username -> (id, public key).
+
+Entries expire after USER_CACHE_TTL seconds and the least recently used ones are
+evicted past USER_CACHE_MAX_ENTRIES. Users changed through the ORM are invalidated
+when the change is flushed and again when it commits; writes that bypass the ORM
+(migrations, manual SQL) are only picked up once the entry expires.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from db.queries import fetch_user_identities, fetch_user_identity
+from models.user import User
+
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", 10000))
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", 60))  # seconds
+
+UserIdentity = namedtuple('UserIdentity', ['id', 'username', 'public_key'])
+
+class UserIdentityCache:
+    """Bounded TTL/LRU cache of UserIdentity by username. Unknown usernames are not cached."""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._usernames_by_id = {}
+        self._lock = threading.Lock()
+
+    def get(self, username: str) -> UserIdentity:
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            identity, expires_at = entry
+            if expires_at <= time.monotonic():
+                self._remove(username)
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(username)
+            self.hits += 1
+            return identity
+
+    def put(self, identity: UserIdentity):
+        with self._lock:
+            self._remove(identity.username)
+            self._entries[identity.username] = (identity, time.monotonic() + self.ttl)
+            self._usernames_by_id[identity.id] = identity.username
+
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, username: str = None, user_id: int = None):
+        """Drop the entry for username and the one cached for user_id, whatever its username was."""
+        with self._lock:
+            for key in {username, self._usernames_by_id.get(user_id)}:
+                if key is not None and self._remove(key):
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._usernames_by_id.clear()
+
+    def _remove(self, username: str) -> bool:
+        entry = self._entries.pop(username, None)
+        if entry is None:
+            return False
+        self._usernames_by_id.pop(entry[0].id, None)
+        return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "expirations": self.expirations,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations
+            }
+
+user_cache = UserIdentityCache(USER_CACHE_MAX_ENTRIES, USER_CACHE_TTL)
+
+def get_user_identity(session: Session, username: str) -> UserIdentity:
+    """The user's (id, username, public_key), from the cache or the database. None if unknown."""
+    identity = user_cache.get(username)
+    if identity is not None:
+        return identity
+
+    row = fetch_user_identity(session, username)
+    if row is None:
+        return None
+
+    identity = UserIdentity(row.id, row.username, row.public_key)
+    user_cache.put(identity)
+    return identity
+
+def get_user_identities(session: Session, usernames: list) -> dict:
+    """Map each known username to its UserIdentity. Cache misses are resolved with one query."""
+    identities, missing = {}, []
+    for username in usernames:
+        identity = user_cache.get(username)
+        if identity is not None:
+            identities[username] = identity
+        else:
+            missing.append(username)
+
+    for row in fetch_user_identities(session, missing):
+        identity = UserIdentity(row.id, row.username, row.public_key)
+        user_cache.put(identity)
+        identities[identity.username] = identity
+
+    return identities
+
+def cache_keys(user: User) -> tuple:
+    """(username, id) of a flushed user, read without loading anything from the database."""
+    state = inspect(user)
+    return state.dict.get('username'), state.identity[0] if state.identity else None
+
+@event.listens_for(Session, "after_flush")
+def invalidate_flushed_users(session, flush_context):
+    changed = session.info.setdefault("invalidated_users", set())
+    for instance in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(instance, User):
+            # By id too, the previous username is not loaded if the user was expired
+            changed.add(cache_keys(instance))
+
+    for username, user_id in changed:
+        user_cache.invalidate(username, user_id)
+
+@event.listens_for(Session, "after_commit")
+def invalidate_committed_users(session):
+    # Readers may have cached the old row between the flush and the commit
+    for username, user_id in session.info.pop("invalidated_users", ()):
+        user_cache.invalidate(username, user_id)
+
+@event.listens_for(Session, "after_rollback")
+def forget_invalidated_users(session):
+    session.info.pop("invalidated_users", None)
@@ -0,0 +1,139 @@
+"""
+Offline load test for every route of the backend and the frontend.
+
+Seeds a SQLite stand-in for the database with synthetic users, notes, version
+histories and collaborators, then drives each route at the given concurrency
+and reports p50/p95/p99 latency, requests per second and queries per request.
+Results are written as JSON, pass a previous file as --baseline to compare:
+
+    python -m bench --concurrency 8 --requests 400
+    python -m bench --baseline bench/results/<previous>.json
+
+Exits non-zero if a route has no scenario or a scenario got an unexpected
+status. Absolute numbers depend on SQLite and the machine, compare runs made
+on the same one.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+from bench.apps import create_database_engine, load_backend, load_frontend
+from bench.runner import QueryCounter, compare_results, run_scenario
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the notist backend and frontend routes offline")
+    parser.add_argument("--concurrency", type=int, default=4, help="Worker threads per scenario")
+    parser.add_argument("--requests", type=int, default=200, help="Timed requests per scenario")
+    parser.add_argument("--warmup", type=int, default=5, help="Untimed requests per worker before each scenario")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--notes-per-user", type=int, default=10)
+    parser.add_argument("--versions-per-note", type=int, default=30)
+    parser.add_argument("--collaborators-per-note", type=int, default=10)
+    parser.add_argument("--note-bytes", type=int, default=1024, help="Ciphertext size of each version")
+    parser.add_argument("--apps", nargs="+", choices=["backend", "frontend"], default=["backend", "frontend"])
+    parser.add_argument("--scenarios", nargs="+", default=None, help="Only run these scenarios")
+    parser.add_argument("--output", type=Path, default=None, help="Results file, defaults to bench/results/<time>.json")
+    parser.add_argument("--baseline", type=Path, default=None, help="Results of a previous run to compare with")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    started = time.strftime("%Y%m%d-%H%M%S")
+    output = args.output or RESULTS_DIR / f"{started}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+
+    # The apps log through the root logger into the log file, the benchmark's own progress goes to stderr
+    logger = logging.getLogger("bench")
+    logger.addHandler(logging.StreamHandler(sys.stderr))
+    logger.handlers[0].setFormatter(logging.Formatter("%(asctime)s - %(message)s"))
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+    with tempfile.TemporaryDirectory(prefix="notist-bench-") as workdir:
+        engine = create_database_engine(os.path.join(workdir, "notist.db"), args.concurrency)
+        backend = load_backend(engine)
+        frontend = load_frontend(backend.app)
+        backend.setup_logging(str(output.with_suffix(".log")), console=False)
+
+        # These need the backend's db and models packages, importable once it is loaded
+        from db.connection import SessionLocal
+        from bench.dataset import BENCH_PASSWORD, seed_dataset
+        from bench.scenarios import HELD_STREAMS, Workload, build_scenarios, uncovered_routes
+
+        try:
+            with SessionLocal() as session:
+                dataset = seed_dataset(
+                    session, args.users, args.notes_per_user, args.versions_per_note, args.collaborators_per_note,
+                    args.note_bytes, backend.password_verifier.hasher.hash(BENCH_PASSWORD), logger
+                )
+
+            workload = Workload(dataset, args.note_bytes, SessionLocal)
+            workload.sign_tokens(frontend.app, max(args.concurrency, HELD_STREAMS))
+            counter = QueryCounter(engine)
+
+            results = []
+            uncovered = {}
+            for side, app in (("backend", backend.app), ("frontend", frontend.app)):
+                if side not in args.apps:
+                    continue
+
+                scenarios = build_scenarios(workload, side)
+                uncovered[side] = uncovered_routes(app, scenarios)
+                for route in uncovered[side]:
+                    logger.error(f"{side}: no scenario covers {route}")
+
+                for scenario in scenarios:
+                    if args.scenarios and scenario.name not in args.scenarios:
+                        continue
+
+                    result = {"app": side, **run_scenario(app, scenario, args.concurrency, args.requests, args.warmup, counter)}
+                    results.append(result)
+                    latency = result["latency_ms"]
+                    logger.info(f"{side} {scenario.name}: {result['requests_per_second']} req/s, "
+                                f"p50 {latency['p50']} ms, p95 {latency['p95']} ms, p99 {latency['p99']} ms, "
+                                f"{result['queries_per_request']['mean']} queries/req, statuses {result['status_counts']}")
+                    if result["unexpected_status"]:
+                        logger.error(f"{side} {scenario.name}: {result['unexpected_status']} unexpected responses")
+                    if "streams" in result:
+                        streams = result["streams"]
+                        logger.info(f"{side} {scenario.name}: held {streams['held']} event streams open, "
+                                    f"{streams['chunks']} chunks received")
+                        if streams["rejected"]:
+                            logger.error(f"{side} {scenario.name}: {streams['rejected']} event streams rejected")
+        finally:
+            backend.stop_logging()
+            engine.dispose()
+
+    report = {
+        "started_at": started,
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "sqlite": sqlite3.sqlite_version,
+            "cpus": os.cpu_count()
+        },
+        "config": {key: (str(value) if isinstance(value, Path) else value) for key, value in vars(args).items()},
+        "uncovered_routes": uncovered,
+        "results": results
+    }
+    output.write_text(json.dumps(report, indent=2))
+    logger.info(f"Results written to {output}")
+
+    if args.baseline is not None:
+        for line in compare_results(report, json.loads(args.baseline.read_text())):
+            logger.info(line)
+
+    failed = (any(uncovered.values()) or any(result["unexpected_status"] for result in results)
+              or any(result.get("streams", {}).get("rejected") for result in results))
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
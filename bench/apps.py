@@ -0,0 +1,200 @@
+"""
+Loads the backend and the frontend into the benchmark process.
+
+The backend runs on a SQLite file instead of MySQL and the frontend reaches it
+through BackendWsgiAdapter, which calls the backend WSGI app in the calling
+thread instead of going over mTLS. No network access or external service is
+needed, but everything between the HTTP request and the database (routing,
+codecs, caches, query builders, logging) is the production code.
+"""
+import contextvars
+import io
+import os
+import queue
+import secrets
+import sys
+import threading
+from pathlib import Path
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+from sqlalchemy import create_engine, event, insert
+from sqlalchemy.dialects.mysql.dml import OnDuplicateClause
+from sqlalchemy.ext.compiler import compiles
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+BACKEND_DIR = REPO_DIR / "backend"
+FRONTEND_DIR = REPO_DIR / "frontend"
+
+# Host the frontend is told the backend lives on, only ever resolved by BackendWsgiAdapter
+BACKEND_URL = "https://backend.bench"
+
+MYSQL_PLACEHOLDERS = {"DB_HOST": "localhost", "DB_PORT": "3306", "MYSQL_DB": "notist", "MYSQL_USER": "bench", "MYSQL_PWD": "bench"}
+
+# Top level modules both apps define, the frontend gets its own copy
+SHARED_MODULES = ("app", "utils")
+
+def create_database_engine(path: str, pool_size: int):
+    """SQLite engine for the benchmark database. WAL lets readers run while a writer commits."""
+    engine = create_engine(
+        f"sqlite:///{path}",
+        connect_args={"check_same_thread": False, "timeout": 30},
+        pool_size=pool_size,
+        max_overflow=pool_size,
+    )
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+
+    return engine
+
+@compiles(OnDuplicateClause, "sqlite")
+def compile_on_duplicate_key_update(clause, compiler, **kw):
+    """
+    Render MySQL's ON DUPLICATE KEY UPDATE as SQLite's upsert, so the backend's
+    MySQL-only statements run unchanged on the benchmark database. Covers the
+    update expressions the backend uses; stmt.inserted references are not translated.
+    """
+    table = clause.inserted_alias.element
+    target = ", ".join(compiler.preparer.quote(column.name) for column in table.primary_key)
+    assignments = ", ".join(
+        f"{compiler.preparer.quote(name)} = {compiler.process(value, **kw)}" for name, value in clause.update.items()
+    )
+    return f"ON CONFLICT ({target}) DO UPDATE SET {assignments}"
+
+def forget_modules(names: tuple):
+    for module in list(sys.modules):
+        if module.split(".")[0] in names:
+            del sys.modules[module]
+
+def load_backend(engine):
+    """Import backend/app.py with its sessions bound to engine and create the schema."""
+    os.environ.setdefault("JWT_SECRET_KEY", secrets.token_hex(32))
+    # /metrics answers 404 without it, the metrics scenario sends it as a scraper would
+    os.environ.setdefault("METRICS_TOKEN", secrets.token_hex(16))
+    # db/connection.py creates its MySQL engine on import, it is swapped out before it ever connects
+    for name, value in MYSQL_PLACEHOLDERS.items():
+        os.environ.setdefault(name, value)
+    # Streams held open during a scenario see a heartbeat often enough to close soon after it ends
+    os.environ.setdefault("EVENTS_HEARTBEAT", "0.05")
+
+    sys.path.insert(0, str(BACKEND_DIR))
+    try:
+        import db.connection as connection
+        connection.engine = engine
+        connection.SessionLocal.configure(bind=engine)
+
+        import app as backend
+        from models.note_version_archive import NoteVersionArchive  # only referenced by retention
+        from models.change_counter import CHANGE_COUNTER_ID, ChangeCounter
+        backend.engine = engine
+        connection.Base.metadata.create_all(engine)
+        # Seeded by migration 9 on MySQL, create_all only makes the empty table
+        with engine.begin() as transaction:
+            transaction.execute(insert(ChangeCounter).values(id=CHANGE_COUNTER_ID, last_seq=0))
+    finally:
+        sys.path.remove(str(BACKEND_DIR))
+
+    forget_modules(SHARED_MODULES)
+    return backend
+
+def load_frontend(backend_app):
+    """Import frontend/app.py with its backend session calling backend_app in-process."""
+    sys.path.insert(0, str(FRONTEND_DIR))
+    try:
+        import app as frontend
+    finally:
+        sys.path.remove(str(FRONTEND_DIR))
+
+    forget_modules(SHARED_MODULES)
+
+    session = requests.Session()
+    session.mount(BACKEND_URL, BackendWsgiAdapter(backend_app))
+    frontend.BACKEND_URL = BACKEND_URL
+    frontend.session = frontend.instrument_backend_session(session)
+    return frontend
+
+class BackendWsgiAdapter(BaseAdapter):
+    """requests transport adapter that serves requests with a WSGI app instead of a socket."""
+
+    def __init__(self, app):
+        super().__init__()
+        self.app = app
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        url = urlsplit(request.url)
+        path = f"{url.path}?{url.query}" if url.query else url.path
+
+        # One client per call, test clients are not meant to be shared between threads
+        client = self.app.test_client(use_cookies=False)
+        if stream:
+            raw = StreamedBody(lambda: client.open(path, method=request.method, headers=dict(request.headers),
+                                                   data=request.body, buffered=False))
+            wsgi_response = raw.wsgi_response
+        else:
+            wsgi_response = client.open(path, method=request.method, headers=dict(request.headers), data=request.body)
+            raw = io.BytesIO(wsgi_response.get_data())
+
+        response = requests.Response()
+        response.status_code = wsgi_response.status_code
+        response.headers = CaseInsensitiveDict(wsgi_response.headers)
+        response.raw = raw
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+    def close(self):
+        pass
+
+class StreamedBody:
+    """
+    Raw body of a streamed response. The WSGI app serves the request in a
+    thread of its own, like a separate server would, so its app context is
+    pushed and popped there and never mixes with the one of the app reading it.
+    """
+
+    def __init__(self, open_response):
+        self.chunks = queue.Queue()
+        self.closed = threading.Event()
+        opened = queue.Queue(maxsize=1)
+        # A copy of the caller's context, the statements the app sends count toward the caller's request
+        context = contextvars.copy_context()
+        threading.Thread(target=context.run, args=(self.produce, open_response, opened), daemon=True).start()
+
+        self.wsgi_response = opened.get()
+        if isinstance(self.wsgi_response, Exception):
+            raise self.wsgi_response
+
+    def produce(self, open_response, opened: queue.Queue):
+        try:
+            wsgi_response = open_response()
+        except Exception as e:
+            opened.put(e)
+            return
+
+        opened.put(wsgi_response)
+        try:
+            for chunk in wsgi_response.iter_encoded():
+                if self.closed.is_set():
+                    break
+                self.chunks.put(chunk)
+        finally:
+            # Runs the app's call_on_close callbacks, as a server does when the client goes away
+            wsgi_response.close()
+            self.chunks.put(None)
+
+    def stream(self, amt=None, decode_content=None):
+        while (chunk := self.chunks.get()) is not None:
+            yield chunk
+
+    def read(self, amt=None):
+        return b"".join(self.stream())
+
+    def close(self):
+        self.closed.set()
@@ -0,0 +1,118 @@
+"""
+Synthetic data for the benchmark database.
+
+Every user owns notes_per_user notes with versions_per_note versions each, and
+every note is shared with collaborators_per_note other users, with the
+matching change log. Ciphertext is random bytes, so no two versions share a
+blob. Rows go in through the same bulk statements the backend uses
+(store_note_blobs, refresh_latest_version_pointers, record_changes) instead
+of one route call each.
+"""
+import os
+from sqlalchemy import func, insert
+from sqlalchemy.orm.session import Session
+from db.queries import change_entry, record_changes, refresh_latest_version_pointers, store_note_blobs
+from models.change_log import COLLABORATOR_ADDED, NOTE_CREATED, VERSION_ADDED, ChangeLog
+from models.collaborator import Collaborator
+from models.note import Note
+from models.note_version import NoteVersion
+from models.user import User
+
+BENCH_PASSWORD = "bench-password"
+IV_BYTES = 12
+TAG_BYTES = 16
+NOTE_KEY_BYTES = 32
+NOTES_PER_CHUNK = 50
+
+def user_name(index: int) -> str:
+    return f"bench-user-{index}"
+
+def note_title(owner_index: int, index: int) -> str:
+    return f"bench-note-{owner_index}-{index}"
+
+def random_note_key() -> bytes:
+    return os.urandom(NOTE_KEY_BYTES)
+
+def random_payload(note_bytes: int) -> dict:
+    return {
+        "iv": os.urandom(IV_BYTES),
+        "encrypted_note": os.urandom(note_bytes),
+        "note_tag": os.urandom(TAG_BYTES),
+        "ciphered_note_key": random_note_key()
+    }
+
+def seed_users(session: Session, count: int, password_hash: str) -> list:
+    """Insert count users sharing one password hash. Returns their ids, in order."""
+    rows = [
+        {"username": user_name(index), "password_hash": password_hash, "public_key": os.urandom(270).hex()}
+        for index in range(count)
+    ]
+    return session.execute(insert(User).returning(User.id, sort_by_parameter_order=True), rows).scalars().all()
+
+def seed_notes(session: Session, notes: list, versions: int, note_bytes: int) -> list:
+    """
+    Insert notes given as (title, [(user_id, role), ...]) with versions versions
+    each. The first collaborator should be the owner. Returns the note ids, in order.
+    """
+    note_ids = session.execute(
+        insert(Note).returning(Note.id, sort_by_parameter_order=True),
+        [{"note_title": title} for title, _ in notes]
+    ).scalars().all()
+
+    version_rows = []
+    collaborator_rows = []
+    changes = []
+    for note_id, (_, collaborators) in zip(note_ids, notes):
+        blob_hashes = store_note_blobs(session, [random_payload(note_bytes) for _ in range(versions)])
+        version_rows.extend(
+            {"note_id": note_id, "version": version, "blob_hash": blob_hash}
+            for version, blob_hash in enumerate(blob_hashes, start=1)
+        )
+        collaborator_rows.extend(
+            {"note_id": note_id, "user_id": user_id, "role": role, "note_key": random_note_key()}
+            for user_id, role in collaborators
+        )
+        changes.append(change_entry(note_id, NOTE_CREATED, 1))
+        changes.extend(change_entry(note_id, VERSION_ADDED, version) for version in range(2, versions + 1))
+        changes.extend(
+            change_entry(note_id, COLLABORATOR_ADDED, collaborator_id=user_id, role=role)
+            for user_id, role in collaborators[1:]
+        )
+
+    if version_rows:
+        session.execute(insert(NoteVersion), version_rows)
+        refresh_latest_version_pointers(session, note_ids)
+    if collaborator_rows:
+        session.execute(insert(Collaborator), collaborator_rows)
+    record_changes(session, changes)
+    return note_ids
+
+def seed_dataset(session: Session, users: int, notes_per_user: int, versions_per_note: int,
+                 collaborators_per_note: int, note_bytes: int, password_hash: str, logger) -> dict:
+    """Seed the shared dataset and commit it. Returns the user ids and note titles the scenarios pick from."""
+    user_ids = seed_users(session, users, password_hash)
+    session.commit()
+    logger.info(f"Seeded {len(user_ids)} users")
+
+    notes = []
+    for owner in range(users):
+        for index in range(notes_per_user):
+            collaborators = [(user_ids[owner], "owner")]
+            for offset in range(1, min(collaborators_per_note, users - 1) + 1):
+                role = "editor" if offset % 2 else "viewer"
+                collaborators.append((user_ids[(owner + offset) % users], role))
+            notes.append((note_title(owner, index), collaborators))
+
+    for start in range(0, len(notes), NOTES_PER_CHUNK):
+        seed_notes(session, notes[start:start + NOTES_PER_CHUNK], versions_per_note, note_bytes)
+        session.commit()
+    logger.info(f"Seeded {len(notes)} notes with {versions_per_note} versions and "
+                f"{min(collaborators_per_note, users - 1)} collaborators each")
+
+    return {
+        "user_ids": user_ids,
+        "last_seq": session.query(func.max(ChangeLog.seq)).scalar() or 0,
+        "usernames": [user_name(index) for index in range(users)],
+        "titles": [[note_title(owner, index) for index in range(notes_per_user)] for owner in range(users)],
+        "versions_per_note": versions_per_note
+    }
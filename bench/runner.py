@@ -0,0 +1,219 @@
+"""
+Runs scenarios against a Flask app from a pool of worker threads and summarizes them.
+"""
+import contextvars
+import math
+import threading
+import time
+from sqlalchemy import event
+
+class QueryCounter:
+    """
+    Counts the statements each request sends. The frontend calls the backend
+    in the same thread, or for streamed responses in a thread started with a
+    copy of its context, so a frontend request's count includes its backend calls.
+    """
+
+    def __init__(self, engine):
+        self.queries = contextvars.ContextVar("bench_queries")
+        event.listen(engine, "before_cursor_execute", self.count)
+
+    def count(self, conn, cursor, statement, parameters, context, executemany):
+        queries = self.queries.get(None)
+        if queries is not None:
+            queries[0] += 1
+
+    def reset(self):
+        self.queries.set([0])  # shared by the contexts copied from this one
+
+    def value(self) -> int:
+        return self.queries.get([0])[0]
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def send(client, scenario, worker: int, seq: int, counter: QueryCounter) -> tuple:
+    """Send one request, returns (seconds, queries, status)."""
+    request = scenario.build(worker, seq)
+    counter.reset()
+    start = time.perf_counter()
+    response = client.open(request["path"], method=scenario.method, json=request.get("json"),
+                           headers=request.get("headers"))
+    response.get_data()  # streamed bodies are produced while they are read
+    elapsed = time.perf_counter() - start
+    response.close()
+    return elapsed, counter.value(), response.status_code
+
+class StreamHolder:
+    """
+    Keeps count event streams of app open from their own threads, reading
+    whatever they send, until stop(). Each stream takes what an open client
+    connection takes in production: a stream slot and, on a threaded server,
+    a thread for as long as it stays open.
+    """
+
+    def __init__(self, app, count: int, build):
+        self.app = app
+        self.count = count
+        self.build = build  # index -> {"path", "headers"}
+        self.opened = 0
+        self.rejected = 0
+        self.chunks = 0
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.ready = threading.Barrier(count + 1)
+        self.threads = []
+
+    def start(self):
+        """Open the streams, returns once every one of them got its response."""
+        for index in range(self.count):
+            thread = threading.Thread(target=self.hold, args=(index,), daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        self.ready.wait()
+
+    def hold(self, index: int):
+        request = self.build(index)
+        client = self.app.test_client(use_cookies=False)
+        response = None
+        try:
+            response = client.open(request["path"], headers=request.get("headers"), buffered=False)
+            with self.lock:
+                if response.status_code == 200:
+                    self.opened += 1
+                else:
+                    self.rejected += 1
+        finally:
+            self.ready.wait()
+
+        if response is None:
+            return
+        try:
+            if response.status_code != 200:
+                return
+            for chunk in response.iter_encoded():
+                with self.lock:
+                    self.chunks += 1
+                if self.stopping.is_set():
+                    break
+        finally:
+            response.close()
+
+    def stop(self) -> dict:
+        self.stopping.set()
+        for thread in self.threads:
+            thread.join()
+        return {"held": self.opened, "rejected": self.rejected, "chunks": self.chunks}
+
+def run_scenario(app, scenario, concurrency: int, requests: int, warmup: int, counter: QueryCounter) -> dict:
+    """
+    Send requests requests (rounded up to a multiple of concurrency) from
+    concurrency threads, after warmup untimed requests per thread. Event
+    streams the scenario holds are opened before and closed after the requests.
+    """
+    per_worker = math.ceil(requests / concurrency)
+    if scenario.prepare is not None:
+        scenario.prepare(concurrency, warmup + per_worker)
+
+    holder = None
+    if scenario.streams is not None:
+        holder = StreamHolder(app, *scenario.streams)
+        holder.start()
+
+    samples = []
+    errors = []
+    samples_lock = threading.Lock()
+    start_barrier = threading.Barrier(concurrency + 1)
+
+    def worker(index: int):
+        client = app.test_client(use_cookies=False)
+        worker_samples = []
+        try:
+            for seq in range(warmup):
+                send(client, scenario, index, seq, counter)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            start_barrier.wait()
+
+        try:
+            for seq in range(warmup, warmup + per_worker):
+                worker_samples.append(send(client, scenario, index, seq, counter))
+        except Exception as e:
+            errors.append(e)
+
+        with samples_lock:
+            samples.extend(worker_samples)
+
+    threads = [threading.Thread(target=worker, args=(index,), daemon=True) for index in range(concurrency)]
+    for thread in threads:
+        thread.start()
+
+    start_barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - start
+
+    streams = holder.stop() if holder is not None else None
+    if errors:
+        raise errors[0]
+
+    result = summarize(scenario, samples, duration, concurrency)
+    if streams is not None:
+        result["streams"] = streams
+    return result
+
+def summarize(scenario, samples: list, duration: float, concurrency: int) -> dict:
+    latencies = sorted(seconds * 1000 for seconds, _, _ in samples)
+    queries = sorted(count for _, count, _ in samples)
+
+    status_counts = {}
+    for _, _, status in samples:
+        status_counts[str(status)] = status_counts.get(str(status), 0) + 1
+
+    return {
+        "scenario": scenario.name,
+        "method": scenario.method,
+        "route": scenario.rule,
+        "concurrency": concurrency,
+        "requests": len(samples),
+        "duration_seconds": round(duration, 4),
+        "requests_per_second": round(len(samples) / duration, 2) if duration > 0 else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 0.50), 3),
+            "p95": round(percentile(latencies, 0.95), 3),
+            "p99": round(percentile(latencies, 0.99), 3),
+            "mean": round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+            "max": round(latencies[-1], 3) if latencies else 0.0
+        },
+        "queries_per_request": {
+            "mean": round(sum(queries) / len(queries), 2) if queries else 0.0,
+            "p95": percentile(queries, 0.95),
+            "max": queries[-1] if queries else 0
+        },
+        "status_counts": status_counts,
+        "unexpected_status": sum(count for status, count in status_counts.items() if int(status) not in scenario.expect)
+    }
+
+def compare_results(current: dict, baseline: dict) -> list:
+    """One line per scenario present in both runs, with the p95 latency and throughput change."""
+    previous = {(result["app"], result["scenario"]): result for result in baseline["results"]}
+    lines = []
+    for result in current["results"]:
+        before = previous.get((result["app"], result["scenario"]))
+        if before is None:
+            continue
+
+        p95, old_p95 = result["latency_ms"]["p95"], before["latency_ms"]["p95"]
+        rps, old_rps = result["requests_per_second"], before["requests_per_second"]
+        p95_change = f"{(p95 - old_p95) / old_p95:+.1%}" if old_p95 else "n/a"
+        rps_change = f"{(rps - old_rps) / old_rps:+.1%}" if old_rps else "n/a"
+        lines.append(f"{result['app']} {result['scenario']}: p95 {old_p95} -> {p95} ms ({p95_change}), "
+                     f"{old_rps} -> {rps} req/s ({rps_change}), "
+                     f"queries {before['queries_per_request']['mean']} -> {result['queries_per_request']['mean']}")
+    return lines
@@ -0,0 +1,250 @@
+"""
+Benchmark scenarios for every route of backend/app.py and frontend/app.py.
+
+A scenario builds the request worker w sends on its seq-th iteration. Reads
+pick random users, notes and versions from the seeded dataset. Writes need a
+target that is still valid when many workers run them at once, so prepare()
+seeds one note per worker (backup routes, with increasing versions) or one
+note per request (collaborator routes, which can only share a version once).
+The *_with_streams scenarios hold event streams open while they run, so the
+requests compete with them the way they do in production.
+"""
+import base64
+import os
+import random
+from flask_jwt_extended import create_access_token
+from bench.dataset import BENCH_PASSWORD, random_note_key, random_payload, seed_notes
+
+BATCH_PUB_KEYS = 50
+BATCH_NOTES = 20
+BATCH_COLLABORATORS = 10
+PAGE_LIMIT = 20
+VERSION_RANGE = 10
+HELD_STREAMS = 2  # EVENTS_MAX_SUBSCRIBERS with the default BE_THREADS, every stream the backend allows
+
+class Scenario:
+    def __init__(self, name: str, method: str, rule: str, build, expect: tuple = (200,), prepare=None, streams=None):
+        self.name = name
+        self.method = method
+        self.rule = rule  # Flask URL rule the scenario covers
+        self.build = build  # (worker, seq) -> {"path", "json", "headers"}
+        self.expect = expect
+        self.prepare = prepare  # (workers, iterations) -> None, seeds the notes the requests write to
+        self.streams = streams  # (count, index -> {"path", "headers"}) of event streams held open meanwhile
+
+def encode_payload(payload: dict) -> dict:
+    """JSON form of a ciphertext payload, as clients send it."""
+    return {field: base64.b64encode(value).decode() for field, value in payload.items()}
+
+class Workload:
+    """Picks request targets from the seeded dataset and seeds the notes write scenarios modify."""
+
+    def __init__(self, dataset: dict, note_bytes: int, session_factory):
+        self.dataset = dataset
+        self.note_bytes = note_bytes
+        self.session_factory = session_factory
+        self.tokens = {}
+
+    def actor(self, worker: int) -> int:
+        """Index of the user a worker acts as."""
+        return worker % len(self.dataset["usernames"])
+
+    def username(self, worker: int) -> str:
+        return self.dataset["usernames"][self.actor(worker)]
+
+    def other_usernames(self, worker: int, count: int) -> list:
+        usernames = self.dataset["usernames"]
+        count = min(count, len(usernames) - 1)
+        return [usernames[(self.actor(worker) + offset) % len(usernames)] for offset in range(1, count + 1)]
+
+    def random_usernames(self, count: int) -> list:
+        return random.sample(self.dataset["usernames"], min(count, len(self.dataset["usernames"])))
+
+    def random_note_version(self, worker: int) -> tuple:
+        title = random.choice(self.dataset["titles"][self.actor(worker)])
+        return title, random.randint(1, self.dataset["versions_per_note"])
+
+    def note_body(self, title: str, version: int = None) -> dict:
+        body = encode_payload(random_payload(self.note_bytes))
+        body["title"] = title
+        if version is not None:
+            body["version"] = version
+        return body
+
+    def sign_tokens(self, frontend_app, workers: int):
+        with frontend_app.app_context():
+            for worker in range(workers):
+                username = self.username(worker)
+                if username not in self.tokens:
+                    self.tokens[username] = create_access_token(identity=username)
+
+    def auth_headers(self, worker: int) -> dict:
+        return {"Authorization": f"Bearer {self.tokens[self.username(worker)]}"}
+
+    def seed_owned_notes(self, titles_by_worker: dict):
+        """Seed single version notes owned by each worker's user."""
+        notes = [
+            (title, [(self.dataset["user_ids"][self.actor(worker)], "owner")])
+            for worker, titles in titles_by_worker.items()
+            for title in titles
+        ]
+        with self.session_factory() as session:
+            seed_notes(session, notes, 1, self.note_bytes)
+            session.commit()
+
+def build_scenarios(workload: Workload, side: str) -> list:
+    """Scenarios for side ("backend" or "frontend"). Frontend requests carry the worker's JWT."""
+    frontend = side == "frontend"
+
+    def headers(worker: int, extra: dict = None) -> dict:
+        result = workload.auth_headers(worker) if frontend else {}
+        result.update(extra or {})
+        return result
+
+    def write_rule(route: str) -> str:
+        # The frontend acts as the JWT identity, the backend takes the user from the path
+        return f"/{route}" if frontend else f"/users/<username>/{route}"
+
+    def write_path(worker: int, route: str) -> str:
+        return f"/{route}" if frontend else f"/users/{workload.username(worker)}/{route}"
+
+    def per_worker_titles(kind: str, worker: int, count: int) -> list:
+        return [f"{side}-{kind}-{worker}-{index}" for index in range(count)]
+
+    def per_request_title(kind: str, worker: int, seq: int) -> str:
+        return f"{side}-{kind}-{worker}-{seq}"
+
+    def prepare_per_worker(kind: str, count: int):
+        def prepare(workers: int, iterations: int):
+            workload.seed_owned_notes({worker: per_worker_titles(kind, worker, count) for worker in range(workers)})
+        return prepare
+
+    def prepare_per_request(kind: str):
+        def prepare(workers: int, iterations: int):
+            workload.seed_owned_notes({
+                worker: [per_request_title(kind, worker, seq) for seq in range(iterations)]
+                for worker in range(workers)
+            })
+        return prepare
+
+    def login(worker, seq):
+        return {"path": "/login", "json": {"username": workload.username(worker), "password": BENCH_PASSWORD}}
+
+    def notes(query: str = "", accept: str = None):
+        def build(worker, seq):
+            extra = {"Accept": accept} if accept else None
+            return {"path": f"/users/{workload.username(worker)}/notes{query}", "headers": headers(worker, extra)}
+        return build
+
+    def changes(since):
+        def build(worker, seq):
+            return {"path": f"/users/{workload.username(worker)}/changes?since={since}", "headers": headers(worker)}
+        return build
+
+    def events(worker, seq):
+        # Ends right after subscribing, this measures the subscription and not the idle wait
+        return {"path": f"{write_path(worker, 'events')}?timeout=0", "headers": headers(worker)}
+
+    def held_stream(index):
+        return {"path": write_path(index, "events"), "headers": headers(index)}
+
+    def note_version(worker, seq):
+        title, version = workload.random_note_version(worker)
+        return {"path": f"/users/{workload.username(worker)}/notes/{title}/{version}", "headers": headers(worker)}
+
+    def note_history(worker, seq):
+        title, _ = workload.random_note_version(worker)
+        return {"path": f"/users/{workload.username(worker)}/notes/{title}/history", "headers": headers(worker)}
+
+    def note_versions(worker, seq):
+        title, version = workload.random_note_version(worker)
+        first = max(1, version - VERSION_RANGE + 1)
+        return {"path": f"/users/{workload.username(worker)}/notes/{title}/versions?from={first}&to={version}",
+                "headers": headers(worker)}
+
+    def pub_key(worker, seq):
+        username = workload.random_usernames(1)[0]
+        return {"path": f"/users/{username}/pub_key", "headers": headers(worker)}
+
+    def pub_keys(worker, seq):
+        return {"path": "/users/pub_keys", "json": {"usernames": workload.random_usernames(BATCH_PUB_KEYS)},
+                "headers": headers(worker)}
+
+    def add_collaborator(worker, seq):
+        body = {
+            "collaborator": workload.other_usernames(worker, 1)[0],
+            "permission": "viewer",
+            "note": workload.note_body(per_request_title("share", worker, seq), 2)
+        }
+        return {"path": write_path(worker, "add_collaborator"), "json": body, "headers": headers(worker)}
+
+    def add_collaborators(worker, seq):
+        body = {
+            "note": workload.note_body(per_request_title("share-batch", worker, seq), 2),
+            "collaborators": [
+                {"collaborator": username, "permission": "editor", "ciphered_note_key": base64.b64encode(random_note_key()).decode()}
+                for username in workload.other_usernames(worker, BATCH_COLLABORATORS)
+            ]
+        }
+        return {"path": write_path(worker, "add_collaborators"), "json": body, "headers": headers(worker)}
+
+    def backup_note(kind: str):
+        def build(worker, seq):
+            body = workload.note_body(per_worker_titles(kind, worker, 1)[0])
+            return {"path": write_path(worker, "backup_note"), "json": body,
+                    "headers": headers(worker, {"version": str(seq + 2)})}
+        return build
+
+    def backup_notes(worker, seq):
+        body = {"notes": [workload.note_body(title, seq + 2) for title in per_worker_titles("backup-batch", worker, BATCH_NOTES)]}
+        return {"path": write_path(worker, "backup_notes"), "json": body, "headers": headers(worker)}
+
+    def create_note(worker, seq):
+        body = workload.note_body(per_request_title("create", worker, seq))
+        return {"path": write_path(worker, "create_note"), "json": body, "headers": headers(worker, {"version": "1"})}
+
+    def metrics(worker, seq):
+        return {"path": "/metrics", "headers": {"Authorization": f"Bearer {os.environ['METRICS_TOKEN']}"}}
+
+    return [
+        Scenario("login", "POST", "/login", login),
+        Scenario("notes", "GET", "/users/<username>/notes", notes()),
+        Scenario("notes_summary", "GET", "/users/<username>/notes", notes("?fields=summary")),
+        Scenario("notes_page", "GET", "/users/<username>/notes", notes(f"?limit={PAGE_LIMIT}")),
+        Scenario("notes_ndjson", "GET", "/users/<username>/notes", notes(accept="application/x-ndjson")),
+        Scenario("notes_msgpack", "GET", "/users/<username>/notes", notes(accept="application/msgpack")),
+        Scenario("notes_with_streams", "GET", "/users/<username>/notes", notes(),
+                 streams=(HELD_STREAMS, held_stream)),
+        Scenario("changes", "GET", "/users/<username>/changes", changes(0)),
+        Scenario("changes_poll", "GET", "/users/<username>/changes", changes(workload.dataset["last_seq"])),
+        Scenario("events", "GET", write_rule("events"), events),
+        Scenario("note_version", "GET", "/users/<username>/notes/<note_title>/<version>", note_version),
+        Scenario("note_history", "GET", "/users/<username>/notes/<note_title>/history", note_history),
+        Scenario("note_versions", "GET", "/users/<username>/notes/<note_title>/versions", note_versions),
+        Scenario("pub_key", "GET", "/users/<username>/pub_key", pub_key),
+        Scenario("pub_keys", "POST", "/users/pub_keys", pub_keys),
+        Scenario("add_collaborator", "POST", write_rule("add_collaborator"), add_collaborator, (201,),
+                 prepare_per_request("share")),
+        Scenario("add_collaborators", "POST", write_rule("add_collaborators"), add_collaborators, (201,),
+                 prepare_per_request("share-batch")),
+        Scenario("backup_note", "POST", write_rule("backup_note"), backup_note("backup"), (201,),
+                 prepare_per_worker("backup", 1)),
+        Scenario("backup_note_with_streams", "POST", write_rule("backup_note"), backup_note("backup-streamed"), (201,),
+                 prepare_per_worker("backup-streamed", 1), streams=(HELD_STREAMS, held_stream)),
+        Scenario("backup_notes", "POST", write_rule("backup_notes"), backup_notes, (201,),
+                 prepare_per_worker("backup-batch", BATCH_NOTES)),
+        Scenario("create_note", "POST", write_rule("create_note"), create_note, (201,)),
+        Scenario("metrics", "GET", "/metrics", metrics),
+    ]
+
+def uncovered_routes(app, scenarios: list) -> list:
+    """Routes of app no scenario sends requests to, as "METHOD rule"."""
+    covered = {(scenario.method, scenario.rule) for scenario in scenarios}
+    missing = []
+    for rule in app.url_map.iter_rules():
+        if rule.endpoint == "static":
+            continue
+        for method in sorted(rule.methods - {"HEAD", "OPTIONS"}):
+            if (method, rule.rule) not in covered:
+                missing.append(f"{method} {rule.rule}")
+    return sorted(missing)
@@ -0,0 +1,5 @@
+"""
+Code shared by the backend and the frontend. Neither app is installed as a
+package, so their utils package puts the repository root on sys.path to make
+this one importable from both.
+"""
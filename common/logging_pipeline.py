@@ -0,0 +1,160 @@
+"""
+Non-blocking logging.
+
+Request threads only put records on a bounded queue; a background listener
+thread formats them and does the file and console I/O. When the queue is
+full, records are dropped and counted rather than making the request wait.
+Messages are capped at LOG_MAX_MESSAGE_BYTES. INFO and DEBUG records can be
+sampled per Flask endpoint with LOG_SAMPLE_RATES, e.g.
+"get_user_notes=0.1,get_user_note_version=0.05". The decision is made once per
+request, so a sampled request keeps all its lines. Warnings and errors are
+always kept.
+"""
+import os
+import queue
+import random
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from flask import g, has_request_context, request
+from flask.logging import default_handler
+
+LOG_FORMAT = "%(asctime)s - %(message)s"
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+LOG_MAX_MESSAGE_BYTES = int(os.getenv("LOG_MAX_MESSAGE_BYTES", 2048))
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "")
+
+def parse_sample_rates(value: str) -> dict:
+    rates = {}
+    for entry in filter(None, (part.strip() for part in value.split(","))):
+        endpoint, _, rate = entry.partition("=")
+        rates[endpoint.strip()] = float(rate)
+    return rates
+
+def truncate(text: str, max_bytes: int) -> str:
+    if len(text) <= max_bytes // 4:  # no character takes more than 4 bytes
+        return text
+    encoded = text.encode("utf-8", "replace")
+    if len(encoded) <= max_bytes:
+        return text
+    return encoded[:max_bytes].decode("utf-8", "ignore") + f"... [{len(encoded) - max_bytes} bytes truncated]"
+
+class DroppingQueueHandler(QueueHandler):
+    """Queues capped, per-endpoint sampled records without ever blocking the caller."""
+
+    def __init__(self, log_queue: queue.Queue, max_message_bytes: int, sample_rates: dict):
+        super().__init__(log_queue)
+        self.max_message_bytes = max_message_bytes
+        self.sample_rates = sample_rates
+        self.queued = 0
+        self.dropped = 0
+        self.sampled_out = 0
+        self.truncated = 0
+        self._lock = threading.Lock()
+
+    def sampled(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not has_request_context():
+            return True
+
+        rate = self.sample_rates.get(request.endpoint)
+        if rate is None:
+            return True
+
+        if "log_sampled" not in g:
+            g.log_sampled = random.random() < rate
+        return g.log_sampled
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Merge the arguments here, the listener may only see the record once they changed
+        message = record.getMessage()
+        capped = truncate(message, self.max_message_bytes)
+        if capped is not message:
+            with self._lock:
+                self.truncated += 1
+
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg, record.args = capped, None
+        if record.exc_info:
+            record.exc_text = truncate(logging.Formatter().formatException(record.exc_info), 4 * self.max_message_bytes)
+            record.exc_info = None
+        return record
+
+    def emit(self, record: logging.LogRecord):
+        if not self.sampled(record):
+            with self._lock:
+                self.sampled_out += 1
+            return
+
+        try:
+            self.queue.put_nowait(self.prepare(record))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return
+        except Exception:
+            self.handleError(record)
+            return
+
+        with self._lock:
+            self.queued += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "queued": self.queued,
+                "dropped": self.dropped,
+                "sampled_out": self.sampled_out,
+                "truncated": self.truncated,
+                "queue_depth": self.queue.qsize(),
+                "queue_size": self.queue.maxsize
+            }
+
+class DrainingQueueListener(QueueListener):
+    def enqueue_sentinel(self):
+        # Waits for room instead of failing when the queue is full, the writer is still draining it
+        self.queue.put(self._sentinel)
+
+queue_handler = None
+listener = None
+listener_pid = None
+
+def setup_logging(log_file: str, level: int = logging.INFO, console: bool = True) -> DroppingQueueHandler:
+    """
+    Route every log record through the queue to log_file and, unless console is False, the console.
+    Call it again in each forked worker: the listener thread does not survive a fork.
+    """
+    global queue_handler, listener, listener_pid
+
+    stop_logging()
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = [logging.FileHandler(log_file)] + ([logging.StreamHandler()] if console else [])
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    queue_handler = DroppingQueueHandler(log_queue, LOG_MAX_MESSAGE_BYTES, parse_sample_rates(LOG_SAMPLE_RATES))
+    listener = DrainingQueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    listener_pid = os.getpid()
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    # Flask writes straight to stderr from the request thread otherwise
+    for name in ("app", "flask.app"):
+        logging.getLogger(name).removeHandler(default_handler)
+    return queue_handler
+
+def stop_logging():
+    """Flush what is still queued and stop the writer thread."""
+    global listener
+    if listener is not None and listener_pid == os.getpid():
+        listener.stop()
+    listener = None
+
+def logging_stats() -> dict:
+    return queue_handler.stats() if queue_handler is not None else {}
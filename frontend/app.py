@@ -1,13 +1,21 @@
 import requests
 import os
-import logging
-from flask import Flask, current_app, jsonify, request, abort, make_response
+import sys
+import threading
+from flask import Flask, Response, current_app, jsonify, request, abort, make_response, stream_with_context
 from werkzeug.exceptions import HTTPException
 from dotenv import load_dotenv
-from utils.validators import validate_add_collaborator_req, validate_note, check_version
+from utils.validators import (validate_add_collaborator_req, validate_add_collaborators_req, validate_note, validate_notes_batch,
+                              validate_pub_keys_req, check_version)
 from utils.tls import get_p12_data, delete_temp_files
+from common.logging_pipeline import logging_stats, setup_logging, stop_logging
+from utils.metrics import instrument_app, instrument_backend_session, registry
+from utils.backend_client import create_backend_session
 from flask_jwt_extended import current_user, jwt_required, JWTManager, get_jwt_identity
 from utils.errors import validate_response
+from utils.cache import NoteVersionCache
+from utils.proxy import cached_response, conditional_headers, copy_cache_headers, is_streamed, relay_not_modified, relay_response, relay_stream
+from utils.codec import body_headers, negotiated_mimetype, parse_body
 import jwt
 
 load_dotenv()
@@ -15,13 +23,61 @@ BACKEND_URL = os.getenv("BACKEND_URL")
 FE_HOST = os.getenv("FE_HOST")
 FE_PORT = os.getenv("FE_PORT")
 SERVER_TIMEOUT = 60 # seconds
+CONNECT_TIMEOUT = 5 # seconds
+# (connect, read) timeouts for each route proxied to the backend
+ROUTE_TIMEOUTS = {
+    'login': (CONNECT_TIMEOUT, 30),
+    'notes': (CONNECT_TIMEOUT, SERVER_TIMEOUT),
+    'changes': (CONNECT_TIMEOUT, 30),
+    'note_version': (CONNECT_TIMEOUT, 30),
+    'note_history': (CONNECT_TIMEOUT, 30),
+    'note_versions': (CONNECT_TIMEOUT, SERVER_TIMEOUT),
+    'pub_key': (CONNECT_TIMEOUT, 10),
+    'pub_keys': (CONNECT_TIMEOUT, 30),
+    'add_collaborator': (CONNECT_TIMEOUT, 30),
+    'add_collaborators': (CONNECT_TIMEOUT, SERVER_TIMEOUT),
+    'backup_note': (CONNECT_TIMEOUT, SERVER_TIMEOUT),
+    'backup_notes': (CONNECT_TIMEOUT, SERVER_TIMEOUT),
+    'create_note': (CONNECT_TIMEOUT, SERVER_TIMEOUT),
+    'events': (CONNECT_TIMEOUT, SERVER_TIMEOUT),  # read timeout between chunks, the backend sends heartbeats
+}
+BACKEND_POOL_SIZE = int(os.getenv("BACKEND_POOL_SIZE", 100))
+FE_THREADS = int(os.getenv("FE_THREADS", 8))  # threads per gthread worker, as in serve.py
+
+def runs_on_event_loop() -> bool:
+    """True under a gevent worker or serve_async.py, which patch threading before importing the app."""
+    monkey = sys.modules.get("gevent.monkey")
+    return monkey is not None and monkey.is_module_patched("threading")
+
+def max_event_streams() -> int:
+    """
+    Each open event stream holds a backend connection, keep most of the pool for
+    requests. A threaded worker also gives each stream one of its FE_THREADS
+    threads for as long as it stays open, so streams get half of them by default
+    and never all of them, the rest stay free for everything else.
+    """
+    default = max(1, BACKEND_POOL_SIZE // 4)
+    if runs_on_event_loop():
+        return int(os.getenv("FE_MAX_EVENT_STREAMS", default))
+    return min(int(os.getenv("FE_MAX_EVENT_STREAMS", min(default, FE_THREADS // 2))), FE_THREADS - 1)
+
+FE_MAX_EVENT_STREAMS = max_event_streams()
 P12_PATH = os.getenv("P12_PATH")
 P12_PWD = os.getenv("P12_PWD")
+NOTE_CACHE_MAX_BYTES = int(os.getenv("NOTE_CACHE_MAX_BYTES", 64 * 1024 * 1024))
 
 app = Flask(__name__)
 app.config['JSON_SORT_KEYS'] = False
 app.config['JWT_SECRET_KEY'] = os.getenv("JWT_SECRET_KEY")
 jwtmanager = JWTManager(app)
+note_cache = NoteVersionCache(NOTE_CACHE_MAX_BYTES)
+event_stream_slots = threading.BoundedSemaphore(FE_MAX_EVENT_STREAMS)
+session = None # backend session, created by init_backend_session
+
+instrument_app(app)
+registry.add_stats_source("note_cache", note_cache.stats)
+registry.add_stats_source("logging", logging_stats)
+registry.add_stats_source("backend_transport", lambda: backend_transport_stats())
 
 @app.route('/login', methods=['POST'])
 def login():
@@ -34,7 +90,7 @@ def login():
             return jsonify({'message': 'Username and password are required!'}), 400
 
         app.logger.info(f"Logging in user {data['username']}")
-        response = session.post(f"{BACKEND_URL}/login", json=data, timeout=SERVER_TIMEOUT)
+        response = session.post(f"{BACKEND_URL}/login", json=data, timeout=ROUTE_TIMEOUTS['login'])
 
         if response.status_code == 406:
             app.logger.error("Invalid credentials")
@@ -44,6 +100,9 @@ def login():
             app.logger.info("User authenticated")
             return make_response(response.json(), response.status_code)
 
+        if response.status_code == 503:
+            app.logger.error("Backend is busy verifying other logins")
+
         return make_response(response.json(), response.status_code)
 
     except Exception as e:
@@ -57,51 +116,218 @@ def get_user_notes(username):
 
     try:
         app.logger.info(f"Fetching notes for user {username}")
-        response = session.get(f"{BACKEND_URL}/users/{username}/notes", headers=request.headers)
+        response = session.get(f"{BACKEND_URL}/users/{username}/notes", params=request.args,
+                               headers=request.headers, timeout=ROUTE_TIMEOUTS['notes'], stream=True)
+
+        if response.status_code == 304:
+            app.logger.info(f"Notes for user {username} not modified")
+            return relay_not_modified(response)
 
         validate_response(app, response)
 
+        if is_streamed(response):
+            app.logger.info(f"Streaming notes for user {username}")
+            streamed = Response(stream_with_context(relay_stream(response)), response.status_code,
+                                content_type=response.headers['Content-Type'])
+            return copy_cache_headers(response, streamed)
+
         if response.status_code == 200:
             app.logger.info(f"Notes fetched successfully")
             
-        return make_response(response.json(), response.status_code) 
+        return relay_response(response)
+    except HTTPException as e:
+        app.logger.error(f"HTTP error: {str(e)}")
+        return make_response({"error": e.description}, e.code)
     except Exception as e:
         app.logger.error(f"Error fetching notes for user {username}: {e}")
         return make_response({"error": str(e)}, 500)
 
+@app.route('/users/<username>/changes', methods=['GET'])
+@jwt_required()
+def get_user_changes(username):
+    app.logger.info(f"Received user changes req from client: {request.remote_addr}")
+    try:
+        if username != get_jwt_identity():
+            abort(403, description="Cannot sync the changes of another user")
+
+        response = session.get(f"{BACKEND_URL}/users/{username}/changes", params=request.args,
+                               headers=conditional_headers(request.headers), timeout=ROUTE_TIMEOUTS['changes'])
+
+        validate_response(app, response)
+
+        app.logger.info(f"Changes fetched for user {username}")
+        return relay_response(response)
+    except HTTPException as e:
+        app.logger.error(f"HTTP error: {str(e)}")
+        return make_response({"error": e.description}, e.code)
+    except Exception as e:
+        app.logger.error(f"Error fetching changes for user {username}: {e}")
+        return make_response({"error": str(e)}, 500)
+
+@app.route('/events', methods=['GET'])
+@jwt_required()
+def get_events():
+    app.logger.info(f"Received events req from client: {request.remote_addr}")
+    current_user = get_jwt_identity()
+
+    if not event_stream_slots.acquire(blocking=False):
+        app.logger.error(f"Too many event streams open, refusing {current_user}")
+        return make_response({"error": "Too many event streams open, try again later"}, 503)
+
+    streaming = False
+    try:
+        response = session.get(f"{BACKEND_URL}/users/{current_user}/events", params=request.args,
+                               timeout=ROUTE_TIMEOUTS['events'], stream=True)
+
+        if response.status_code == 503:
+            return relay_response(response)
+
+        validate_response(app, response)
+
+        app.logger.info(f"Streaming events for user {current_user}")
+        streamed = Response(stream_with_context(relay_stream(response)), response.status_code,
+                            content_type=response.headers['Content-Type'])
+        streamed.headers['Cache-Control'] = 'no-cache'
+        streamed.headers['X-Accel-Buffering'] = 'no'
+        # Runs once the server is done with the response, even if the client left before the first chunk
+        streamed.call_on_close(response.close)
+        streamed.call_on_close(event_stream_slots.release)
+        streaming = True
+        return streamed
+    except HTTPException as e:
+        app.logger.error(f"HTTP error: {str(e)}")
+        return make_response({"error": e.description}, e.code)
+    except Exception as e:
+        app.logger.error(f"Error streaming events for user {current_user}: {e}")
+        return make_response({"error": str(e)}, 500)
+    finally:
+        if not streaming:
+            event_stream_slots.release()
+
 @app.route('/users/<username>/notes/<note_title>/<version>', methods=['GET'])
+@jwt_required()
 def get_user_note_version(username, note_title, version):
     app.logger.info(f"Received user note version retrieve req from client: {request.remote_addr}")
     try:
+        # The cache is keyed by the path, it may only answer the user the backend authorized for it
+        if username != get_jwt_identity():
+            abort(403, description="Cannot read a note version as another user")
+
+        cache_key = (username, note_title, version, negotiated_mimetype(request))
+        cached = note_cache.get(cache_key)
+        if cached is not None:
+            app.logger.info(f"Note {note_title} version {version} served from cache")
+            return cached_response(cached, request)
+
         app.logger.info(f"Fetching note {note_title} for user {username}")
-        response = session.get(f"{BACKEND_URL}/users/{username}/notes/{note_title}/{version}", timeout=SERVER_TIMEOUT)
+        response = session.get(f"{BACKEND_URL}/users/{username}/notes/{note_title}/{version}",
+                               headers=conditional_headers(request.headers), timeout=ROUTE_TIMEOUTS['note_version'])
+
+        if response.status_code == 304:
+            app.logger.info(f"Note {note_title} version {version} not modified")
+            return relay_not_modified(response)
 
         validate_response(app, response)
 
         if response.status_code == 200:
             app.logger.info(f"Note fetched successfully")
-            print(response.json())
+            note_cache.put(cache_key, response.content, response.headers)
 
-        return make_response(response.json(), response.status_code)
+        return relay_response(response)
+    except HTTPException as e:
+        app.logger.error(f"HTTP error: {str(e)}")
+        return make_response({"error": e.description}, e.code)
     except Exception as e:
         app.logger.error(f"Error fetching note {note_title} for user {username}: {e}")
         return make_response({"error": str(e)}, 500)
 
+@app.route('/users/<username>/notes/<note_title>/history', methods=['GET'])
+@jwt_required()
+def get_user_note_history(username, note_title):
+    app.logger.info(f"Received user note history req from client: {request.remote_addr}")
+    try:
+        if username != get_jwt_identity():
+            abort(403, description="Cannot read note history as another user")
+
+        response = session.get(f"{BACKEND_URL}/users/{username}/notes/{note_title}/history",
+                               headers=conditional_headers(request.headers), timeout=ROUTE_TIMEOUTS['note_history'])
+
+        validate_response(app, response)
+
+        app.logger.info(f"History of note {note_title} fetched for user {username}")
+        return relay_response(response)
+    except HTTPException as e:
+        app.logger.error(f"HTTP error: {str(e)}")
+        return make_response({"error": e.description}, e.code)
+    except Exception as e:
+        app.logger.error(f"Error fetching history of note {note_title} for user {username}: {e}")
+        return make_response({"error": str(e)}, 500)
+
+@app.route('/users/<username>/notes/<note_title>/versions', methods=['GET'])
+@jwt_required()
+def get_user_note_versions(username, note_title):
+    app.logger.info(f"Received user note versions req from client: {request.remote_addr}")
+    try:
+        if username != get_jwt_identity():
+            abort(403, description="Cannot read note versions as another user")
+
+        response = session.get(f"{BACKEND_URL}/users/{username}/notes/{note_title}/versions", params=request.args,
+                               headers=conditional_headers(request.headers), timeout=ROUTE_TIMEOUTS['note_versions'])
+
+        validate_response(app, response)
+
+        app.logger.info(f"Versions of note {note_title} fetched for user {username}")
+        return relay_response(response)
+    except HTTPException as e:
+        app.logger.error(f"HTTP error: {str(e)}")
+        return make_response({"error": e.description}, e.code)
+    except Exception as e:
+        app.logger.error(f"Error fetching versions of note {note_title} for user {username}: {e}")
+        return make_response({"error": str(e)}, 500)
+
 @app.route('/users/<username>/pub_key', methods=['GET'])
 @jwt_required()
 def get_user_pub_key(username):
     app.logger.info(f"Received user public key req from client: {request.remote_addr}")
     try:
-        response = session.get(f"{BACKEND_URL}/users/{username}/pub_key", timeout=SERVER_TIMEOUT)
+        response = session.get(f"{BACKEND_URL}/users/{username}/pub_key",
+                               headers=conditional_headers(request.headers), timeout=ROUTE_TIMEOUTS['pub_key'])
+
+        if response.status_code == 304:
+            app.logger.info(f"Public key of user {username} not modified")
+            return relay_not_modified(response)
 
         validate_response(app, response)
 
-        app.logger.info(f"User found: {response.json()}")
-        return make_response(response.json(), response.status_code)
+        app.logger.info(f"User found: {username}")
+        return relay_response(response)
+    except HTTPException as e:
+        app.logger.error(f"HTTP error: {str(e)}")
+        return make_response({"error": e.description}, e.code)
     except Exception as e:
         app.logger.error(f"Error fetching public key for user {username}: {e}")
         return make_response({"error": str(e)}, 500)
 
+@app.route('/users/pub_keys', methods=['POST'])
+@jwt_required()
+def get_users_pub_keys():
+    app.logger.info(f"Received batch public key req from client: {request.remote_addr}")
+    try:
+        validate_pub_keys_req(parse_body(request))
+        response = session.post(f"{BACKEND_URL}/users/pub_keys", data=request.get_data(),
+                                headers=body_headers(request), timeout=ROUTE_TIMEOUTS['pub_keys'])
+
+        validate_response(app, response)
+
+        app.logger.info(f"Public keys fetched")
+        return relay_response(response)
+    except HTTPException as e:
+        app.logger.error(f"HTTP error: {str(e)}")
+        return make_response({"error": e.description}, e.code)
+    except Exception as e:
+        app.logger.error(f"Error fetching public keys: {e}")
+        return make_response({"error": str(e)}, 500)
+
 @app.route('/add_collaborator', methods=['POST'])
 @jwt_required()
 def add_colaborator():
@@ -110,19 +336,45 @@ def add_colaborator():
     app.logger.info(f"Current user: {current_user}")
 
     try:
-        validate_add_collaborator_req(request.json)
-        response = session.post(f"{BACKEND_URL}/users/{current_user}/add_collaborator", json=request.json, timeout=SERVER_TIMEOUT)
+        validate_add_collaborator_req(parse_body(request))
+        response = session.post(f"{BACKEND_URL}/users/{current_user}/add_collaborator", data=request.get_data(),
+                                headers=body_headers(request), timeout=ROUTE_TIMEOUTS['add_collaborator'])
 
         validate_response(app, response)
 
         if response.status_code == 201:
             app.logger.info(f"User added as collaborator successfully")
 
-        return make_response(response.json(), response.status_code)
+        return relay_response(response)
     except Exception as e:
         app.logger.error(f"Error adding colaborator: {e}")
         return make_response({"error": str(e)}, 500)
 
+@app.route('/add_collaborators', methods=['POST'])
+@jwt_required()
+def add_collaborators():
+    app.logger.info(f"Received batch add collaborators req from client: {request.remote_addr}")
+    current_user = get_jwt_identity()
+    app.logger.info(f"Current user: {current_user}")
+
+    try:
+        validate_add_collaborators_req(parse_body(request))
+        response = session.post(f"{BACKEND_URL}/users/{current_user}/add_collaborators", data=request.get_data(),
+                                headers=body_headers(request), timeout=ROUTE_TIMEOUTS['add_collaborators'])
+
+        validate_response(app, response)
+
+        app.logger.info(f"Batch add collaborators processed")
+        return relay_response(response)
+
+    except HTTPException as e:
+        app.logger.error(f"HTTP error: {str(e)}")
+        return make_response({"error": e.description}, e.code)
+
+    except Exception as e:
+        app.logger.error(f"Error adding colaborators: {e}")
+        return make_response({"error": str(e)}, 500)
+
 @app.route('/backup_note', methods=['POST'])
 @jwt_required()
 def backup_note():
@@ -131,18 +383,48 @@ def backup_note():
     app.logger.info(f"Current user: {current_user}")
     
     try:
-        note = request.json
+        note = parse_body(request)
         validate_note(note, request.headers)
 
         app.logger.info(f"Received note backup req from client: {current_user}@{request.remote_addr}")
 
-        response = session.post(f"{BACKEND_URL}/users/{current_user}/backup_note", json=note, timeout=SERVER_TIMEOUT, headers=request.headers)
+        response = session.post(f"{BACKEND_URL}/users/{current_user}/backup_note", data=request.get_data(),
+                                timeout=ROUTE_TIMEOUTS['backup_note'], headers=body_headers(request, 'version'))
         app.logger.info(f"Sent note from {request.remote_addr} to backend")
 
         validate_response(app, response)
         
         app.logger.info(f"Note saved successfully")
-        return make_response(response.json(), response.status_code)
+        return relay_response(response)
+
+    except HTTPException as e:
+        app.logger.error(f"HTTP error: {str(e)}")
+        return make_response({"error": e.description}, e.code)
+
+    except Exception as e:
+        app.logger.error(f"Internal server error: {str(e)}")
+        return make_response({"error": str(e)}, 500)
+
+
+@app.route('/backup_notes', methods=['POST'])
+@jwt_required()
+def backup_notes():
+    app.logger.info(f"Received batch note backup req from client: {request.remote_addr}")
+    current_user = get_jwt_identity()
+    app.logger.info(f"Current user: {current_user}")
+
+    try:
+        notes = parse_body(request)
+        validate_notes_batch(notes)
+
+        response = session.post(f"{BACKEND_URL}/users/{current_user}/backup_notes", data=request.get_data(),
+                                headers=body_headers(request), timeout=ROUTE_TIMEOUTS['backup_notes'])
+        app.logger.info(f"Sent {len(notes['notes'])} notes from {request.remote_addr} to backend")
+
+        validate_response(app, response)
+
+        app.logger.info(f"Batch backup processed")
+        return relay_response(response)
 
     except HTTPException as e:
         app.logger.error(f"HTTP error: {str(e)}")
@@ -161,19 +443,19 @@ def create_note():
     app.logger.info(f"Current user: {current_user}")
     
     try:
-        note = request.json
+        note = parse_body(request)
         headers = request.headers
         validate_note(note, headers)
         check_version(headers)
-        app.logger.info(f"note: {note}")
 
-        response = session.post(f"{BACKEND_URL}/users/{current_user}/create_note", json=note, timeout=SERVER_TIMEOUT, headers=headers)
+        response = session.post(f"{BACKEND_URL}/users/{current_user}/create_note", data=request.get_data(),
+                                timeout=ROUTE_TIMEOUTS['create_note'], headers=body_headers(request, 'version'))
         app.logger.info(f"Sent note from {request.remote_addr} to backend")
 
         validate_response(app, response)
 
         app.logger.info(f"Note created successfully")
-        return make_response(response.json(), response.status_code)
+        return relay_response(response)
 
     except HTTPException as e:
         app.logger.error(f"HTTP error: {str(e)}")
@@ -183,21 +465,24 @@ def create_note():
         app.logger.error(f"Internal server error: {str(e)}")
         return make_response({"error": str(e)}, 500)
 
+def init_backend_session(fe_cert: str, fe_key: str, be_cert: str, pool_size: int = BACKEND_POOL_SIZE):
+    global session
+    session = instrument_backend_session(create_backend_session(fe_cert, fe_key, be_cert, pool_size))
+
+def backend_transport_stats() -> dict:
+    if session is None:
+        return {}
+    adapter = session.get_adapter(BACKEND_URL)
+    return adapter.stats() if hasattr(adapter, 'stats') else {}
+
 if __name__ == "__main__":
-    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(message)s",
-        handlers=[
-            logging.FileHandler("frontend.log"),
-            logging.StreamHandler()
-        ]
-    )
+    setup_logging("frontend.log")
     app.logger.info("Starting frontend server")
     
     app.logger.info("Loading server certificates for tls")
     fe_cert, fe_key, be_cert = get_p12_data(P12_PATH, P12_PWD)
     ssl_context = (fe_cert, fe_key)
-    session = requests.Session()
-    session.cert = (fe_cert, fe_key)
-    session.verify = be_cert
+    init_backend_session(fe_cert, fe_key, be_cert)
     app.logger.info("Certificates loaded successfully")
     
     temp_files = [fe_cert, fe_key, be_cert]
@@ -206,3 +491,4 @@ if __name__ == "__main__":
         app.run(host=FE_HOST, port=FE_PORT, ssl_context=ssl_context)
     finally:
         delete_temp_files(temp_files)  # Cleanup certificates
+        stop_logging()
@@ -0,0 +1,130 @@
+"""
+Production serving mode for the frontend proxy.
+
+Runs app.py under gunicorn with FE_WORKERS preforked processes. Workers are
+threaded (FE_THREADS threads each) or, with FE_WORKER_CLASS=gevent, run an
+event loop holding up to FE_MAX_IN_FLIGHT requests each. Every worker opens
+its own pooled backend session. The TLS certificates are extracted once,
+shared by all workers and deleted when the master exits. Setting
+FE_CLIENT_CA to a CA file makes clients present a certificate issued by it.
+
+SIGTERM drains: workers stop accepting, finish their requests for up to
+FE_GRACEFUL_TIMEOUT seconds, then exit.
+
+    cd frontend && python serve.py
+"""
+import os
+import ssl
+import logging
+import multiprocessing
+from dotenv import load_dotenv
+from gunicorn import sock
+from gunicorn.app.base import BaseApplication
+from utils.tls import get_p12_data, delete_temp_files
+from common.logging_pipeline import setup_logging, stop_logging
+
+# Read here rather than imported from app.py, the master must not import the app before a gevent worker patches
+load_dotenv()
+FE_HOST = os.getenv("FE_HOST")
+FE_PORT = os.getenv("FE_PORT")
+P12_PATH = os.getenv("P12_PATH")
+P12_PWD = os.getenv("P12_PWD")
+FE_WORKERS = int(os.getenv("FE_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+FE_THREADS = int(os.getenv("FE_THREADS", 8))
+FE_WORKER_CLASS = os.getenv("FE_WORKER_CLASS", "gthread")  # gthread or gevent
+FE_MAX_IN_FLIGHT = int(os.getenv("FE_MAX_IN_FLIGHT", 1000))  # per gevent worker
+FE_TIMEOUT = int(os.getenv("FE_TIMEOUT", 120))  # seconds a worker may stay silent before it is restarted
+FE_GRACEFUL_TIMEOUT = int(os.getenv("FE_GRACEFUL_TIMEOUT", 30))  # seconds
+LOG_FILE = "frontend.log"
+FE_KEEPALIVE = int(os.getenv("FE_KEEPALIVE", 75))  # seconds an idle client connection is kept open
+FE_CLIENT_CA = os.getenv("FE_CLIENT_CA")
+
+class FrontendServer(BaseApplication):
+    def __init__(self, options: dict):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        from app import app
+        return app
+
+shared_ssl_context = None
+
+def ssl_context(config, default_ssl_context_factory):
+    """Reuse a single context, left to gunicorn each connection gets fresh session ticket keys and never resumes."""
+    global shared_ssl_context
+    if shared_ssl_context is None:
+        shared_ssl_context = default_ssl_context_factory()
+    return shared_ssl_context
+
+def when_ready(server):
+    # Built in the master, so the forked workers share its ticket keys. A gevent
+    # worker needs a context made after it patched ssl, so it builds its own.
+    if FE_WORKER_CLASS != "gevent":
+        sock.ssl_context(server.cfg)
+
+def post_fork(server, worker):
+    if FE_WORKER_CLASS != "gevent":
+        setup_logging(LOG_FILE)  # The log writer thread stayed in the master
+
+def worker_exit(server, worker):
+    stop_logging()
+
+def server_options(fe_cert: str, fe_key: str, be_cert: str) -> dict:
+    def post_worker_init(worker):
+        # After the gevent worker patched the standard library, and never shared across processes
+        if FE_WORKER_CLASS == "gevent":
+            setup_logging(LOG_FILE)
+
+        import app as frontend
+        frontend.init_backend_session(fe_cert, fe_key, be_cert)
+
+    options = {
+        "bind": f"{FE_HOST}:{FE_PORT}",
+        "workers": FE_WORKERS,
+        "worker_class": FE_WORKER_CLASS,
+        # The gevent worker has to patch the standard library before the app is imported
+        "preload_app": FE_WORKER_CLASS != "gevent",
+        "timeout": FE_TIMEOUT,
+        "graceful_timeout": FE_GRACEFUL_TIMEOUT,
+        "keepalive": FE_KEEPALIVE,
+        "certfile": fe_cert,
+        "keyfile": fe_key,
+        "ssl_context": ssl_context,
+        "when_ready": when_ready,
+        "post_fork": post_fork,
+        "worker_exit": worker_exit,
+        "post_worker_init": post_worker_init
+    }
+    if FE_WORKER_CLASS == "gevent":
+        options["worker_connections"] = FE_MAX_IN_FLIGHT
+    else:
+        options["threads"] = FE_THREADS
+
+    if FE_CLIENT_CA:
+        options["ca_certs"] = FE_CLIENT_CA
+        options["cert_reqs"] = ssl.CERT_REQUIRED
+    return options
+
+if __name__ == "__main__":
+    setup_logging(LOG_FILE)
+    logger = logging.getLogger("serve")
+    logger.info("Starting frontend server")
+
+    logger.info("Loading server certificates for tls")
+    fe_cert, fe_key, be_cert = get_p12_data(P12_PATH, P12_PWD)
+    logger.info("Certificates loaded successfully")
+
+    master_pid = os.getpid()
+    try:
+        logger.info(f"Serving with {FE_WORKERS} {FE_WORKER_CLASS} workers")
+        FrontendServer(server_options(fe_cert, fe_key, be_cert)).run()
+    finally:
+        # Exiting workers unwind through here too, but the certificates are only removed with the master
+        if os.getpid() == master_pid:
+            delete_temp_files([fe_cert, fe_key, be_cert])  # Cleanup certificates
+            stop_logging()
@@ -0,0 +1,51 @@
+"""
+Event-loop serving mode for the frontend proxy.
+
+Runs app.py on gevent's WSGI server with the standard library monkey patched,
+so every backend round trip made through the pooled requests session yields to
+the event loop instead of pinning an OS thread. A single process can then hold
+FE_MAX_IN_FLIGHT proxied requests at once, while the backend connection pool
+stays capped at BACKEND_POOL_SIZE.
+
+    python serve_async.py
+"""
+from gevent import monkey
+monkey.patch_all()
+
+import os
+from gevent.pool import Pool
+from gevent.pywsgi import WSGIServer
+from utils.tls import get_p12_data, delete_temp_files
+from common.logging_pipeline import setup_logging, stop_logging
+import app as frontend
+
+FE_MAX_IN_FLIGHT = int(os.getenv("FE_MAX_IN_FLIGHT", 5000))
+
+if __name__ == "__main__":
+    setup_logging("frontend.log")
+    logger = frontend.app.logger
+    logger.info("Starting frontend server in async mode")
+
+    logger.info("Loading server certificates for tls")
+    fe_cert, fe_key, be_cert = get_p12_data(frontend.P12_PATH, frontend.P12_PWD)
+    frontend.init_backend_session(fe_cert, fe_key, be_cert)
+    logger.info("Certificates loaded successfully")
+
+    temp_files = [fe_cert, fe_key, be_cert]
+
+    server = WSGIServer(
+        (frontend.FE_HOST, int(frontend.FE_PORT)),
+        frontend.app,
+        spawn=Pool(FE_MAX_IN_FLIGHT),
+        certfile=fe_cert,
+        keyfile=fe_key,
+        log=None,
+        error_log=logger
+    )
+
+    try:
+        logger.info(f"Serving up to {FE_MAX_IN_FLIGHT} concurrent requests, {frontend.BACKEND_POOL_SIZE} backend connections")
+        server.serve_forever()
+    finally:
+        delete_temp_files(temp_files)  # Cleanup certificates
+        stop_logging()
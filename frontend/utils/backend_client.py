@@ -0,0 +1,16 @@
+import requests
+from utils.transport import BackendAdapter, TransportStats, create_client_ssl_context
+
+def create_backend_session(cert: str, key: str, ca: str, pool_size: int) -> requests.Session:
+    """
+    mTLS session to the backend with a bounded, blocking connection pool.
+    When the pool is exhausted callers wait for a free connection instead of
+    opening new ones, so the backend never sees more than pool_size connections
+    from this process. Connections are kept alive and resume TLS sessions.
+    """
+    session = requests.Session()
+    ssl_context = create_client_ssl_context(cert, key, ca, TransportStats())
+
+    adapter = BackendAdapter(ssl_context, pool_connections=1, pool_maxsize=pool_size, pool_block=True, max_retries=0)
+    session.mount("https://", adapter)
+    return session
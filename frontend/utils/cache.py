@@ -0,0 +1,70 @@
+import threading
+from collections import OrderedDict, namedtuple
+
+CachedResponse = namedtuple('CachedResponse', ['body', 'content_type', 'etag', 'cache_control'])
+
+# Rough per-entry bookkeeping cost on top of the body itself
+ENTRY_OVERHEAD_BYTES = 256
+
+class NoteVersionCache:
+    """
+    In-process LRU cache of backend note version responses, bounded by total bytes.
+    Note versions are immutable, so entries never go stale. Keys include the username
+    and entries are only stored after the backend authorized that user, so a hit is
+    never served to someone the backend has not already let read the version.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def entry_size(entry: CachedResponse) -> int:
+        return len(entry.body) + ENTRY_OVERHEAD_BYTES
+
+    def get(self, key) -> CachedResponse:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, body: bytes, headers) -> bool:
+        entry = CachedResponse(body, headers.get('Content-Type'), headers.get('ETag'), headers.get('Cache-Control'))
+        size = self.entry_size(entry)
+        if size > self.max_bytes:
+            return False
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= self.entry_size(previous)
+
+            self._entries[key] = entry
+            self.current_bytes += size
+
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= self.entry_size(evicted)
+                self.evictions += 1
+        return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
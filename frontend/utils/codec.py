@@ -0,0 +1,36 @@
+try:
+    import msgpack
+except ImportError:  # msgpack is optional, JSON is always available
+    msgpack = None
+
+from flask import abort
+
+JSON_MIMETYPE = 'application/json'
+MSGPACK_MIMETYPE = 'application/msgpack'
+
+def negotiated_mimetype(request) -> str:
+    """Response format the backend will pick for this request's Accept header."""
+    return request.accept_mimetypes.best_match([JSON_MIMETYPE, MSGPACK_MIMETYPE]) or JSON_MIMETYPE
+
+def parse_body(request):
+    """Decode a JSON or MessagePack body for validation. The raw body is what gets forwarded."""
+    if request.mimetype == MSGPACK_MIMETYPE:
+        if msgpack is None:
+            abort(415, description="MessagePack bodies are not supported by this server")
+        try:
+            return msgpack.unpackb(request.get_data(), raw=False)
+        except ValueError:
+            abort(400, description="Invalid MessagePack body")
+
+    return request.get_json(silent=True)
+
+def body_headers(request, *forwarded) -> dict:
+    """Headers that let the backend decode the forwarded body and negotiate its response."""
+    headers = {
+        'Content-Type': request.content_type or JSON_MIMETYPE,
+        'Accept': negotiated_mimetype(request)
+    }
+    for name in forwarded:
+        if name in request.headers:
+            headers[name] = request.headers[name]
+    return headers
@@ -2,6 +2,10 @@ from flask import Flask, current_app, jsonify, request, abort, make_response
 
 
 def validate_response(app, response):
+    if response.status_code == 400:
+        app.logger.error(f"Invalid request")
+        abort(400, description=response.json().get('error', 'Invalid request'))
+
     if response.status_code == 401:
         app.logger.error(f"Note already exists in the database")
         abort(401, description=response.json().get('error', 'Note already exists in the database'))
@@ -0,0 +1,74 @@
+"""
+Request metrics of the frontend, served on /metrics. The metric types and the
+scrape token check live in common/metrics.py.
+
+Time spent waiting for the backend is measured apart from the frontend's own
+processing of each request.
+"""
+import time
+from flask import Response, g, has_request_context, make_response, request
+from common.metrics import PROMETHEUS_MIMETYPE, MetricsRegistry, scrape_allowed
+
+registry = MetricsRegistry("notist_frontend")
+
+request_duration = registry.histogram(
+    "http_request_duration_seconds", "Time spent serving a request, by route", ("endpoint", "method"))
+requests_total = registry.counter(
+    "http_requests_total", "Requests served, by route and status code", ("endpoint", "method", "status"))
+requests_in_flight = registry.gauge(
+    "http_requests_in_flight", "Requests being served right now, by route", ("endpoint",))
+processing_duration = registry.histogram(
+    "http_request_processing_seconds", "Time spent serving a request minus the backend round trips, by route",
+    ("endpoint", "method"))
+backend_duration = registry.histogram(
+    "backend_request_duration_seconds", "Backend round trip until the response headers arrived, by route",
+    ("endpoint", "method", "status"))
+
+def route_label() -> str:
+    return request.endpoint or "unmatched"
+
+def instrument_app(app):
+    """Time every request and add the /metrics route."""
+
+    @app.before_request
+    def start_request_timer():
+        g.metrics_started = time.perf_counter()
+        g.backend_seconds = 0.0
+        requests_in_flight.inc(endpoint=route_label())
+
+    @app.after_request
+    def record_status(response):
+        g.metrics_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def record_request(exc):
+        started = g.pop("metrics_started", None)
+        if started is None:
+            return
+        endpoint, method = route_label(), request.method
+        elapsed = time.perf_counter() - started
+        requests_in_flight.dec(endpoint=endpoint)
+        request_duration.observe(elapsed, endpoint=endpoint, method=method)
+        processing_duration.observe(max(elapsed - g.pop("backend_seconds", 0.0), 0.0), endpoint=endpoint, method=method)
+        requests_total.inc(endpoint=endpoint, method=method, status=g.pop("metrics_status", 500))
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        if not scrape_allowed(request.headers.get('Authorization')):
+            # Same answer with or without a token configured, the route does not exist for clients
+            return make_response({"error": "Not found"}, 404)
+        return Response(registry.render(), mimetype=PROMETHEUS_MIMETYPE)
+
+def instrument_backend_session(session):
+    """Time every backend round trip made through session, charged to the route that made it."""
+
+    def record_backend_response(response, *args, **kwargs):
+        elapsed = response.elapsed.total_seconds()
+        endpoint = route_label() if has_request_context() else "none"
+        backend_duration.observe(elapsed, endpoint=endpoint, method=response.request.method, status=response.status_code)
+        if has_request_context() and "backend_seconds" in g:
+            g.backend_seconds += elapsed
+
+    session.hooks['response'].append(record_backend_response)
+    return session
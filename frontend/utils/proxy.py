@@ -0,0 +1,52 @@
+from flask import Response, make_response
+from werkzeug.http import unquote_etag
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+CACHE_HEADERS = ('ETag', 'Cache-Control', 'Vary')
+STREAM_CHUNK_SIZE = None  # yield chunks as they arrive from the backend
+
+def is_streamed(response) -> bool:
+    return response.headers.get('Content-Type', '').startswith(NDJSON_MIMETYPE)
+
+def relay_stream(response):
+    """Relay a streamed backend response chunk by chunk, releasing the connection when done."""
+    try:
+        for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+            yield chunk
+    finally:
+        response.close()
+
+def relay_response(upstream):
+    """Pass the backend body through untouched, whatever format it was negotiated in."""
+    response = Response(upstream.content, upstream.status_code, content_type=upstream.headers.get('Content-Type'))
+    return copy_cache_headers(upstream, response)
+
+def copy_cache_headers(upstream, response):
+    for header in CACHE_HEADERS:
+        if header in upstream.headers:
+            response.headers[header] = upstream.headers[header]
+    return response
+
+def conditional_headers(headers) -> dict:
+    """Headers of a client request that make the backend answer 304 Not Modified."""
+    forwarded = {}
+    for header in ('If-None-Match', 'Accept'):
+        if header in headers:
+            forwarded[header] = headers[header]
+    return forwarded
+
+def relay_not_modified(upstream):
+    return copy_cache_headers(upstream, make_response("", 304))
+
+def cached_response(cached, request):
+    """Answer from a cached backend response, honouring the client's If-None-Match."""
+    if cached.etag is not None and request.if_none_match.contains(unquote_etag(cached.etag)[0]):
+        response = make_response("", 304)
+    else:
+        response = Response(cached.body, 200, content_type=cached.content_type)
+
+    if cached.etag is not None:
+        response.headers['ETag'] = cached.etag
+    if cached.cache_control is not None:
+        response.headers['Cache-Control'] = cached.cache_control
+    return response
@@ -0,0 +1,106 @@
+"""
+Frontend -> backend transport.
+
+Every pooled connection shares one SSLContext, built once from the
+get_p12_data files, instead of loading the certificates again on each connect.
+The context offers the last TLS session on new connections, so a connection
+opened to replace one the backend closed resumes the session (abbreviated
+handshake, no certificate exchange) instead of doing a full handshake.
+"""
+import ssl
+import threading
+from requests.adapters import HTTPAdapter
+
+class TransportStats:
+    """Counts of requests, connections opened and how their handshakes went."""
+
+    def __init__(self):
+        self.requests = 0
+        self.handshakes = 0
+        self.resumed_handshakes = 0
+        self._lock = threading.Lock()
+
+    def request_sent(self):
+        with self._lock:
+            self.requests += 1
+
+    def handshake_done(self, resumed: bool):
+        with self._lock:
+            self.handshakes += 1
+            if resumed:
+                self.resumed_handshakes += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "handshakes": self.handshakes,
+                "full_handshakes": self.handshakes - self.resumed_handshakes,
+                "resumed_handshakes": self.resumed_handshakes,
+                # Requests sent over an already open keep-alive connection
+                "reused_connections": max(self.requests - self.handshakes, 0)
+            }
+
+class ResumingSSLContext(ssl.SSLContext):
+    """Client context that offers the last TLS session of a host when connecting to it again."""
+
+    def __new__(cls, protocol, transport_stats: TransportStats):
+        return super().__new__(cls, protocol)
+
+    def __init__(self, protocol, transport_stats: TransportStats):
+        self.transport_stats = transport_stats
+        self._sessions = {}
+        self._sessions_lock = threading.Lock()
+
+    def wrap_socket(self, sock, server_side=False, do_handshake_on_connect=True,
+                    suppress_ragged_eofs=True, server_hostname=None, session=None):
+        if session is None:
+            with self._sessions_lock:
+                session = self._sessions.get(server_hostname)
+
+        tls_sock = super().wrap_socket(sock, server_side=server_side, do_handshake_on_connect=do_handshake_on_connect,
+                                       suppress_ragged_eofs=suppress_ragged_eofs,
+                                       server_hostname=server_hostname, session=session)
+        if do_handshake_on_connect:
+            self.transport_stats.handshake_done(tls_sock.session_reused)
+        return tls_sock
+
+    def remember_session(self, server_hostname: str, session: ssl.SSLSession):
+        with self._sessions_lock:
+            self._sessions[server_hostname] = session
+
+def create_client_ssl_context(cert: str, key: str, ca: str, transport_stats: TransportStats) -> ResumingSSLContext:
+    """mTLS client context from get_p12_data output: our certificate and key, trusting only the backend's CA."""
+    context = ResumingSSLContext(ssl.PROTOCOL_TLS_CLIENT, transport_stats)
+    context.load_cert_chain(certfile=cert, keyfile=key)
+    context.load_verify_locations(cafile=ca)
+    return context
+
+class BackendAdapter(HTTPAdapter):
+    """Pooled keep-alive adapter whose connections all use one ResumingSSLContext."""
+
+    def __init__(self, ssl_context: ResumingSSLContext, **kwargs):
+        self.ssl_context = ssl_context
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['ssl_context'] = self.ssl_context
+        super().init_poolmanager(*args, **kwargs)
+
+    def cert_verify(self, conn, url, verify, cert):
+        # The context already holds the CA and the client certificate, nothing to load per connection
+        pass
+
+    def send(self, request, **kwargs):
+        self.ssl_context.transport_stats.request_sent()
+        response = super().send(request, **kwargs)
+
+        # TLS 1.3 tickets only arrive after the handshake, so the session is taken once a response was read
+        connection = getattr(response.raw, 'connection', None)
+        tls_sock = getattr(connection, 'sock', None)
+        if isinstance(tls_sock, ssl.SSLSocket) and tls_sock.session is not None:
+            self.ssl_context.remember_session(tls_sock.server_hostname, tls_sock.session)
+        return response
+
+    def stats(self) -> dict:
+        return self.ssl_context.transport_stats.stats()
@@ -1,24 +1,28 @@
-from flask import abort, app
+from flask import abort, app, current_app
+
+# Ciphertext fields are base64 strings in JSON bodies and raw bytes in MessagePack bodies
+BINARY_TYPES = (str, bytes)
+BINARY_NOTE_FIELDS = ['iv', 'encrypted_note', 'note_tag', 'ciphered_note_key']
 
 def validate_fields(data, fields, data_type):
     return all(isinstance(data[field], data_type) for field in fields)
 
 def validate_note(note, headers):
     if not (isinstance(note, dict) or isinstance(headers, dict)):
-        print("Failed to validate note/headers type")
-        print(f"type note: {type(note)}, type headers: {type(headers)}")
+        current_app.logger.error(f"Failed to validate note/headers type: {type(note).__name__}, {type(headers).__name__}")
         abort(400, description="Invalid JSON")
 
-    required_note_str_fields = ['title', 'iv', 'encrypted_note', 'note_tag', 'ciphered_note_key']
+    required_note_str_fields = ['title']
     required_headers_str_fields = ['version']
 
-    if not (validate_fields(note, required_note_str_fields, str) or validate_fields(headers, required_headers_str_fields, str)):
-        print("Failed to validate note/headers field types")
+    if not (validate_fields(note, required_note_str_fields, str) and validate_fields(note, BINARY_NOTE_FIELDS, BINARY_TYPES)
+            or validate_fields(headers, required_headers_str_fields, str)):
+        current_app.logger.error("Failed to validate note/headers field types")
         abort(400, description="Invalid JSON")
 
 def check_version(headers):
     if headers['version'] != '1':
-        print("Create version must be 1")
+        current_app.logger.error("Create version must be 1")
         abort(400, description="Invalid JSON")
 
 
@@ -33,4 +37,43 @@ def validate_add_collaborator_req(req_data):
     required_dict_fields = ['note']
 
     if not validate_fields(req_data, required_str_fields, str) or not validate_fields(req_data, required_dict_fields, dict):
-        abort(400, description="Invalid JSON")
\ No newline at end of file
+        abort(400, description="Invalid JSON")
+
+def validate_add_collaborators_req(req_data):
+    if not isinstance(req_data, dict):
+        abort(400, description="Invalid JSON")
+
+    if not isinstance(req_data.get('note'), dict) or not isinstance(req_data.get('collaborators'), list):
+        abort(400, description="Invalid JSON")
+
+    required_entry_str_fields = ['collaborator', 'permission']
+
+    for entry in req_data['collaborators']:
+        if not isinstance(entry, dict) or not all(isinstance(entry.get(field), str) for field in required_entry_str_fields):
+            abort(400, description="Invalid JSON")
+
+        if not isinstance(entry.get('ciphered_note_key'), BINARY_TYPES):
+            abort(400, description="Invalid JSON")
+
+def validate_pub_keys_req(req_data):
+    if not isinstance(req_data, dict) or not isinstance(req_data.get('usernames'), list):
+        abort(400, description="Invalid JSON")
+
+    if not all(isinstance(username, str) for username in req_data['usernames']):
+        abort(400, description="Invalid JSON")
+
+def validate_notes_batch(req_data):
+    if not isinstance(req_data, dict) or not isinstance(req_data.get('notes'), list):
+        abort(400, description="Invalid JSON")
+
+    required_note_binary_fields = ['iv', 'encrypted_note', 'note_tag']
+
+    for note in req_data['notes']:
+        if not isinstance(note, dict) or not isinstance(note.get('title'), str):
+            abort(400, description="Invalid JSON")
+
+        if not all(isinstance(note.get(field), BINARY_TYPES) for field in required_note_binary_fields):
+            abort(400, description="Invalid JSON")
+
+        if not isinstance(note.get('version'), (int, str)) or not str(note['version']).isdigit():
+            abort(400, description="Invalid JSON")